@@ -0,0 +1,120 @@
+import json
+import os
+import numpy as np
+
+# single-file container for named numpy arrays: a magic string, the length of a
+# JSON header, the header itself, and then the raw array data, each array
+# starting on an ALIGN-byte boundary so that it can be memory-mapped in place.
+
+MAGIC = b'OSWNLPAF'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def save(filename, arrays, meta=None):
+    """
+    write a dict of numpy arrays and a JSON-serializable meta dict to filename.
+    the file is written to a temporary name first and renamed into place, so
+    readers never see a partially written file.
+
+    :param filename: name of the output file
+    :param arrays: dict mapping array names to numpy arrays
+    :param meta: (optional) dict of JSON-serializable metadata
+    """
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+    entries = {}
+    offset = 0
+    for name, arr in arrays.items():
+        entries[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        offset = _aligned(offset + arr.nbytes)
+    header = json.dumps({'version': FORMAT_VERSION,
+                         'meta': meta if meta is not None else {},
+                         'arrays': entries}).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp_filename = filename + '.tmp%d' % os.getpid()
+    with open(tmp_filename, 'wb') as fout:
+        fout.write(MAGIC)
+        fout.write(np.uint64(len(header)).tobytes())
+        fout.write(header)
+        for name, arr in arrays.items():
+            fout.seek(data_start + entries[name]['offset'])
+            fout.write(arr.tobytes())
+        fout.truncate(data_start + offset)
+    os.replace(tmp_filename, filename)
+
+def read_meta(filename):
+    """
+    read only the header of an array file
+
+    :param filename: name of the array file
+    :returns: the header dict, with keys 'version', 'meta' and 'arrays'
+    """
+    with open(filename, 'rb') as fin:
+        if fin.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not an array file" % filename)
+        header_len = int(np.frombuffer(fin.read(8), dtype=np.uint64)[0])
+        header = json.loads(fin.read(header_len).decode('utf-8'))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError("%s has unsupported format version %s" % (filename, header['version']))
+    header['data_start'] = _aligned(len(MAGIC) + 8 + header_len)
+    return header
+
+def load(filename, mmap=True):
+    """
+    load an array file written by save
+
+    :param filename: name of the array file
+    :param mmap: if True, arrays are read-only memory maps of the file, which are
+                 shared between all processes that load the same file
+    :returns: dict of arrays, meta dict
+    """
+    header = read_meta(filename)
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        offset = header['data_start'] + entry['offset']
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+        else:
+            with open(filename, 'rb') as fin:
+                fin.seek(offset)
+                arrays[name] = np.fromfile(fin, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return arrays, header['meta']
+
+def encode_strings(strings):
+    """
+    pack a list of strings into a utf-8 byte array and an offsets array
+
+    :param strings: list of strings
+    :returns: uint8 array of the concatenated strings, int64 array of len(strings)+1 offsets
+    """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def decode_strings(data, offsets):
+    """
+    inverse of encode_strings
+
+    :returns: list of strings
+    """
+    raw = bytes(data)
+    offsets = offsets.tolist()
+    return [raw[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+def source_signature(input_file):
+    """
+    size and modification time of a file, used to decide whether a file derived
+    from it is still fresh
+
+    :returns: dict with keys 'size' and 'mtime_ns'
+    """
+    st = os.stat(input_file)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
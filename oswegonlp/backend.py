@@ -0,0 +1,209 @@
+import sys
+import numpy as np
+
+# imported by the torch backend on first use, see _check
+torch = None
+
+# Array backends for the decoders in viterbi.py. Each backend implements the
+# handful of array operations the decoders need, so the same decoder code runs
+# on torch tensors or on plain float32 numpy arrays, with identical results:
+# both reduce with the first maximum, and sort stably.
+#
+# The backend of a call is, in order of precedence: the backend argument of
+# the call, the global backend set with set_backend, or the type of the
+# arrays passed in (torch tensors use torch, anything else numpy). torch is
+# only imported when the torch backend is first used, so numpy decoding does
+# not import or need torch. topk returns the largest values
+# in decreasing order, with ties in increasing order of index.
+
+class NumpyBackend(object):
+    name = 'numpy'
+
+    def array(self, x):
+        return np.asarray(x, dtype=np.float32)
+
+    def stack(self, xs, size):
+        if len(xs) == 0:
+            return np.zeros((0, size), dtype=np.float32)
+        return np.stack([np.asarray(x, dtype=np.float32).reshape(-1) for x in xs])
+
+    def index_array(self, x):
+        return np.asarray(x, dtype=np.int64).reshape(-1)
+
+    def full(self, shape, value):
+        return np.full(shape, value, dtype=np.float32)
+
+    def full_index(self, shape, value):
+        return np.full(shape, value, dtype=np.int64)
+
+    def empty_index(self, shape):
+        return np.empty(shape, dtype=np.int64)
+
+    def arange(self, n):
+        return np.arange(n)
+
+    def max(self, x, axis):
+        ixs = x.argmax(axis=axis)
+        return np.take_along_axis(x, np.expand_dims(ixs, axis), axis).squeeze(axis), ixs
+
+    def argmax(self, x, axis=None):
+        return x.argmax(axis=axis)
+
+    def logsumexp(self, x, axis):
+        shift = x.max(axis=axis, keepdims=True)
+        shift[~np.isfinite(shift)] = 0
+        with np.errstate(divide='ignore'):
+            return (np.log(np.exp(x - shift).sum(axis=axis, keepdims=True)) + shift).squeeze(axis)
+
+    def exp(self, x):
+        return np.exp(x)
+
+    def topk(self, x, k, axis):
+        x = np.moveaxis(x, axis, -1)
+        n = x.shape[-1]
+        k = min(k, n)
+        if k < n:
+            # the values above the k-th largest, and the first of the values equal to it; a partition is
+            # much faster than a stable sort of the whole axis
+            kth = -np.partition(-x, k - 1, axis=-1)[..., k - 1:k]
+            above = x > kth
+            ties = x == kth
+            num_ties = k - above.sum(axis=-1, keepdims=True)
+            if (ties.sum(axis=-1, keepdims=True) == num_ties).all():
+                selected = above | ties
+            else:
+                selected = above | (ties & (np.cumsum(ties, axis=-1, dtype=np.int32) <= num_ties))
+            ixs = (np.flatnonzero(selected) % n).reshape(x.shape[:-1] + (k,))
+        else:
+            ixs = np.broadcast_to(np.arange(n), x.shape)
+        values = np.take_along_axis(x, ixs, -1)
+        order = np.argsort(-values, axis=-1, kind='stable')
+        values = np.take_along_axis(values, order, -1)
+        ixs = np.take_along_axis(ixs, order, -1)
+        return np.moveaxis(values, -1, axis), np.moveaxis(ixs, -1, axis)
+
+    def where(self, cond, x, y):
+        return np.where(cond, x, y)
+
+    def nonzero(self, x):
+        return np.flatnonzero(x)
+
+    def sort(self, x):
+        return np.sort(x)
+
+    def sort_descending(self, x):
+        ixs = np.argsort(-x, kind='stable')
+        return x[ixs], ixs
+
+    def scatter_max(self, size, ixs, values, fill):
+        out = np.full(size, fill, dtype=values.dtype)
+        np.maximum.at(out, ixs, values)
+        return out
+
+    def scatter_min(self, size, ixs, values, fill):
+        out = np.full(size, fill, dtype=values.dtype)
+        np.minimum.at(out, ixs, values)
+        return out
+
+
+class TorchBackend(object):
+    name = 'torch'
+
+    def array(self, x):
+        return torch.as_tensor(x, dtype=torch.float32)
+
+    def stack(self, xs, size):
+        if len(xs) == 0:
+            return torch.zeros((0, size))
+        return torch.stack([torch.as_tensor(x, dtype=torch.float32).reshape(-1) for x in xs])
+
+    def index_array(self, x):
+        return torch.as_tensor(x, dtype=torch.long).view(-1)
+
+    def full(self, shape, value):
+        return torch.full(shape, value, dtype=torch.float32)
+
+    def full_index(self, shape, value):
+        return torch.full(shape, value, dtype=torch.long)
+
+    def empty_index(self, shape):
+        return torch.empty(shape, dtype=torch.long)
+
+    def arange(self, n):
+        return torch.arange(n)
+
+    def max(self, x, axis):
+        return x.max(dim=axis)
+
+    def argmax(self, x, axis=None):
+        return torch.argmax(x, dim=axis)
+
+    def logsumexp(self, x, axis):
+        return torch.logsumexp(x, dim=axis)
+
+    def exp(self, x):
+        return torch.exp(x)
+
+    def topk(self, x, k, axis):
+        values, ixs = torch.sort(x, dim=axis, descending=True, stable=True)
+        return values.narrow(axis, 0, min(k, x.shape[axis])), ixs.narrow(axis, 0, min(k, x.shape[axis]))
+
+    def where(self, cond, x, y):
+        return torch.where(cond, x, torch.as_tensor(y))
+
+    def nonzero(self, x):
+        return torch.nonzero(x).view(-1)
+
+    def sort(self, x):
+        return torch.sort(x)[0]
+
+    def sort_descending(self, x):
+        return torch.sort(x, descending=True, stable=True)
+
+    def scatter_max(self, size, ixs, values, fill):
+        return torch.full((size,), fill, dtype=values.dtype).scatter_reduce(0, ixs, values, 'amax')
+
+    def scatter_min(self, size, ixs, values, fill):
+        return torch.full((size,), fill, dtype=values.dtype).scatter_reduce(0, ixs, values, 'amin')
+
+
+BACKENDS = {'numpy': NumpyBackend()}
+
+_default_backend = None
+
+def set_backend(name):
+    """
+    set the backend of all decoding calls that do not pass one
+
+    :param name: 'numpy' or 'torch', or None to pick the backend from the type of the arrays of each call
+    """
+    global _default_backend
+    if name is not None:
+        _check(name)
+    _default_backend = name
+
+def get_backend(name=None, like=None):
+    """
+    :param name: (optional) 'numpy' or 'torch'
+    :param like: an array of the call, used when neither name nor a global backend is set
+    :returns: the backend object
+    """
+    if name is None:
+        name = _default_backend
+    if name is None:
+        # an array can only be a tensor if torch was imported already
+        loaded_torch = sys.modules.get('torch')
+        name = 'torch' if loaded_torch is not None and isinstance(like, loaded_torch.Tensor) else 'numpy'
+    return _check(name)
+
+def _check(name):
+    global torch
+    if name == 'torch' and name not in BACKENDS:
+        try:
+            import torch
+        except ImportError:
+            raise ImportError("the torch backend needs torch to be installed")
+        BACKENDS['torch'] = TorchBackend()
+    if name not in BACKENDS:
+        raise ValueError("unknown backend %s, expected one of %s" % (name, sorted(BACKENDS) + ['torch']))
+    return BACKENDS[name]
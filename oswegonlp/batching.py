@@ -0,0 +1,182 @@
+import multiprocessing
+import queue
+import threading
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+
+# Minibatches for bilstm.train_model. Sentences of similar length are batched
+# together to keep the padding small: each epoch, the sentences are shuffled,
+# cut into buckets of BUCKET_BATCHES batches, and sorted by length within each
+# bucket, and the batches of all the buckets are shuffled again. The order
+# depends only on the seed and the epoch, so runs are reproducible.
+#
+# Batches are gathered from a bilstm.TensorizedCorpus ahead of time, in a
+# background thread or in worker processes, so that preparing the next batch
+# overlaps with the forward and backward pass on the current one.
+#
+# For distributed training, every rank builds the same order of batches and
+# takes every num_replicas-th batch of it, starting at its rank.
+
+# number of batches per length bucket
+BUCKET_BATCHES = 50
+# number of batches prepared ahead of the one in use
+PREFETCH_BATCHES = 4
+
+class BucketBatchSampler(object):
+    """
+    yields lists of sentence indices, one per batch, grouped by length
+    """
+
+    def __init__(self, lengths, batch_size, seed=0, bucket_size=None, shuffle=True, rank=0, num_replicas=1):
+        """
+        :param lengths: array of the length of each sentence; empty sentences are left out
+        :param batch_size: maximum number of sentences per batch
+        :param seed: seed of the shuffling, combined with the epoch
+        :param bucket_size: (optional) number of sentences sorted by length together,
+                            defaults to BUCKET_BATCHES batches
+        :param shuffle: if False, the buckets are consecutive sentences, and the batches keep their order
+        :param rank: index of the shard of the batches to yield, from 0 to num_replicas - 1
+        :param num_replicas: number of shards; each yields the same number of batches
+        """
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.bucket_size = bucket_size if bucket_size is not None else batch_size * BUCKET_BATCHES
+        self.shuffle = shuffle
+        self.rank = rank
+        self.num_replicas = num_replicas
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """
+        set the epoch whose order the next iteration yields
+        """
+        self.epoch = epoch
+
+    def __iter__(self):
+        indices = np.flatnonzero(self.lengths > 0)
+        rng = np.random.RandomState([self.seed, self.epoch])
+        if self.shuffle:
+            indices = rng.permutation(indices)
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = indices[start:start + self.bucket_size]
+            bucket = bucket[np.argsort(self.lengths[bucket], kind='stable')]
+            batches += [bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size)]
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        if self.num_replicas > 1 and len(batches) > 0:
+            # the shards must be of the same size, or the ranks would wait for each other's gradients at the
+            # end of the epoch: the first batches are repeated to make up the difference
+            num_batches = -(-len(batches) // self.num_replicas) * self.num_replicas
+            batches = [batches[i % len(batches)] for i in range(self.rank, num_batches, self.num_replicas)]
+        for batch in batches:
+            yield batch.tolist()
+
+    def __len__(self):
+        num_sentences = int((self.lengths > 0).sum())
+        full_buckets, rest = divmod(num_sentences, self.bucket_size)
+        num_batches = full_buckets * -(-self.bucket_size // self.batch_size) + -(-rest // self.batch_size)
+        return -(-num_batches // self.num_replicas)
+
+
+class BatchDataset(Dataset):
+    """
+    a torch Dataset whose items are whole batches: indexing with a list of sentence indices
+    returns TensorizedCorpus.batch of those sentences
+    """
+
+    def __init__(self, corpus):
+        """
+        :param corpus: bilstm.TensorizedCorpus
+        """
+        self.corpus = corpus
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __getitem__(self, indices):
+        return self.corpus.batch(indices)
+
+
+class BatchLoader(object):
+    """
+    iterates over the padded batches of a corpus, as (words, tags, lengths), in the order of a BucketBatchSampler
+    """
+
+    def __init__(self, corpus, batch_size, seed=0, num_workers=0, prefetch=PREFETCH_BATCHES, bucket_size=None,
+                 shuffle=True, rank=0, num_replicas=1):
+        """
+        :param corpus: bilstm.TensorizedCorpus
+        :param batch_size, seed, bucket_size, shuffle, rank, num_replicas: as for BucketBatchSampler
+        :param num_workers: number of worker processes preparing batches; with 0, one background thread
+        :param prefetch: number of batches prepared ahead, in total
+        """
+        self.sampler = BucketBatchSampler(corpus.lengths, batch_size, seed, bucket_size, shuffle, rank, num_replicas)
+        self.dataset = BatchDataset(corpus)
+        self.prefetch = prefetch
+        self.loader = None
+        if num_workers > 0:
+            # fork lets the workers share the corpus tensors instead of pickling them, as in parallel_reader
+            methods = multiprocessing.get_all_start_methods()
+            # batch_size=None: the sampler yields whole batches, and the dataset gathers each at once.
+            # The loader draws the seeds of its workers from its own generator rather than from the global
+            # random state, which would otherwise depend on whether training was resumed from a checkpoint
+            self.loader = DataLoader(self.dataset, batch_size=None, sampler=self.sampler, num_workers=num_workers,
+                                     prefetch_factor=max(-(-prefetch // num_workers), 1), persistent_workers=True,
+                                     multiprocessing_context='fork' if 'fork' in methods else None,
+                                     generator=torch.Generator().manual_seed(seed))
+
+    def set_epoch(self, epoch):
+        self.sampler.set_epoch(epoch)
+
+    def __len__(self):
+        return len(self.sampler)
+
+    def __iter__(self):
+        if self.loader is not None:
+            return iter(self.loader)
+        return background((self.dataset[batch] for batch in self.sampler), self.prefetch)
+
+
+_DONE = object()
+
+def background(iterable, size):
+    """
+    iterate over iterable in a background thread, keeping up to size items ready
+
+    :returns: generator of the items of iterable; exceptions in the thread are raised in the caller
+    """
+    items = queue.Queue(maxsize=max(size, 1))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put((item, None), timeout=.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            items.put((_DONE, None))
+        except Exception as e:
+            items.put((_DONE, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        # the consumer stopped early: let the thread finish
+        stop.set()
+        thread.join()
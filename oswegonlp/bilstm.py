@@ -3,12 +3,20 @@ import torch
 from torch import nn
 import torch.nn.functional as F
 from torch.autograd import Variable
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
 import torch.optim as optim
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 from oswegonlp.constants import UNK, START_TAG, END_TAG
 import matplotlib .pyplot as plt
 from oswegonlp import viterbi
 import pickle
 from oswegonlp import evaluation
+from oswegonlp import batching
+from oswegonlp import checkpoint
+
+# number of sentences tagged at once by BiLSTM.predict_all
+INFERENCE_BATCH_SIZE = 256
 
 def to_scalar(var):
     # returns a python float
@@ -19,6 +27,97 @@ def prepare_sequence(seq, to_ix):
     tensor = torch.LongTensor(idxs)
     return Variable(tensor)
 
+class TensorizedCorpus(object):
+    """
+    A corpus encoded once against word_to_ix (and tag_to_ix), stored as one flat
+    LongTensor of word ids (and one of tag ids) plus sentence offsets.
+    Indexing returns zero-copy slices, like prepare_sequence would have built.
+    """
+
+    def __init__(self, X, word_to_ix, Y=None, tag_to_ix=None):
+        """
+        :param X: list of sentences, each a list of words
+        :param word_to_ix: dictionary that maps words to ids, with an entry for UNK
+        :param Y: (optional) list of tag sequences
+        :param tag_to_ix: (optional) dictionary that maps tags to ids, required if Y is given
+        """
+        self.lengths = np.array([len(x) for x in X], dtype=np.int64)
+        self.offsets = np.zeros(len(X) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.words = torch.from_numpy(encode_tokens([w for x in X for w in x], word_to_ix))
+        self.tags = None
+        if Y is not None:
+            self.tags = torch.from_numpy(encode_tokens([t for y in Y for t in y], tag_to_ix))
+
+    @classmethod
+    def from_compiled(cls, corpus, word_to_ix, tag_to_ix=None):
+        """
+        encode a corpus_cache.CompiledCorpus without decoding its tokens
+
+        :param corpus: CompiledCorpus
+        :param word_to_ix: dictionary that maps words to ids, with an entry for UNK
+        :param tag_to_ix: (optional) dictionary that maps tags to ids
+        """
+        self = cls([], word_to_ix)
+        self.offsets = np.asarray(corpus.offsets, dtype=np.int64)
+        self.lengths = np.diff(self.offsets)
+        word_map = encode_tokens(corpus.word_strings, word_to_ix)
+        self.words = torch.from_numpy(word_map[corpus.words])
+        if tag_to_ix is not None:
+            tag_map = encode_tokens(corpus.tag_strings, tag_to_ix)
+            self.tags = torch.from_numpy(tag_map[corpus.tags])
+        return self
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        """
+        :returns: the word ids of sentence i, and its tag ids if there are tags
+        """
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        if self.tags is None:
+            return self.words[start:end]
+        return self.words[start:end], self.tags[start:end]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def batch(self, indices):
+        """
+        the sentences at indices as one padded batch
+
+        :param indices: list of sentence indices
+        :returns: words, tags, lengths -- words and tags are LongTensors of size len(indices) x max length,
+                  padded with 0 after the end of each sentence (tags is None if there are no tags),
+                  and lengths is a LongTensor of the sentence lengths
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.lengths[indices]
+        max_len = int(lengths.max()) if len(lengths) else 0
+        positions = self.offsets[indices].reshape(-1, 1) + np.arange(max_len)
+        mask = np.arange(max_len) < lengths.reshape(-1, 1)
+        positions = torch.from_numpy(np.where(mask, positions, 0))
+        mask = torch.from_numpy(mask)
+        words = self.words[positions].masked_fill(~mask, 0)
+        tags = None
+        if self.tags is not None:
+            tags = self.tags[positions].masked_fill(~mask, 0)
+        return words, tags, torch.from_numpy(lengths)
+
+def encode_tokens(tokens, to_ix):
+    """
+    map a list of tokens to an int64 array of ids, with the UNK id for unknown tokens
+    each distinct token is looked up once and the mapping is applied as one array operation
+    """
+    token_ids = {}
+    type_ids = np.array([token_ids.setdefault(token, len(token_ids)) for token in tokens], dtype=np.int64)
+    type_map = np.array([to_ix[token] if token in to_ix else to_ix[UNK] for token in token_ids], dtype=np.int64)
+    if len(type_ids) == 0:
+        return type_ids
+    return type_map[type_ids]
+
 def argmax(vec):
     # return the argmax as a python int
     _, idx = torch.max(vec, 1)
@@ -70,28 +169,48 @@ class BiLSTM(nn.Module):
         
         self.hidden = self.init_hidden()
 
-    def init_hidden(self):
+    def init_hidden(self, batch_size=1, zeros=False):
         # axes semantics are: bidirectinal*num_of_layers, minibatch_size, hidden_dimension
+        if zeros:
+            # deterministic initial states, for inference
+            return (torch.zeros(2, batch_size, self.hidden_dim // 2),
+                    torch.zeros(2, batch_size, self.hidden_dim // 2))
         
-        return (Variable(torch.randn(2, 1, self.hidden_dim // 2)),
-                Variable(torch.randn(2, 1, self.hidden_dim // 2)))
+        return (Variable(torch.randn(2, batch_size, self.hidden_dim // 2)),
+                Variable(torch.randn(2, batch_size, self.hidden_dim // 2)))
     
-    def forward(self, sentence):
+    def forward(self, sentence, lengths=None):
         """
         The function obtain the scores for each tag for each of the words in a sentence
         Input:
-        sentence: a sequence of ids for each word in the sentence
+        sentence: a sequence of ids for each word in the sentence,
+                  or with lengths, a padded batch of sentences of size batch_size x max(lengths)
+                  as from TensorizedCorpus.batch
+        lengths: (optional) the length of each sentence of the batch, each at least 1
         Make sure to reshape the embeddings of the words before sending them to the BiLSTM. 
         The axes semantics are: seq_len, mini_batch, embedding_dim
         Output: 
-        returns lstm_feats: scores for each tag for each token in the sentence.
+        returns lstm_feats: scores for each tag for each token in the sentence,
+                            or of size batch_size x max(lengths) x tagset_size for a batch
         """
+        if lengths is not None:
+            return self._forward_batch(sentence, lengths)
         self.hidden = self.init_hidden()
         word_embeds = self.word_embeds(sentence)
         output, self.hidden = self.lstm.forward(word_embeds.view(len(sentence), 1, -1), self.hidden)
         tag = self.hidden2tag(output.view(len(sentence), -1))
         
         return tag
+
+    def _forward_batch(self, sentences, lengths, zero_state=False):
+        # the padding is packed away, so every sentence runs through the LSTM as if it were alone
+        self.hidden = self.init_hidden(len(lengths), zeros=zero_state)
+        word_embeds = self.word_embeds(sentences)
+        packed = pack_padded_sequence(word_embeds, torch.as_tensor(lengths, dtype=torch.long), batch_first=True,
+                                      enforce_sorted=False)
+        output, self.hidden = self.lstm.forward(packed, self.hidden)
+        output, _ = pad_packed_sequence(output, batch_first=True, total_length=sentences.size(1))
+        return self.hidden2tag(output)
         
     
     
@@ -112,10 +231,74 @@ class BiLSTM(nn.Module):
         tags = [self.ix_to_tag[ix] for ix in idx]
         return tags
 
+    def predict_batch(self, sentences, lengths):
+        """
+        predict the tags of a padded batch of sentences, without autograd and from zero initial states,
+        so that the predictions are deterministic, unlike those of predict.
+        The tag with the highest score is the one with the highest softmax probability, so there is no softmax.
+
+        :param sentences: padded batch of word ids, as from TensorizedCorpus.batch
+        :param lengths: the length of each sentence, each at least 1
+        :returns: list of the predicted tags of each sentence
+        """
+        with torch.inference_mode():
+            lstm_feats = self._forward_batch(sentences, lengths, zero_state=True)
+            tag_ixs = lstm_feats.argmax(dim=2).tolist()
+        return [[self.ix_to_tag[ix] for ix in ixs[:length]] for ixs, length in zip(tag_ixs, lengths.tolist())]
+
+    def predict_all(self, X, word_to_ix, batch_size=INFERENCE_BATCH_SIZE):
+        """
+        predict the tags of many sentences with predict_batch, in batches of sentences of similar length
+
+        :param X: list of sentences, each a list of words
+        :param word_to_ix: dictionary that maps words to ids, with an entry for UNK
+        :param batch_size: maximum number of sentences per batch
+        :returns: list of the predicted tags of each sentence, in the order of X
+        """
+        return self.predict_corpus(TensorizedCorpus(X, word_to_ix), batch_size)
+
+    def predict_corpus(self, corpus, batch_size=INFERENCE_BATCH_SIZE):
+        """
+        predict_all on sentences already encoded as a TensorizedCorpus
+
+        :returns: list of the predicted tags of each sentence, in the order of the corpus
+        """
+        all_tags = [[] for _ in range(len(corpus))]
+        sampler = batching.BucketBatchSampler(corpus.lengths, batch_size, bucket_size=max(len(corpus), 1),
+                                              shuffle=False)
+        for indices in sampler:
+            words, _, lengths = corpus.batch(indices)
+            for i, tags in zip(indices, self.predict_batch(words, lengths)):
+                all_tags[i] = tags
+        return all_tags
+
 
 def train_model(loss, model, X_tr,Y_tr, word_to_ix, tag_to_ix, X_dv=None, Y_dv = None, num_its=50, status_frequency=10,
                optim_args = {'lr':0.1,'momentum':0},
-               param_file = 'best.params'):
+               param_file = 'best.params', batch_size=1, seed=0, num_workers=0, distributed=False,
+               checkpoint_dir=None, keep_checkpoints=checkpoint.KEEP_LAST, resume=False):
+    """
+    :param batch_size: number of sentences per optimizer step. With batch_size > 1, the sentences run through
+                       the model as padded batches, and loss is applied to the scores of the tokens of all the
+                       sentences of a batch at once, leaving out the padding. losses are then per batch.
+    :param seed: with batch_size > 1, seed of the order of the batches, which are of sentences of similar
+                 length and reshuffled each epoch; see batching.BucketBatchSampler
+    :param num_workers: with batch_size > 1, number of processes preparing batches; with 0, a background thread
+    :param distributed: train as one rank of the current torch.distributed process group (see distributed.py).
+                        Each rank takes its share of the batches, of batch_size sentences each, and the gradients
+                        are averaged over the ranks at each step. losses are averaged over all the ranks, but only
+                        rank 0 evaluates on the dev data and writes param_file; the other ranks return no accuracies.
+    :param checkpoint_dir: (optional) directory where a checkpoint of the whole state of training is written
+                           after each epoch, in the background; see checkpoint.py. param_file is written in the
+                           background too, whether or not there is a checkpoint_dir.
+    :param keep_checkpoints: number of most recent checkpoints kept in checkpoint_dir, besides the best one
+    :param resume: if True, continue from the latest checkpoint in checkpoint_dir, if there is one, as if the run
+                   that wrote it had not stopped; num_its counts the epochs done before the checkpoint too.
+                   The run must have as many ranks as the one that wrote the checkpoint.
+                   The model passed in gets the parameters of the checkpoint.
+    """
+    if resume and checkpoint_dir is None:
+        raise ValueError("resume needs a checkpoint_dir")
     
     #initialize optimizer
     optimizer = optim.SGD(model.parameters(), **optim_args)
@@ -123,58 +306,124 @@ def train_model(loss, model, X_tr,Y_tr, word_to_ix, tag_to_ix, X_dv=None, Y_dv =
     losses=[]
     accuracies=[]
     
-    for epoch in range(num_its):
+    rank, num_replicas = 0, 1
+    if distributed:
+        rank, num_replicas = dist.get_rank(), dist.get_world_size()
+    
+    start_epoch = 0
+    rng_state = None
+    if resume:
+        # every rank loads the checkpoint, for the optimizer state and its random state
+        state = checkpoint.CheckpointManager(checkpoint_dir).load_latest()
+        if state is not None and len(state['rng_state']) != num_replicas:
+            # the batches of each rank, and the random state of each, depend on the number of ranks
+            raise ValueError("cannot resume with %d ranks from a checkpoint written with %d ranks"
+                             % (num_replicas, len(state['rng_state'])))
+        if state is not None:
+            model.load_state_dict(state['state_dict'])
+            optimizer.load_state_dict(state['optimizer'])
+            losses, accuracies = state['losses'], state['accuracies']
+            start_epoch = state['epoch']
+            rng_state = state['rng_state'][rank]
+    
+    net = model
+    if distributed:
+        # copies the parameters of rank 0 to the other ranks, and all-reduces the gradients in backward
+        net = DistributedDataParallel(model)
+    
+    # encode the data once, rather than once per sentence per epoch
+    train_data = TensorizedCorpus(X_tr, word_to_ix, Y_tr, tag_to_ix)
+    evaluate = X_dv is not None and Y_dv is not None and rank == 0
+    if evaluate:
+        dev_data = TensorizedCorpus(X_dv, word_to_ix, Y_dv, tag_to_ix)
+    batched = batch_size > 1 or distributed
+    if batched:
+        train_batches = batching.BatchLoader(train_data, batch_size, seed=seed, num_workers=num_workers,
+                                             rank=rank, num_replicas=num_replicas)
+    
+    if rng_state is not None:
+        checkpoint.set_rng_state(rng_state)
+    checkpoints = checkpoint.CheckpointManager(checkpoint_dir if rank == 0 else None, keep_checkpoints)
+    try:
+        for epoch in range(start_epoch, num_its):
         
-        loss_value=0
-        count1=0
+            loss_value=0
+            count1=0
         
-        for X,Y in zip(X_tr,Y_tr):
-            X_tr_var = prepare_sequence(X, word_to_ix)
-            Y_tr_var = prepare_sequence(Y, tag_to_ix)
-            
-            # set gradient to zero
-            optimizer.zero_grad()
-            
-            lstm_feats= model.forward(X_tr_var)
-            output = loss(lstm_feats,Y_tr_var)
+            if batched:
+                train_batches.set_epoch(epoch)
+                for words, tags, lengths in train_batches:
+                    optimizer.zero_grad()
+
+                    lstm_feats = net(words, lengths)
+                    mask = torch.arange(words.size(1)).view(1, -1) < lengths.view(-1, 1)
+                    output = loss(lstm_feats[mask], tags[mask])
+
+                    output.backward()
+                    optimizer.step()
+                    loss_value += output.item()
+                    count1 += 1
+            else:
+                for X_tr_var, Y_tr_var in train_data:
+                    # set gradient to zero
+                    optimizer.zero_grad()
+
+                    lstm_feats= model.forward(X_tr_var)
+                    output = loss(lstm_feats,Y_tr_var)
+
+                    output.backward()
+                    optimizer.step()
+                    loss_value += output.item()
+                    count1+=1
             
-            output.backward()
-            optimizer.step()
-            loss_value += output.item()
-            count1+=1
             
+            if distributed:
+                totals = torch.tensor([loss_value, count1], dtype=torch.float64)
+                dist.all_reduce(totals)
+                loss_value, count1 = totals.tolist()
+            losses.append(loss_value/count1)
+        
+            acc=0        
+            best=False
+            if evaluate:
+                # tag the dev data in batches, without autograd, and from zero initial states, which leaves
+                # the random state of training alone
+                Y_hat = model.predict_corpus(dev_data)
+                Yhat = np.array([tag_to_ix[yhat] for y_hat in Y_hat for yhat in y_hat])
             
-        losses.append(loss_value/count1)
+                # compute dev accuracy, over all the tokens
+                acc = evaluation.acc(Yhat, dev_data.tags.numpy())
+                best = len(accuracies) == 0 or acc > max(accuracies)
+                accuracies.append(acc)
         
-        # write parameters if this is the best epoch yet
-        acc=0        
-        if X_dv is not None and Y_dv is not None:
-            acc=0
-            count2=0
-            for Xdv, Ydv in zip(X_dv, Y_dv):
-                
-                X_dv_var = prepare_sequence(Xdv, word_to_ix)
-                Y_dv_var = prepare_sequence(Ydv, tag_to_ix)
-                # run forward on dev data
-                Y_hat = model.predict(X_dv_var)
-                
-                Yhat = np.array([tag_to_ix[yhat] for yhat in Y_hat])
-                Ydv = np.array([tag_to_ix[ydv] for ydv in Ydv])
-                
-                # compute dev accuracy
-                acc += (evaluation.acc(Yhat,Ydv))*len(Xdv)
-                count2 += len(Xdv)
-                # save
-            acc/=count2
-            if len(accuracies) == 0 or acc > max(accuracies):
-                state = {'state_dict':model.state_dict(),
-                         'epoch':len(accuracies)+1,
-                         'accuracy':acc}
-                torch.save(state,param_file)
-            accuracies.append(acc)
-        # print status message if desired
-        if status_frequency > 0 and epoch % status_frequency == 0:
-            print("Epoch "+str(epoch+1)+": Dev Accuracy: "+str(acc))
+            # write a checkpoint, and the parameters if this is the best epoch yet
+            if checkpoint_dir is not None:
+                rng_states = [checkpoint.rng_state()]
+                if distributed:
+                    rng_states = [None] * num_replicas
+                    dist.all_gather_object(rng_states, checkpoint.rng_state())
+            if rank == 0 and (best or checkpoint_dir is not None):
+                state_dict = model.state_dict()
+                extra_files = {}
+                if best:
+                    extra_files[param_file] = {'state_dict':state_dict,
+                                               'epoch':len(accuracies),
+                                               'accuracy':acc}
+                state = None
+                if checkpoint_dir is not None:
+                    state = {'state_dict':state_dict,
+                             'optimizer':optimizer.state_dict(),
+                             'epoch':epoch+1,
+                             'losses':losses,
+                             'accuracies':accuracies,
+                             'rng_state':rng_states}
+                checkpoints.save(state, best=best, extra_files=extra_files)
+            # print status message if desired
+            if status_frequency > 0 and epoch % status_frequency == 0 and rank == 0:
+                print("Epoch "+str(epoch+1)+": Dev Accuracy: "+str(acc))
+    finally:
+        # waits for the last writes, and stops the writer thread, also when training fails
+        checkpoints.close()
     return model, losses, accuracies
             
     
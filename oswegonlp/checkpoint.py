@@ -0,0 +1,138 @@
+import copy
+import os
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+
+# Training checkpoints for bilstm.train_model. A checkpoint is a dict with the
+# state of a run after an epoch: the model and optimizer state_dicts, the
+# number of epochs done, the losses and accuracies so far, and the state of the
+# random number generators, so that a resumed run continues exactly as the
+# interrupted one would have.
+#
+# save() copies the state on the calling thread, which is quick, and writes it
+# on a background thread while training goes on. Each file is written to a
+# temporary name and renamed into place, so a run killed in the middle of a
+# write leaves the previous checkpoints intact. The directory keeps the last
+# keep_last checkpoints, as checkpoint-<epoch>.pt, and the best one, as best.pt.
+
+CHECKPOINT_PATTERN = re.compile(r'^checkpoint-(\d+)\.pt$')
+BEST_CHECKPOINT = 'best.pt'
+KEEP_LAST = 3
+
+class CheckpointManager(object):
+    """
+    writes checkpoints in the background and finds the latest one to resume from
+    """
+
+    def __init__(self, directory=None, keep_last=KEEP_LAST):
+        """
+        :param directory: (optional) directory of the checkpoints, created if needed; without it,
+                          only the files passed to save as extra files are written
+        :param keep_last: number of most recent checkpoints kept
+        """
+        self.directory = directory
+        self.keep_last = keep_last
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        # one thread, so that the writes happen in order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def save(self, checkpoint=None, best=False, extra_files=None):
+        """
+        snapshot checkpoint and write it in the background
+
+        :param checkpoint: (optional) checkpoint dict, with the number of epochs done as 'epoch'
+        :param best: if True, the checkpoint is also written as the best one
+        :param extra_files: (optional) dict mapping file names to more dicts to write, such as
+                            the best parameters in the format of train_model's param_file
+        """
+        snapshot = _snapshot((checkpoint, extra_files or {}))
+        # at most one snapshot waits in memory, and errors of the previous write surface here
+        self.wait()
+        self.pending = self.executor.submit(self._write, snapshot[0], best, snapshot[1])
+
+    def _write(self, checkpoint, best, extra_files):
+        if checkpoint is not None and self.directory is not None:
+            atomic_save(checkpoint, os.path.join(self.directory, 'checkpoint-%04d.pt' % checkpoint['epoch']))
+            if best:
+                atomic_save(checkpoint, os.path.join(self.directory, BEST_CHECKPOINT))
+            epochs = self.epochs()
+            for epoch in epochs[:max(len(epochs) - self.keep_last, 0)]:
+                os.remove(os.path.join(self.directory, 'checkpoint-%04d.pt' % epoch))
+        for filename, data in extra_files.items():
+            atomic_save(data, filename)
+
+    def wait(self):
+        """
+        wait until the checkpoints saved so far are written
+        """
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+
+    def epochs(self):
+        """
+        :returns: sorted list of the epochs of the checkpoints in the directory
+        """
+        if self.directory is None or not os.path.isdir(self.directory):
+            return []
+        matches = [CHECKPOINT_PATTERN.match(name) for name in os.listdir(self.directory)]
+        return sorted(int(match.group(1)) for match in matches if match is not None)
+
+    def latest(self):
+        """
+        :returns: the name of the file of the latest checkpoint, or None if there is none
+        """
+        epochs = self.epochs()
+        if len(epochs) == 0:
+            return None
+        return os.path.join(self.directory, 'checkpoint-%04d.pt' % epochs[-1])
+
+    def load_latest(self):
+        """
+        :returns: the latest checkpoint, or None if there is none
+        """
+        filename = self.latest()
+        if filename is None:
+            return None
+        # checkpoints hold numpy random states, which the weights_only loader rejects
+        return torch.load(filename, weights_only=False)
+
+
+def atomic_save(data, filename):
+    """
+    torch.save data to filename, through a temporary file renamed into place, so that
+    readers never see a partially written file
+    """
+    tmp_filename = filename + '.tmp%d' % os.getpid()
+    with open(tmp_filename, 'wb') as fout:
+        torch.save(data, fout)
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp_filename, filename)
+
+def rng_state():
+    """
+    :returns: the states of the python, numpy and torch random number generators
+    """
+    return {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+
+def set_rng_state(state):
+    """
+    restore the random number generators to a state from rng_state
+    """
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+
+def _snapshot(data):
+    # the tensors of state_dicts are the live parameters, which the next optimizer step changes
+    return copy.deepcopy(data)
@@ -1,5 +1,7 @@
 from oswegonlp.constants import OFFSET
+from oswegonlp.weight_table import WeightTable
 import numpy as np
+import scipy.sparse as sp
 import operator
 
 # use this to find the highest-scoring label
@@ -32,6 +34,12 @@ def compute_score(x,y,weights):
     return total
 
 def compute_scores(x,labels,weights):
+    if isinstance(weights, WeightTable):
+        # all labels in one lookup of the base features, rather than one per (label, feature)
+        base_features = {OFFSET: 1}
+        base_features.update(x)
+        labels = list(labels)
+        return dict(zip(labels, weights.score(base_features, labels).tolist()))
     scores = {}
     for l in labels:
         scores[l] = compute_score(x,l,weights)
@@ -42,7 +50,7 @@ def predict(x,weights,labels):
     """prediction function
 
     :param base_features: a dictionary of base features and counts
-    :param weights: a defaultdict of features and weights. features are tuples (label,base_feature).
+    :param weights: a WeightTable or defaultdict of features and weights. features are tuples (label,base_feature).
     :param labels: a list of candidate labels
     :returns: top scoring label, scores of all labels
     :rtype: string, dict
@@ -51,3 +59,64 @@ def predict(x,weights,labels):
     scores = compute_scores(x, labels, weights)
     return argmax(scores),scores
     #raise NotImplementedError
+
+
+def predict_all(xs,weights,labels,batch_size=10000):
+    """batch prediction function: the same predictions as predict, from one matrix product per batch
+
+    :param xs: list of dictionaries of base features and counts
+    :param weights: a WeightTable or defaultdict of features and weights. features are tuples (label,base_feature).
+    :param labels: a list of candidate labels
+    :param batch_size: number of instances scored per matrix product
+    :returns: top scoring label of each instance, len(xs) x len(labels) matrix of scores, with the labels sorted
+    :rtype: list, numpy.ndarray
+
+    """
+    if not isinstance(weights, WeightTable):
+        weights = WeightTable.from_dict(weights, dtype=np.float64)
+    # argmax sorts the labels and takes the first maximum, so score the labels in sorted order
+    labels = sorted(labels)
+    scores = np.empty((len(xs), len(labels)))
+    for start in range(0, len(xs), batch_size):
+        X, _ = make_design_matrix(xs[start:start + batch_size], weights.feature_to_ix, offset=True)
+        scores[start:start + batch_size] = weights.score_matrix(X, labels)
+    y_hat = [labels[ix] for ix in scores.argmax(axis=1).tolist()] if len(labels) > 0 else [None] * len(xs)
+    return y_hat, scores
+
+
+def make_design_matrix(x, feature_to_ix=None, offset=False):
+    """turn a list of base-feature counters into a sparse matrix
+
+    :param x: list of counters of base features, one per instance
+    :param feature_to_ix: (optional) dict mapping features to columns; features not in it are dropped.
+                          if None, every feature gets a column, in order of first appearance
+    :param offset: if True, add the OFFSET feature with count 1 to each instance, as make_feature_vector does
+    :returns: csr matrix of size len(x) x len(feature_to_ix), feature_to_ix
+    :rtype: scipy.sparse.csr_matrix, dict
+
+    """
+    grow = feature_to_ix is None
+    if grow:
+        feature_to_ix = {}
+    if offset and OFFSET not in feature_to_ix and grow:
+        feature_to_ix[OFFSET] = 0
+    offset_ix = feature_to_ix.get(OFFSET) if offset else None
+    indptr = [0]
+    indices = []
+    data = []
+    for x_i in x:
+        if offset_ix is not None and OFFSET not in x_i:
+            indices.append(offset_ix)
+            data.append(1)
+        for feature, count in x_i.items():
+            ix = feature_to_ix.get(feature)
+            if ix is None:
+                if not grow:
+                    continue
+                ix = feature_to_ix[feature] = len(feature_to_ix)
+            indices.append(ix)
+            data.append(count)
+        indptr.append(len(indices))
+    X = sp.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                      shape=(len(x), len(feature_to_ix)))
+    return X, feature_to_ix
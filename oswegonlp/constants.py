@@ -11,6 +11,9 @@ NR_DEV_FILE = 'data/no_bokmaal-ud-dev.conllu'
 NR_TEST_FILE_UNLABELED = 'data/no_bokmaal-ud-test-hidden.conllu'
 NR_TEST_FILE = 'data/no_bokmaal-ud-test.conllu' 
 
+# names of the ten columns of a conll-u token line
+CONLL_COLUMNS = ('ID', 'FORM', 'LEMMA', 'UPOS', 'XPOS', 'FEATS', 'HEAD', 'DEPREL', 'DEPS', 'MISC')
+
 OFFSET = '**OFFSET**'
 
 START_TAG = '--START--'
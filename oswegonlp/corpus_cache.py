@@ -0,0 +1,130 @@
+import os
+from oswegonlp import arrayfile, preprocessing
+
+# A compiled corpus stores a conll file as interned integer ids:
+#   words, tags -- one int32 id per token, in file order
+#   offsets     -- int64 array of len(sentences)+1 token offsets
+#   the word and tag string tables, packed by arrayfile.encode_strings
+# The arrays are memory-mapped on load, so reading a compiled corpus costs
+# almost nothing and the pages are shared between processes.
+
+CACHE_SUFFIX = '.corpus'
+
+def cache_filename(input_file):
+    return input_file + CACHE_SUFFIX
+
+def compile_corpus(input_file, cache_file=None):
+    """
+    parse a conll file once and write its compiled form next to it
+
+    :param input_file: name of the conll file
+    :param cache_file: (optional) name of the compiled file, defaults to input_file + CACHE_SUFFIX
+    :returns: the CompiledCorpus, loaded from the written file
+    """
+    if cache_file is None:
+        cache_file = cache_filename(input_file)
+    signature = arrayfile.source_signature(input_file)
+
+    offsets, column_data = preprocessing.load_columns(input_file, ('FORM', 'UPOS'))
+    words, word_strings = column_data['FORM']
+    tags, tag_strings = column_data['UPOS']
+    word_data, word_offsets = arrayfile.encode_strings(word_strings)
+    tag_data, tag_offsets = arrayfile.encode_strings(tag_strings)
+    arrayfile.save(cache_file,
+                   {'words': words, 'tags': tags, 'offsets': offsets,
+                    'word_data': word_data, 'word_offsets': word_offsets,
+                    'tag_data': tag_data, 'tag_offsets': tag_offsets},
+                   meta={'kind': 'corpus', 'source': signature})
+    return CompiledCorpus(cache_file)
+
+def is_fresh(input_file, cache_file=None):
+    """
+    check whether the compiled form of input_file exists and matches the size
+    and modification time of input_file
+    """
+    if cache_file is None:
+        cache_file = cache_filename(input_file)
+    if not os.path.exists(cache_file) or not os.path.exists(input_file):
+        return False
+    try:
+        meta = arrayfile.read_meta(cache_file)['meta']
+    except ValueError:
+        return False
+    return meta.get('kind') == 'corpus' and meta.get('source') == arrayfile.source_signature(input_file)
+
+def load_corpus(input_file, cache_file=None):
+    """
+    :returns: the CompiledCorpus for input_file, or None if there is no fresh compiled form
+    """
+    if cache_file is None:
+        cache_file = cache_filename(input_file)
+    if not is_fresh(input_file, cache_file):
+        return None
+    return CompiledCorpus(cache_file)
+
+def id_seq_generator(input_file, max_insts=1000000):
+    """
+    Create a generator of (word_ids, tag_ids) array pairs over a conll file,
+    compiling it first if there is no fresh compiled form.
+    The ids index into CompiledCorpus.word_strings and CompiledCorpus.tag_strings.
+    """
+    corpus = load_corpus(input_file)
+    if corpus is None:
+        corpus = compile_corpus(input_file)
+    return corpus.id_seq_generator(max_insts)
+
+
+class CompiledCorpus(object):
+    """
+    read-only view of a compiled corpus file
+    """
+
+    def __init__(self, cache_file):
+        arrays, self.meta = arrayfile.load(cache_file)
+        self.words = arrays['words']
+        self.tags = arrays['tags']
+        self.offsets = arrays['offsets']
+        self._string_arrays = arrays
+        self._word_strings = None
+        self._tag_strings = None
+
+    @property
+    def word_strings(self):
+        if self._word_strings is None:
+            self._word_strings = arrayfile.decode_strings(self._string_arrays['word_data'],
+                                                          self._string_arrays['word_offsets'])
+        return self._word_strings
+
+    @property
+    def tag_strings(self):
+        if self._tag_strings is None:
+            self._tag_strings = arrayfile.decode_strings(self._string_arrays['tag_data'],
+                                                         self._string_arrays['tag_offsets'])
+        return self._tag_strings
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sentence_ids(self, i):
+        """
+        :returns: word_ids, tag_ids -- array views of sentence i
+        """
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.words[start:end], self.tags[start:end]
+
+    def sentence(self, i):
+        """
+        :returns: words, tags -- lists of strings for sentence i
+        """
+        word_ids, tag_ids = self.sentence_ids(i)
+        word_strings = self.word_strings
+        tag_strings = self.tag_strings
+        return [word_strings[w] for w in word_ids.tolist()], [tag_strings[t] for t in tag_ids.tolist()]
+
+    def id_seq_generator(self, max_insts=1000000):
+        for i in range(min(len(self), max_insts)):
+            yield self.sentence_ids(i)
+
+    def seq_generator(self, max_insts=1000000):
+        for i in range(min(len(self), max_insts)):
+            yield self.sentence(i)
@@ -0,0 +1,461 @@
+import copy
+import os
+from array import array
+from collections import defaultdict, Counter
+import numpy as np
+from oswegonlp import preprocessing, corpus_cache, arrayfile
+from oswegonlp.weight_table import WeightTable
+from oswegonlp.constants import START_TAG, END_TAG, UNK, OFFSET
+
+class CorpusStats(object):
+    """
+    Word, tag and tag transition counts of a corpus, collected in a single pass.
+
+    words and tags are interned in order of first appearance:
+    - word_tag_counts: int64 matrix of size len(words) x len(tags)
+    - trans_counts: int64 matrix of size len(tags)+1 x len(tags)+1, where rows are the
+      previous tag and columns the next tag; the extra row is START_TAG and the
+      extra column is END_TAG
+    word_tag_first and trans_first hold the position at which each count was first
+    seen, so that the counters built from the matrices keep the insertion order
+    (and thus the most_common tie order) of counters filled token by token.
+    """
+
+    def __init__(self):
+        self.words = []
+        self.word_to_id = {}
+        self.tags = []
+        self.tag_to_id = {}
+        self.word_tag_counts = np.zeros((0, 0), dtype=np.int64)
+        self.trans_counts = np.zeros((1, 1), dtype=np.int64)
+        self.word_tag_first = np.full((0, 0), NOT_SEEN, dtype=np.int64)
+        self.trans_first = np.full((1, 1), NOT_SEEN, dtype=np.int64)
+        self.num_sentences = 0
+        self.num_tokens = 0
+        # smoothed log-probabilities derived from the counts, see _derived
+        self._derived_cache = {}
+
+    @classmethod
+    def from_file(cls, input_file, max_insts=1000000):
+        """
+        :param input_file: name of a conll file; its compiled form is used if it is fresh
+        :param max_insts: (optional) maximum number of sentences to count
+        """
+        stats = cls()
+        corpus = corpus_cache.load_corpus(input_file)
+        if corpus is not None:
+            stats.add_compiled(corpus, max_insts)
+        else:
+            stats.add_sentences(preprocessing.conll_seq_generator(input_file, max_insts, use_cache=False))
+        return stats
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        """
+        :param sentences: iterable of (words, tags) pairs
+        """
+        stats = cls()
+        stats.add_sentences(sentences)
+        return stats
+
+    def _intern(self, items, item_to_id, strings):
+        ids = array('l')
+        for item in items:
+            ix = item_to_id.get(item)
+            if ix is None:
+                ix = item_to_id[item] = len(strings)
+                strings.append(item)
+            ids.append(ix)
+        return ids
+
+    def add_sentences(self, sentences):
+        """
+        add the counts of an iterable of (words, tags) pairs; empty sentences are skipped
+        """
+        word_ids = array('l')
+        tag_ids = array('l')
+        offsets = array('l', [0])
+        for words, tags in sentences:
+            if len(words) == 0:
+                continue
+            word_ids.extend(self._intern(words, self.word_to_id, self.words))
+            tag_ids.extend(self._intern(tags, self.tag_to_id, self.tags))
+            offsets.append(len(word_ids))
+        self._add_ids(np.frombuffer(word_ids, dtype=np.int_),
+                      np.frombuffer(tag_ids, dtype=np.int_),
+                      np.frombuffer(offsets, dtype=np.int_))
+        return self
+
+    def add_compiled(self, corpus, max_insts=1000000):
+        """
+        add the counts of a corpus_cache.CompiledCorpus, without decoding its tokens
+        """
+        num_sents = min(len(corpus), max_insts)
+        offsets = np.asarray(corpus.offsets[:num_sents + 1], dtype=np.int_)
+        end = offsets[-1]
+        word_ids = corpus.words[:end]
+        tag_ids = corpus.tags[:end]
+        word_map = self._intern_compiled(word_ids, corpus.word_strings, self.word_to_id, self.words)
+        tag_map = self._intern_compiled(tag_ids, corpus.tag_strings, self.tag_to_id, self.tags)
+        self._add_ids(word_map[word_ids], tag_map[tag_ids], offsets - offsets[0])
+        return self
+
+    def _intern_compiled(self, ids, table, item_to_id, strings):
+        # compiled ids are assigned in order of first appearance, so interning
+        # the ids in use in increasing order keeps that order
+        used = np.unique(ids)
+        id_map = np.full(len(table), -1, dtype=np.int_)
+        id_map[used] = self._intern([table[i] for i in used.tolist()], item_to_id, strings)
+        return id_map
+
+    def merge(self, other):
+        """
+        add the counts of another CorpusStats, as if its sentences came after the
+        sentences of this one
+
+        :param other: CorpusStats
+        :returns: self
+        """
+        word_map = np.asarray(self._intern(other.words, self.word_to_id, self.words), dtype=np.int_)
+        tag_map = np.asarray(self._intern(other.tags, self.tag_to_id, self.tags), dtype=np.int_)
+        self._grow()
+        trans_map = np.append(tag_map, len(self.tags))
+        word_cells = np.ix_(word_map, tag_map)
+        trans_cells = np.ix_(trans_map, trans_map)
+
+        self.word_tag_counts[word_cells] += other.word_tag_counts
+        self.trans_counts[trans_cells] += other.trans_counts
+        self.word_tag_first[word_cells] = np.minimum(self.word_tag_first[word_cells],
+                                                     _shift_first(other.word_tag_first, self.num_tokens))
+        self.trans_first[trans_cells] = np.minimum(self.trans_first[trans_cells],
+                                                   _shift_first(other.trans_first, 2 * self.num_tokens))
+        self.num_sentences += other.num_sentences
+        self.num_tokens += other.num_tokens
+        self._mark_dirty(trans_map)
+        return self
+
+    def subtract(self, other):
+        """
+        remove the counts of another CorpusStats, e.g. of sentences that were added
+        earlier and have since been corrected. Words and tags whose counts drop to zero
+        stay interned, but are no longer part of the vocabulary or tagset of the
+        derived probabilities.
+
+        :param other: CorpusStats whose counts are all included in this one
+        :returns: self
+        """
+        missing = [w for w in other.words if w not in self.word_to_id] + [t for t in other.tags if t not in self.tag_to_id]
+        if missing:
+            raise ValueError("cannot subtract counts of unknown words or tags: %s" % missing[:5])
+        word_map = np.array([self.word_to_id[w] for w in other.words], dtype=np.int_)
+        tag_map = np.array([self.tag_to_id[t] for t in other.tags], dtype=np.int_)
+        trans_map = np.append(tag_map, len(self.tags))
+        word_cells = np.ix_(word_map, tag_map)
+        trans_cells = np.ix_(trans_map, trans_map)
+
+        word_tag_counts = self.word_tag_counts[word_cells] - other.word_tag_counts
+        trans_counts = self.trans_counts[trans_cells] - other.trans_counts
+        if (word_tag_counts < 0).any() or (trans_counts < 0).any() or other.num_sentences > self.num_sentences:
+            raise ValueError("cannot subtract counts that are larger than the current counts")
+        self.word_tag_counts[word_cells] = word_tag_counts
+        self.trans_counts[trans_cells] = trans_counts
+        self.num_sentences -= other.num_sentences
+        self.num_tokens -= other.num_tokens
+        self._mark_dirty(trans_map)
+        return self
+
+    def copy(self):
+        """
+        :returns: CorpusStats with its own copies of the counts, which can be updated without changing this one
+        """
+        return copy.deepcopy(self)
+
+    def _grow(self):
+        num_words, num_tags = len(self.words), len(self.tags)
+        old_words, old_tags = self.word_tag_counts.shape
+        if (old_words, old_tags) != (num_words, num_tags):
+            self.word_tag_counts = _grow_matrix(self.word_tag_counts, num_words, num_tags, 0)
+            self.word_tag_first = _grow_matrix(self.word_tag_first, num_words, num_tags, NOT_SEEN)
+            self.trans_counts = _grow_trans_matrix(self.trans_counts, num_tags, 0)
+            self.trans_first = _grow_trans_matrix(self.trans_first, num_tags, NOT_SEEN)
+
+    def _add_ids(self, word_ids, tag_ids, offsets):
+        self._grow()
+        num_words, num_tags = self.word_tag_counts.shape
+        num_sents = len(offsets) - 1
+        if num_sents == 0:
+            return
+        positions = self.num_tokens + np.arange(len(word_ids))
+        cells = word_ids * num_tags + tag_ids
+        self.word_tag_counts += np.bincount(cells, minlength=num_words * num_tags).reshape(num_words, num_tags)
+        _update_first(self.word_tag_first, cells, positions)
+
+        # previous tag of every token, START_TAG for the first token of each sentence.
+        # the transition into token i is seen at position 2i-1, or at 2i for START_TAG,
+        # and the transition out of the last token of a sentence at 2i+1
+        starts = offsets[:-1]
+        ends = offsets[1:] - 1
+        prev_tags = np.empty_like(tag_ids)
+        prev_tags[1:] = tag_ids[:-1]
+        prev_tags[starts] = num_tags
+        trans_positions = 2 * positions - 1
+        trans_positions[starts] += 1
+        cells = np.concatenate([prev_tags * (num_tags + 1) + tag_ids, tag_ids[ends] * (num_tags + 1) + num_tags])
+        trans_positions = np.concatenate([trans_positions, 2 * positions[ends] + 1])
+        self.trans_counts += np.bincount(cells, minlength=(num_tags + 1) ** 2).reshape(num_tags + 1, num_tags + 1)
+        _update_first(self.trans_first, cells, trans_positions)
+
+        self.num_sentences += num_sents
+        self.num_tokens += len(word_ids)
+        self._mark_dirty(np.append(np.unique(tag_ids), num_tags))
+
+    # smoothed log-probabilities. These are cached per smoothing value, and when
+    # counts change only the tags whose counts changed are re-derived, unless the
+    # vocabulary or tagset changed, which changes every denominator. The cache is
+    # keyed on which words and tags have counts rather than on how many do, as a
+    # subtract and a merge can swap one word for another.
+
+    def _mark_dirty(self, tag_ixs):
+        tag_ixs = set(np.asarray(tag_ixs).tolist())
+        for entry in self._derived_cache.values():
+            entry['dirty'].update(tag_ixs)
+
+    def _derived(self, kind, smoothing):
+        if kind == 'emission':
+            signature = (self.word_tag_counts.shape, self.word_tag_counts.any(axis=1).tobytes())
+        else:
+            signature = (self.trans_counts.shape, self.trans_counts.any(axis=1).tobytes())
+        key = (kind, smoothing)
+        entry = self._derived_cache.get(key)
+        if entry is None or entry['signature'] != signature:
+            num_tags = len(self.tags)
+            entry = {'signature': signature, 'dirty': set(range(num_tags + 1)),
+                     'values': np.zeros(self.word_tag_counts.shape if kind == 'emission' else self.trans_counts.shape)}
+            self._derived_cache[key] = entry
+        if entry['dirty']:
+            # update a copy, so that the matrices returned before stay as they were
+            tag_ixs = np.array(sorted(entry['dirty']), dtype=np.int_)
+            values = entry['values'].copy()
+            if kind == 'emission':
+                tag_ixs = tag_ixs[tag_ixs < len(self.tags)]
+                values[:, tag_ixs] = self._emission_columns(tag_ixs, smoothing)
+            else:
+                values[tag_ixs] = self._transition_rows(tag_ixs, smoothing)
+            values.flags.writeable = False
+            entry['values'] = values
+            entry['dirty'] = set()
+        return entry['values']
+
+    def _emission_columns(self, tag_ixs, smoothing):
+        # log P(word | tag) as in naive_bayes.estimate_pxy, over the words with nonzero counts
+        active_words = self.word_tag_counts.any(axis=1)
+        vocab_size = active_words.sum()
+        counts = self.word_tag_counts[:, tag_ixs]
+        totals = counts.sum(axis=0)
+        with np.errstate(divide='ignore'):
+            columns = np.log((smoothing + counts) / (vocab_size * smoothing + totals))
+        columns[~active_words] = -np.inf
+        columns[:, totals == 0] = -np.inf
+        return columns
+
+    def _transition_rows(self, tag_ixs, smoothing):
+        # log P(next tag | previous tag) as in hmm.compute_transition_weights, where the
+        # number of outcomes is the number of previous tags (including START_TAG) plus END_TAG
+        num_outcomes = self.trans_counts.any(axis=1).sum() + 1
+        counts = self.trans_counts[tag_ixs]
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore'):
+            rows = np.log(counts + smoothing) - np.log(totals + num_outcomes * smoothing)
+        # tags that never occur are not outcomes
+        rows[:, :-1][:, ~self.trans_counts[:-1].any(axis=1)] = -np.inf
+        rows[totals[:, 0] == 0] = -np.inf
+        return rows
+
+    def emission_log_probs(self, smoothing):
+        """
+        :param smoothing: additive smoothing
+        :returns: read-only matrix of size len(words) x len(tags) of smoothed log P(word | tag),
+                  -inf for words and tags that have no counts
+        """
+        return self._derived('emission', smoothing)
+
+    def transition_log_probs(self, smoothing):
+        """
+        :param smoothing: additive smoothing
+        :returns: read-only matrix of size len(tags)+1 x len(tags)+1 of smoothed log P(next tag | previous tag),
+                  laid out like trans_counts, -inf for tags that have no counts
+        """
+        return self._derived('transition', smoothing)
+
+    def tag_log_priors(self):
+        """
+        :returns: array of log P(tag), -inf for tags that have no counts
+        """
+        tag_counts = self.word_tag_counts.sum(axis=0)
+        with np.errstate(divide='ignore'):
+            return np.log(tag_counts / max(tag_counts.sum(), 1))
+
+    def nb_weights(self, smoothing):
+        """
+        :returns: WeightTable of naive bayes weights, as naive_bayes.get_nb_weights on the same corpus
+        """
+        emission = self.emission_log_probs(smoothing)
+        priors = self.tag_log_priors()
+        word_ixs = np.flatnonzero(self.word_tag_counts.any(axis=1))
+        tag_ixs = np.flatnonzero(self.word_tag_counts.any(axis=0))
+        values = np.column_stack([emission[np.ix_(word_ixs, tag_ixs)].T, priors[tag_ixs]])
+        return WeightTable.from_matrix(values,
+                                       [self.tags[i] for i in tag_ixs.tolist()],
+                                       [self.words[i] for i in word_ixs.tolist()] + [OFFSET])
+
+    def transition_weights(self, smoothing):
+        """
+        :returns: WeightTable of transition weights [(curr_tag, prev_tag)], as
+                  hmm.compute_transition_weights(self.tag_trans_counts(), smoothing)
+        """
+        num_tags = len(self.tags)
+        transitions = self.transition_log_probs(smoothing)
+        active = self.trans_counts.any(axis=1)
+        prev_ixs = [i for i in [num_tags] + list(range(num_tags)) if active[i]]
+        prev_tags = [START_TAG if i == num_tags else self.tags[i] for i in prev_ixs]
+        next_ixs = prev_ixs + [num_tags]
+        next_tags = prev_tags + [END_TAG]
+        values = transitions[np.ix_(prev_ixs, next_ixs)].copy()
+        values[:, [tag == START_TAG for tag in next_tags]] = -np.inf
+        weights = WeightTable()
+        weights.set_cells(next_tags * len(prev_tags),
+                          [prev_tag for prev_tag in prev_tags for _ in next_tags],
+                          values.ravel())
+        return weights
+
+    def tag_dictionary(self, min_count=1):
+        """
+        :param min_count: words seen fewer than min_count times are left out of the dictionary,
+                          as their tags are not a reliable guide to the tags they can take
+        :returns: dict mapping each word seen at least min_count times to the list of tags it was seen with
+        """
+        word_counts = self.word_tag_counts.sum(axis=1)
+        frequent = (word_counts >= max(min_count, 1)).reshape(-1, 1)
+        word_ixs, tag_ixs = np.nonzero((self.word_tag_counts > 0) & frequent)
+        tag_dictionary = {}
+        for word_ix, tag_ix in zip(word_ixs.tolist(), tag_ixs.tolist()):
+            tag_dictionary.setdefault(self.words[word_ix], []).append(self.tags[tag_ix])
+        return tag_dictionary
+
+    # views, with the same return types as the functions in most_common and preprocessing.
+    # words and tags whose counts were all subtracted are left out.
+
+    def _active_tag_ixs(self):
+        return np.flatnonzero(self.word_tag_counts.any(axis=0)).tolist()
+
+    def all_tags(self):
+        """
+        :returns: set of all tags in the corpus, as preprocessing.get_all_tags
+        """
+        return set(self.tags[i] for i in self._active_tag_ixs())
+
+    def tag_word_counts(self):
+        """
+        :returns: default dict of counters of words for each tag, as most_common.get_tag_word_counts
+        """
+        counters = defaultdict(lambda: Counter())
+        for tag_ix in self._active_tag_ixs():
+            tag = self.tags[tag_ix]
+            counters[tag] = _counter(self.word_tag_counts[:, tag_ix], self.word_tag_first[:, tag_ix], self.words)
+        return counters
+
+    def most_common_weights(self):
+        """
+        :returns: WeightTable of classifier weights, as most_common.get_most_common_word_weights:
+                  the count of each (tag, word) pair, and the count of each tag for (tag, OFFSET)
+        """
+        word_ixs, tag_ixs = np.nonzero(self.word_tag_counts)
+        # words in order of first appearance, and the tags of each word in the order they were seen with it
+        order = np.lexsort((self.word_tag_first[word_ixs, tag_ixs], word_ixs))
+        word_ixs, tag_ixs = word_ixs[order], tag_ixs[order]
+        active_tag_ixs = self._active_tag_ixs()
+        weights = WeightTable()
+        weights.set_cells([self.tags[t] for t in tag_ixs.tolist()] + [self.tags[t] for t in active_tag_ixs],
+                          [self.words[w] for w in word_ixs.tolist()] + [OFFSET] * len(active_tag_ixs),
+                          np.concatenate([self.word_tag_counts[word_ixs, tag_ixs],
+                                          self.word_tag_counts.sum(axis=0)[active_tag_ixs]]))
+        return weights
+
+    def tag_to_ix(self):
+        """
+        :returns: tag_to_ix, ix_to_tag, as most_common.get_tag_to_ix
+        """
+        tag_to_ix = {self.tags[i]: ix for ix, i in enumerate(self._active_tag_ixs())}
+        ix_to_tag = {v: k for k, v in tag_to_ix.items()}
+        return tag_to_ix, ix_to_tag
+
+    def word_to_ix(self, max_size=100000):
+        """
+        :returns: vocab, word_to_ix, as most_common.get_word_to_ix
+        """
+        word_counts = self.word_tag_counts.sum(axis=1)
+        # stable sort, so that ties keep their order of first appearance like Counter.most_common
+        order = np.argsort(-word_counts, kind='stable')[:max(max_size - 1, 0)]
+        vocab = [self.words[i] for i in order if word_counts[i] > 0]
+        vocab.append(UNK)
+        word_to_ix = {}
+        for word in vocab:
+            word_to_ix[word] = len(word_to_ix)
+        return vocab, word_to_ix
+
+    def tag_trans_counts(self):
+        """
+        :returns: dict of counters of succeeding tags, as most_common.get_tag_trans_counts
+        """
+        num_tags = len(self.tags)
+        from_tags = [START_TAG] + self.tags
+        to_tags = self.tags + [END_TAG]
+        tot_counts = {}
+        for row, from_tag in zip([num_tags] + list(range(num_tags)), from_tags):
+            if self.trans_counts[row].any():
+                tot_counts[from_tag] = _counter(self.trans_counts[row], self.trans_first[row], to_tags)
+        return tot_counts
+
+
+NOT_SEEN = np.iinfo(np.int64).max
+
+def _grow_matrix(matrix, num_rows, num_cols, fill):
+    grown = np.full((num_rows, num_cols), fill, dtype=matrix.dtype)
+    grown[:matrix.shape[0], :matrix.shape[1]] = matrix
+    return grown
+
+def _grow_trans_matrix(matrix, num_tags, fill):
+    # keep START_TAG and END_TAG in the last row and column
+    old_tags = matrix.shape[0] - 1
+    grown = np.full((num_tags + 1, num_tags + 1), fill, dtype=matrix.dtype)
+    grown[:old_tags, :old_tags] = matrix[:old_tags, :old_tags]
+    grown[num_tags, :old_tags] = matrix[old_tags, :old_tags]
+    grown[:old_tags, num_tags] = matrix[:old_tags, old_tags]
+    grown[num_tags, num_tags] = matrix[old_tags, old_tags]
+    return grown
+
+def _shift_first(first, offset):
+    return np.where(first == NOT_SEEN, NOT_SEEN, first + offset)
+
+def _update_first(first, cells, positions):
+    np.minimum.at(first.reshape(-1), cells, positions)
+
+def _counter(counts, first, names):
+    ixs = np.flatnonzero(counts)
+    ixs = ixs[np.argsort(first[ixs], kind='stable')]
+    return Counter(dict(zip([names[i] for i in ixs], counts[ixs].tolist())))
+
+
+_stats_cache = {}
+
+def get_corpus_stats(input_file):
+    """
+    CorpusStats for a file, computed once per process and reused until the
+    file changes. The returned object is shared: use CorpusStats.from_file
+    to get a private copy that can be modified.
+    """
+    key = os.path.abspath(input_file)
+    signature = arrayfile.source_signature(input_file)
+    if key not in _stats_cache or _stats_cache[key][0] != signature:
+        _stats_cache[key] = (signature, CorpusStats.from_file(input_file))
+    return _stats_cache[key][1]
@@ -0,0 +1,79 @@
+import os
+import shutil
+import socket
+import tempfile
+import multiprocessing
+import torch
+import torch.distributed as dist
+import torch.multiprocessing
+from oswegonlp import bilstm
+
+# Data-parallel training of the BiLSTM tagger on the cores of one machine.
+# Each rank is a process with its own copy of the model, which trains on its
+# share of the batches (see batching.BucketBatchSampler); the gradients are
+# averaged over the ranks by gloo all-reduces at each step, so the copies stay
+# identical. Only rank 0 evaluates on the dev data and writes the parameters.
+#
+# train_distributed starts the ranks itself. To start them with torchrun
+# instead, each rank of the script calls init_process_group() and then
+# bilstm.train_model(..., distributed=True):
+#
+#     torchrun --standalone --nproc_per_node=8 train.py
+
+def init_process_group(rank=None, world_size=None, init_method=None):
+    """
+    join the gloo process group of a training run, and split the cores of the machine among its ranks
+
+    :param rank: (optional) rank of this process; with no arguments, the process group is set up from
+                 the environment variables set by torchrun
+    :param world_size: (optional) number of ranks
+    :param init_method: (optional) url where the ranks meet, such as tcp://127.0.0.1:29500
+    """
+    if rank is None:
+        dist.init_process_group('gloo')
+    else:
+        dist.init_process_group('gloo', init_method=init_method, rank=rank, world_size=world_size)
+    # without this, each rank would use as many threads as there are cores
+    local_ranks = int(os.environ.get('LOCAL_WORLD_SIZE', dist.get_world_size()))
+    torch.set_num_threads(max((os.cpu_count() or 1) // local_ranks, 1))
+
+def train_distributed(num_procs, loss, model, X_tr, Y_tr, word_to_ix, tag_to_ix, X_dv=None, Y_dv=None, **train_args):
+    """
+    run bilstm.train_model with distributed=True in num_procs local processes
+
+    :param num_procs: number of ranks; at most the number of cores
+    :param train_args: the other arguments of train_model; batch_size is per rank
+    :returns: model, losses, accuracies, as train_model returns on rank 0;
+              model is the model passed in, with the trained parameters
+    """
+    # the ranks are forked, so they share the data instead of pickling it, as in parallel_reader
+    methods = multiprocessing.get_all_start_methods()
+    init_method = 'tcp://127.0.0.1:%d' % _free_port()
+    result_dir = tempfile.mkdtemp()
+    result_file = os.path.join(result_dir, 'result.pt')
+    try:
+        torch.multiprocessing.start_processes(
+            _train_rank, args=(num_procs, init_method, result_file, loss, model, X_tr, Y_tr, word_to_ix, tag_to_ix,
+                               X_dv, Y_dv, train_args),
+            nprocs=num_procs, start_method='fork' if 'fork' in methods else 'spawn')
+        result = torch.load(result_file, weights_only=False)
+    finally:
+        shutil.rmtree(result_dir)
+    model.load_state_dict(result['state_dict'])
+    return model, result['losses'], result['accuracies']
+
+def _train_rank(rank, world_size, init_method, result_file, loss, model, X_tr, Y_tr, word_to_ix, tag_to_ix,
+                X_dv, Y_dv, train_args):
+    init_process_group(rank, world_size, init_method)
+    try:
+        model, losses, accuracies = bilstm.train_model(loss, model, X_tr, Y_tr, word_to_ix, tag_to_ix, X_dv, Y_dv,
+                                                       distributed=True, **train_args)
+        if rank == 0:
+            torch.save({'state_dict': model.state_dict(), 'losses': losses, 'accuracies': accuracies}, result_file)
+    finally:
+        dist.destroy_process_group()
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -1,11 +1,15 @@
 from oswegonlp.preprocessing import conll_seq_generator
 from oswegonlp.constants import START_TAG, END_TAG, OFFSET, UNK
-from oswegonlp import naive_bayes, most_common 
+from oswegonlp import naive_bayes, most_common, corpus_stats, corpus_cache, arrayfile, viterbi, preprocessing
+from oswegonlp import backend as backends
+import os
+import warnings
 import numpy as np
 from collections import defaultdict
-import torch
-import torch.nn
-from torch.autograd import Variable
+from oswegonlp.weight_table import WeightTable
+
+# torch is imported only by the functions that return torch Variables: HMMModel
+# tags with the numpy backend without it
 
 
 def compute_transition_weights(trans_counts, smoothing):
@@ -18,24 +22,141 @@ def compute_transition_weights(trans_counts, smoothing):
 
     :param trans_counts: counts, generated from most_common.get_tag_trans_counts
     :param smoothing: additive smoothing
-    :returns: dict of features [(curr_tag,prev_tag)] and weights
+    :returns: WeightTable of features [(curr_tag,prev_tag)] and weights
 
     """
-    weights = defaultdict(float)
+    curr_tags = []
+    prev_tags = []
+    values = []
     all_tags = list(trans_counts.keys()) + [END_TAG]
 
     for x in trans_counts:
         v = trans_counts[x]
         v_total = len(list(v.elements()))
         for tag in all_tags:
+            curr_tags.append(tag)
+            prev_tags.append(x)
             if tag == START_TAG:
-                weights[(tag, x)] = -np.inf
+                values.append(-np.inf)
             else:
-                weights[(tag, x)] = np.log(v[tag] + smoothing) - np.log(v_total + (len(all_tags) * smoothing))
+                values.append(np.log(v[tag] + smoothing) - np.log(v_total + (len(all_tags) * smoothing)))
 
+    weights = WeightTable()
+    weights.set_cells(curr_tags, prev_tags, values)
     return weights
 
 
+def get_trigram_counts(input_file):
+    """
+    count tag trigrams in a conll file, with each sentence padded as START_TAG START_TAG tags END_TAG
+
+    :param input_file: name of the conll file; its compiled form is used if it is fresh
+    :returns: tags, trigram_counts -- trigram_counts is an int64 array of size
+              len(tags)+1 x len(tags)+1 x len(tags)+1 of counts [prev2_tag, prev_tag, next_tag].
+              The extra index is START_TAG for the previous tags, and END_TAG for the next tag.
+    """
+    corpus = corpus_cache.load_corpus(input_file)
+    if corpus is not None:
+        tags = corpus.tag_strings
+        return tags, compute_trigram_counts(np.asarray(corpus.tags), np.asarray(corpus.offsets), len(tags))
+    offsets, columns = preprocessing.load_columns(input_file, 'UPOS')
+    tag_ids, tags = columns['UPOS']
+    return tags, compute_trigram_counts(tag_ids, offsets, len(tags))
+
+
+def compute_trigram_counts(tag_ids, offsets, num_tags):
+    """
+    :param tag_ids: int array of the tag ids of all tokens
+    :param offsets: int array of len(sentences)+1 token offsets
+    :param num_tags: number of tags; START_TAG and END_TAG get the id num_tags
+    :returns: trigram counts, as get_trigram_counts
+    """
+    tag_ids = np.asarray(tag_ids, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    ends = offsets[1:][np.diff(offsets) > 0]
+    position = np.arange(len(tag_ids)) - np.repeat(offsets[:-1], np.diff(offsets))
+    prev_tags = np.full(len(tag_ids), num_tags, dtype=np.int64)
+    prev_tags[1:] = tag_ids[:-1]
+    prev_tags[position < 1] = num_tags
+    prev2_tags = np.full(len(tag_ids), num_tags, dtype=np.int64)
+    prev2_tags[2:] = tag_ids[:-2]
+    prev2_tags[position < 2] = num_tags
+
+    size = num_tags + 1
+    cells = np.concatenate([(prev2_tags * size + prev_tags) * size + tag_ids,
+                            (prev_tags[ends - 1] * size + tag_ids[ends - 1]) * size + num_tags])
+    return np.bincount(cells, minlength=size ** 3).reshape(size, size, size)
+
+
+def deleted_interpolation(trigram_counts):
+    """
+    estimate the weights of the unigram, bigram and trigram estimates of P(next_tag | prev2_tag, prev_tag)
+    by deleted interpolation (Brants, 2000): each trigram votes, with its count, for the estimate that
+    best predicts it when that trigram is left out of the counts
+
+    :param trigram_counts: trigram counts, as from get_trigram_counts
+    :returns: array of the three weights, summing to 1
+    """
+    counts = trigram_counts.astype(np.float64)
+    context_counts = counts.sum(axis=2, keepdims=True)
+    bigram_counts = counts.sum(axis=0)
+    prev_counts = bigram_counts.sum(axis=1, keepdims=True)
+    unigram_counts = bigram_counts.sum(axis=0)
+    total = unigram_counts.sum()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        estimates = np.stack(np.broadcast_arrays(
+            (unigram_counts - 1) / (total - 1),
+            np.where(prev_counts > 1, (bigram_counts - 1) / (prev_counts - 1), 0),
+            np.where(context_counts > 1, (counts - 1) / (context_counts - 1), 0)))
+    best = np.argmax(estimates, axis=0)
+    lambdas = np.array([counts[(best == k) & (counts > 0)].sum() for k in range(3)])
+    return lambdas / max(lambdas.sum(), 1)
+
+
+def compute_trigram_transition_weights(trigram_counts, tags, tag_to_ix, lambdas=None):
+    """
+    Compute the trigram HMM transition weights as a torch Variable, see compute_trigram_transition_matrix
+
+    :returns: torch Variable of size len(tag_to_ix) x len(tag_to_ix) x len(tag_to_ix), of weights
+              [prev2_tag, prev_tag, next_tag]; -inf for transitions that cannot happen
+    """
+    import torch
+    from torch.autograd import Variable
+    return Variable(torch.from_numpy(compute_trigram_transition_matrix(trigram_counts, tags, tag_to_ix, lambdas)))
+
+
+def compute_trigram_transition_matrix(trigram_counts, tags, tag_to_ix, lambdas=None):
+    """
+    Compute the trigram HMM transition weights log P(next_tag | prev2_tag, prev_tag), interpolating
+    the maximum likelihood unigram, bigram and trigram estimates.
+
+    :param trigram_counts: trigram counts, as from get_trigram_counts
+    :param tags: list of the tags that index trigram_counts
+    :param tag_to_ix: a dictionary that maps each tag (including the START_TAG and the END_TAG) to a unique index.
+    :param lambdas: (optional) weights of the unigram, bigram and trigram estimates;
+                    estimated by deleted_interpolation if None
+    :returns: float32 numpy array of size len(tag_to_ix) x len(tag_to_ix) x len(tag_to_ix), of weights
+              [prev2_tag, prev_tag, next_tag]; -inf for transitions that cannot happen
+    """
+    if lambdas is None:
+        lambdas = deleted_interpolation(trigram_counts)
+    counts = trigram_counts.astype(np.float64)
+    bigram_counts = counts.sum(axis=0)
+    unigram_counts = bigram_counts.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probs = (lambdas[0] * unigram_counts / unigram_counts.sum()
+                 + lambdas[1] * np.nan_to_num(bigram_counts / bigram_counts.sum(axis=1, keepdims=True))
+                 + lambdas[2] * np.nan_to_num(counts / counts.sum(axis=2, keepdims=True)))
+        log_probs = np.log(probs)
+
+    prev_ixs = [tag_to_ix[tag] for tag in tags] + [tag_to_ix[START_TAG]]
+    next_ixs = [tag_to_ix[tag] for tag in tags] + [tag_to_ix[END_TAG]]
+    transition_prob = np.full((len(tag_to_ix),) * 3, -np.inf)
+    transition_prob[np.ix_(prev_ixs, prev_ixs, next_ixs)] = log_probs
+    return transition_prob.astype(np.float32)
+
+
 def compute_weights_variables(nb_weights, hmm_trans_weights, vocab, word_to_ix, tag_to_ix):
     """
     Computes autograd Variables of two weights: emission_probabilities and the tag_transition_probabilties
@@ -52,22 +173,441 @@ def compute_weights_variables(nb_weights, hmm_trans_weights, vocab, word_to_ix,
     :rtype: autograd Variables of the the weights
     """
     # Assume that tag_to_ix includes both START_TAG and END_TAG
+    if not isinstance(nb_weights, WeightTable):
+        nb_weights = WeightTable.from_dict(nb_weights, dtype=np.float64)
+    if not isinstance(hmm_trans_weights, WeightTable):
+        hmm_trans_weights = WeightTable.from_dict(hmm_trans_weights, dtype=np.float64)
+
+    emission_prob, transition_prob = init_weights_matrices(vocab, word_to_ix, tag_to_ix)
+    # emission_prob is indexed [word, tag] and the nb weights [(tag, word)], so scatter into its transpose
+    nb_weights.to_dense(tag_to_ix, word_to_ix, out=emission_prob.T)
+    hmm_trans_weights.to_dense(tag_to_ix, tag_to_ix, out=transition_prob)
+
+    return weights_variables(emission_prob, transition_prob)
+
+
+def compute_weights_variables_from_stats(stats, smoothing, vocab, word_to_ix, tag_to_ix):
+    """
+    Computes the same Variables as
+    compute_weights_variables(stats.nb_weights(smoothing), stats.transition_weights(smoothing), vocab, word_to_ix, tag_to_ix),
+    directly from the count matrices of a corpus_stats.CorpusStats, without building the weights.
+
+    parameters:
+    stats: -- corpus_stats.CorpusStats of the training data
+    smoothing: -- additive smoothing of the emission and transition probabilities
+    vocab, word_to_ix, tag_to_ix: -- as for compute_weights_variables
+
+    :returns:
+    emission_probs_vr: torch Variable of a matrix of size Vocab x Tagset_size
+    tag_transition_probs_vr: torch Variable of a matrix of size Tagset_size x Tagset_size
+    """
+    emission_prob, transition_prob = compute_weights_matrices_from_stats(stats, smoothing, vocab, word_to_ix, tag_to_ix)
+    return weights_variables(emission_prob, transition_prob)
+
+
+def compute_weights_matrices_from_stats(stats, smoothing, vocab, word_to_ix, tag_to_ix):
+    """
+    compute_weights_variables_from_stats, as float32 numpy matrices rather than torch Variables
+    """
+    emission_prob, transition_prob = init_weights_matrices(vocab, word_to_ix, tag_to_ix)
 
+    # the nb weights cover the words and tags that have counts
+    has_word = stats.word_tag_counts.any(axis=1)
+    has_tag = stats.word_tag_counts.any(axis=0)
+    words = [(ix, stats.word_to_id[word]) for word, ix in word_to_ix.items()
+             if word in stats.word_to_id and has_word[stats.word_to_id[word]]]
+    tags = [(ix, stats.tag_to_id[tag]) for tag, ix in tag_to_ix.items()
+            if tag in stats.tag_to_id and has_tag[stats.tag_to_id[tag]]]
+    if words and tags:
+        word_ixs, word_ids = zip(*words)
+        tag_ixs, tag_ids = zip(*tags)
+        emission_prob[np.ix_(word_ixs, tag_ixs)] = stats.emission_log_probs(smoothing)[np.ix_(word_ids, tag_ids)]
+
+    # the transition weights cover the previous tags that have counts, with START_TAG as the last row
+    # of the transition counts, and the same tags and END_TAG as next tags, with END_TAG as the last column
+    num_tags = len(stats.tags)
+    active = stats.trans_counts.any(axis=1)
+    prevs = []
+    nexts = []
+    for tag, ix in tag_to_ix.items():
+        row = num_tags if tag == START_TAG else stats.tag_to_id.get(tag)
+        if tag != END_TAG and row is not None and active[row]:
+            prevs.append((ix, row))
+        if tag == END_TAG:
+            nexts.append((ix, num_tags))
+        elif tag != START_TAG and row is not None and active[row]:
+            nexts.append((ix, row))
+    if prevs and nexts:
+        prev_ixs, prev_rows = zip(*prevs)
+        next_ixs, next_cols = zip(*nexts)
+        transitions = stats.transition_log_probs(smoothing)
+        transition_prob[np.ix_(next_ixs, prev_ixs)] = transitions[np.ix_(prev_rows, next_cols)].T
+
+    return emission_prob.astype(np.float32), transition_prob.astype(np.float32)
+
+
+def compute_allowed_tags(tag_dictionary, vocab, word_to_ix, tag_to_ix):
+    """
+    :param tag_dictionary: dict mapping words to the tags they can take, as from corpus_stats.CorpusStats.tag_dictionary
+    :param vocab, word_to_ix, tag_to_ix: as for compute_weights_variables
+    :returns: bool matrix of size Vocab x Tagset_size of the tags each word can take; words that are not
+              in the tag dictionary, like UNK and rare words, can take every tag but START_TAG and END_TAG
+    """
+    allowed = np.ones((len(vocab), len(tag_to_ix)), dtype=bool)
+    allowed[:, [tag_to_ix[tag] for tag in (START_TAG, END_TAG) if tag in tag_to_ix]] = False
+    for word, ix in word_to_ix.items():
+        if word in tag_dictionary:
+            allowed[ix] = False
+            allowed[ix, [tag_to_ix[tag] for tag in tag_dictionary[word] if tag in tag_to_ix]] = True
+    return allowed
+
+
+def init_weights_matrices(vocab, word_to_ix, tag_to_ix):
+    """
+    :returns: emission and transition matrices holding the values of the weights that are not set:
+              0 for emissions, but -inf for emissions of START_TAG and END_TAG, and -inf for transitions
+    """
     transition_prob = np.full((len(tag_to_ix), len(tag_to_ix)), -np.inf)
     emission_prob = np.full((len(vocab), len(tag_to_ix)), 0.)
-    for tag_i in tag_to_ix:
-        for tag_j in tag_to_ix:
-                transition_prob[tag_to_ix[tag_i], tag_to_ix[tag_j]] = hmm_trans_weights[(tag_i, tag_j)] if (tag_i, tag_j) in hmm_trans_weights else -np.inf
+    boundary_ixs = [tag_to_ix[tag] for tag in (START_TAG, END_TAG) if tag in tag_to_ix]
+    emission_prob[np.ix_(list(word_to_ix.values()), boundary_ixs)] = -np.inf
+    return emission_prob, transition_prob
 
-    for word in word_to_ix:
-        for tag_i in tag_to_ix:
-            default_val = 0
-            if tag_i == START_TAG or tag_i == END_TAG:
-                default_val = -np.inf
-            emission_prob[word_to_ix[word]][tag_to_ix[tag_i]] = nb_weights[(tag_i, word)] if (tag_i, word) in nb_weights else default_val
 
+def weights_variables(emission_prob, transition_prob):
+    import torch
+    from torch.autograd import Variable
     emission_probs_vr = Variable(torch.from_numpy(emission_prob.astype(np.float32)))
     tag_transition_probs_vr = Variable(torch.from_numpy(transition_prob.astype(np.float32)))
 
     return emission_probs_vr, tag_transition_probs_vr
     
+
+
+# A saved HMM is a single arrayfile (see arrayfile.py) holding the emission and
+# transition matrices and the vocabulary and tag string tables, with the
+# smoothing and the training file signature in its JSON header. Loading it
+# memory-maps the matrices, so every process that loads the same file shares
+# its pages instead of re-estimating the model.
+
+MODEL_KIND = 'hmm'
+MODEL_SUFFIX = '.hmm'
+# default pruning of the trigram decoder; bigram models are not pruned by default
+TRIGRAM_BEAM_SIZE = 32
+TRIGRAM_THRESHOLD = 20.
+# number of sentences decoded at once by HMMModel.tag_batch
+TAG_BATCH_SIZE = 256
+MODEL_FORMAT_VERSION = 1
+
+class HMMModel(object):
+    """
+    a trained HMM tagger: the emission and transition weights, and the vocabulary and tags that index them
+    """
+
+    def __init__(self, emission_probs, tag_transition_probs, vocab, tag_to_ix, smoothing=None, meta=None,
+                 trigram_transition_probs=None, allowed_tags=None, beam_size=None, threshold=None, backend=None):
+        """
+        :param emission_probs: numpy matrix of size len(vocab) x len(tag_to_ix), as from compute_weights_variables
+        :param tag_transition_probs: numpy matrix of size len(tag_to_ix) x len(tag_to_ix)
+        :param vocab: list of all the words, including UNK
+        :param tag_to_ix: dict mapping each tag (including START_TAG and END_TAG) to its index
+        :param smoothing: the smoothing the weights were estimated with
+        :param meta: (optional) dict of JSON-serializable information about the model
+        :param trigram_transition_probs: (optional) numpy array of size len(tag_to_ix) x len(tag_to_ix) x len(tag_to_ix),
+                                         as from compute_trigram_transition_matrix; if given, the model is a
+                                         trigram HMM and tags with viterbi.build_trigram_trellis
+        :param allowed_tags: (optional) bool matrix of size len(vocab) x len(tag_to_ix) of the tags each word
+                             can take, as from compute_allowed_tags; if given, decoding only considers those tags
+        :param beam_size, threshold: pruning of the decoder, see viterbi.build_constrained_trellis and
+                                     viterbi.build_trigram_trellis; None for the default of the decoder, which is
+                                     no pruning for bigram models and TRIGRAM_BEAM_SIZE and TRIGRAM_THRESHOLD
+                                     for trigram models
+        :param backend: (optional) 'numpy' or 'torch', the backend the model decodes with (see backend.py);
+                        by default the global backend, or numpy, which does not need torch
+        """
+        self.emission_probs = emission_probs
+        self.tag_transition_probs = tag_transition_probs
+        self.trigram_transition_probs = trigram_transition_probs
+        self.allowed_tags = allowed_tags
+        self.beam_size = beam_size
+        self.threshold = threshold
+        self.backend = backend
+        self.vocab = list(vocab)
+        self.word_to_ix = {word: ix for ix, word in enumerate(self.vocab)}
+        self.tag_to_ix = dict(tag_to_ix)
+        self.all_tags = sorted(self.tag_to_ix, key=self.tag_to_ix.get)
+        self.smoothing = smoothing
+        self.meta = meta if meta is not None else {}
+        self.filename = None
+        self._variables = None
+        self._allowed_ixs = {}
+
+    @classmethod
+    def from_stats(cls, stats, smoothing, max_vocab=100000, tag_dict_min_count=None):
+        """
+        estimate an HMM from the counts of a corpus_stats.CorpusStats, with the tags ordered as
+        list(tag_trans_counts.keys()) + [END_TAG] and the vocabulary of most_common.get_word_to_ix
+
+        :param tag_dict_min_count: (optional) constrain decoding with the tag dictionary of the words seen
+                                   at least tag_dict_min_count times; other words can take every tag
+        """
+        vocab, word_to_ix = stats.word_to_ix(max_vocab)
+        all_tags = list(stats.tag_trans_counts().keys()) + [END_TAG]
+        tag_to_ix = {tag: ix for ix, tag in enumerate(all_tags)}
+        emission_probs, tag_transition_probs = compute_weights_matrices_from_stats(stats, smoothing, vocab,
+                                                                                   word_to_ix, tag_to_ix)
+        allowed_tags = None
+        if tag_dict_min_count is not None:
+            allowed_tags = compute_allowed_tags(stats.tag_dictionary(tag_dict_min_count), vocab, word_to_ix, tag_to_ix)
+        return cls(emission_probs, tag_transition_probs, vocab, tag_to_ix, smoothing, allowed_tags=allowed_tags)
+
+    @classmethod
+    def from_file(cls, trainfile, smoothing, max_vocab=100000, order=1, tag_dict_min_count=None):
+        """
+        estimate an HMM from a conll training file
+
+        :param order: 1 for a bigram HMM, 2 for a trigram HMM, with interpolated transition weights
+        :param tag_dict_min_count: (optional) as for from_stats
+        """
+        model = cls.from_stats(corpus_stats.get_corpus_stats(trainfile), smoothing, max_vocab, tag_dict_min_count)
+        model.meta = {'trainfile': os.path.abspath(trainfile), 'source': arrayfile.source_signature(trainfile),
+                      'max_vocab': max_vocab, 'order': order, 'tag_dict_min_count': tag_dict_min_count}
+        if order == 2:
+            tags, trigram_counts = get_trigram_counts(trainfile)
+            lambdas = deleted_interpolation(trigram_counts)
+            model.trigram_transition_probs = compute_trigram_transition_matrix(trigram_counts, tags, model.tag_to_ix,
+                                                                               lambdas)
+            model.meta['lambdas'] = lambdas.tolist()
+        elif order != 1:
+            raise ValueError("order must be 1 or 2, not %s" % order)
+        return model
+
+    def weights_variables(self):
+        """
+        :returns: emission_probs, tag_transition_probs as torch tensors, sharing memory with the model
+        """
+        backends.get_backend('torch')
+        import torch
+        if self._variables is None:
+            with warnings.catch_warnings():
+                # tensors of a loaded model are backed by a read-only memory map, and are never written to
+                warnings.simplefilter('ignore', UserWarning)
+                self._variables = (torch.from_numpy(np.asarray(self.emission_probs)),
+                                   torch.from_numpy(np.asarray(self.tag_transition_probs)))
+        return self._variables
+
+    def trigram_weights_variable(self):
+        """
+        :returns: trigram_transition_probs as a torch tensor, sharing memory with the model
+        """
+        backends.get_backend('torch')
+        import torch
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            return torch.from_numpy(np.asarray(self.trigram_transition_probs))
+
+    def _weights(self):
+        # the weight matrices, as arrays of the backend the model decodes with
+        xp = backends.get_backend(self.backend)
+        if xp.name == 'torch':
+            return xp, self.weights_variables()
+        return xp, (np.asarray(self.emission_probs), np.asarray(self.tag_transition_probs))
+
+    def allowed_tag_ixs(self, word_ix):
+        """
+        :returns: array of the indices of the tags the word can take, or None if it can take every tag
+        """
+        if self.allowed_tags is None:
+            return None
+        if word_ix not in self._allowed_ixs:
+            self._allowed_ixs[word_ix] = np.flatnonzero(self.allowed_tags[word_ix])
+        return self._allowed_ixs[word_ix]
+
+    def _emission_mask(self, word_ixs):
+        # 0 for the tags the words can take and -inf for the others, to add to their emission scores
+        return np.where(np.asarray(self.allowed_tags)[word_ixs], 0, -np.inf).astype(np.float32)
+
+    def tag(self, words):
+        """
+        :param words: list of words
+        :returns: the best sequence of tags, with UNK used for words that are not in the vocabulary
+        """
+        xp, (emission_probs, tag_transition_probs) = self._weights()
+        unk_ix = self.word_to_ix[UNK]
+        word_ixs = [self.word_to_ix.get(w, unk_ix) for w in words]
+        cur_tag_scores = [emission_probs[word_ix] for word_ix in word_ixs]
+        if self.trigram_transition_probs is not None:
+            trigram_transition_probs = (self.trigram_weights_variable() if xp.name == 'torch'
+                                        else np.asarray(self.trigram_transition_probs))
+            if self.allowed_tags is not None:
+                # the trigram decoder drops states that score -inf, so masking the emissions constrains it
+                masks = self._emission_mask(word_ixs)
+                cur_tag_scores = [score + xp.array(mask) for score, mask in zip(cur_tag_scores, masks)]
+            return viterbi.build_trigram_trellis(self.all_tags, self.tag_to_ix, cur_tag_scores, trigram_transition_probs,
+                                                 beam_size=TRIGRAM_BEAM_SIZE if self.beam_size is None else self.beam_size,
+                                                 threshold=TRIGRAM_THRESHOLD if self.threshold is None else self.threshold,
+                                                 backend=xp.name)[1]
+        if self.allowed_tags is not None or self.beam_size is not None or self.threshold is not None:
+            return viterbi.build_constrained_trellis(self.all_tags, self.tag_to_ix, cur_tag_scores, tag_transition_probs,
+                                                     [self.allowed_tag_ixs(word_ix) for word_ix in word_ixs],
+                                                     beam_size=self.beam_size, threshold=self.threshold,
+                                                     backend=xp.name)[1]
+        return viterbi.build_trellis(self.all_tags, self.tag_to_ix, cur_tag_scores, tag_transition_probs,
+                                     backend=xp.name)[1]
+
+    def tag_batch(self, sentences):
+        """
+        tag many sentences at once with viterbi.build_trellis_batch; trigram models, and pruned models,
+        tag one sentence at a time
+
+        :param sentences: list of lists of words
+        :returns: list of the best sequence of tags of each sentence
+        """
+        if self.trigram_transition_probs is not None or self.beam_size is not None or self.threshold is not None:
+            return [self.tag(words) for words in sentences]
+        xp, (emission_probs, tag_transition_probs) = self._weights()
+        all_pred_tags = [None] * len(sentences)
+        for batch, lengths, cur_tag_scores in self._batches(xp, emission_probs, sentences):
+            _, best_paths = viterbi.build_trellis_batch(self.all_tags, self.tag_to_ix, cur_tag_scores,
+                                                        lengths, tag_transition_probs, backend=xp.name)
+            for i, pred_tags in zip(batch, best_paths):
+                all_pred_tags[i] = pred_tags
+        return all_pred_tags
+
+    def tag_posteriors(self, sentences):
+        """
+        the posterior probabilities of the tags of each token, see viterbi.forward_backward_batch
+
+        :param sentences: list of lists of words
+        :returns: list of the numpy arrays of size len(words) x len(all_tags) of the tag posteriors of each sentence
+        """
+        if self.trigram_transition_probs is not None:
+            raise ValueError("tag posteriors are only computed for bigram models")
+        xp, (emission_probs, tag_transition_probs) = self._weights()
+        all_posteriors = [None] * len(sentences)
+        for batch, lengths, cur_tag_scores in self._batches(xp, emission_probs, sentences):
+            _, posteriors = viterbi.forward_backward_batch(self.all_tags, self.tag_to_ix, cur_tag_scores,
+                                                           lengths, tag_transition_probs, backend=xp.name)
+            posteriors = np.asarray(posteriors)
+            for row, (i, length) in enumerate(zip(batch, lengths)):
+                all_posteriors[i] = posteriors[row, :length]
+        return all_posteriors
+
+    def tag_kbest(self, sentences, k):
+        """
+        the k best sequences of tags of each sentence, see viterbi.build_kbest_trellis_batch
+
+        :param sentences: list of lists of words
+        :param k: number of sequences
+        :returns: list of the lists of the (up to) k best sequences of tags of each sentence, best first
+        """
+        if self.trigram_transition_probs is not None:
+            raise ValueError("k-best paths are only computed for bigram models")
+        xp, (emission_probs, tag_transition_probs) = self._weights()
+        all_kbest = [None] * len(sentences)
+        for batch, lengths, cur_tag_scores in self._batches(xp, emission_probs, sentences):
+            _, kbest_paths = viterbi.build_kbest_trellis_batch(self.all_tags, self.tag_to_ix, cur_tag_scores,
+                                                               lengths, tag_transition_probs, k, backend=xp.name)
+            for i, paths in zip(batch, kbest_paths):
+                all_kbest[i] = paths
+        return all_kbest
+
+    def _batches(self, xp, emission_probs, sentences):
+        # batches of sentence indices, their lengths and the emission scores of their words
+        unk_ix = self.word_to_ix[UNK]
+        # sentences of similar length are decoded together, to keep the padding small
+        by_length = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        for start in range(0, len(by_length), TAG_BATCH_SIZE):
+            batch = by_length[start:start + TAG_BATCH_SIZE]
+            lengths = [len(sentences[i]) for i in batch]
+            word_ixs = np.full((len(batch), max(lengths)), unk_ix, dtype=np.int64)
+            for row, i in enumerate(batch):
+                word_ixs[row, :lengths[row]] = [self.word_to_ix.get(w, unk_ix) for w in sentences[i]]
+            cur_tag_scores = emission_probs[xp.index_array(word_ixs).reshape(word_ixs.shape)]
+            if self.allowed_tags is not None:
+                # the same paths as build_constrained_trellis, as tags that are not allowed score -inf
+                cur_tag_scores = cur_tag_scores + xp.array(self._emission_mask(word_ixs))
+            yield batch, lengths, cur_tag_scores
+
+    def __call__(self, words, all_tags=None):
+        # a model is a tagger, as used by tagger_base.apply_tagger and tagger_base.eval_tagger
+        return self.tag(words)
+
+    def save(self, filename):
+        """
+        write the model to filename, replacing it atomically
+        """
+        vocab_data, vocab_offsets = arrayfile.encode_strings(self.vocab)
+        tag_data, tag_offsets = arrayfile.encode_strings(self.all_tags)
+        meta = dict(self.meta, kind=MODEL_KIND, model_version=MODEL_FORMAT_VERSION, smoothing=self.smoothing)
+        arrays = {'emission_probs': np.asarray(self.emission_probs, dtype=np.float32),
+                  'tag_transition_probs': np.asarray(self.tag_transition_probs, dtype=np.float32),
+                  'vocab_data': vocab_data, 'vocab_offsets': vocab_offsets,
+                  'tag_data': tag_data, 'tag_offsets': tag_offsets}
+        if self.trigram_transition_probs is not None:
+            arrays['trigram_transition_probs'] = np.asarray(self.trigram_transition_probs, dtype=np.float32)
+        if self.allowed_tags is not None:
+            arrays['allowed_tags'] = np.asarray(self.allowed_tags, dtype=bool)
+        arrayfile.save(filename, arrays, meta=meta)
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """
+        :param filename: file written by HMMModel.save
+        :param mmap: if True, the weight matrices are read-only memory maps of the file
+        :returns: the HMMModel
+        """
+        arrays, meta = arrayfile.load(filename, mmap=mmap)
+        if meta.get('kind') != MODEL_KIND:
+            raise ValueError("%s is not an HMM model file" % filename)
+        if meta.get('model_version') != MODEL_FORMAT_VERSION:
+            raise ValueError("%s has unsupported HMM model version %s" % (filename, meta.get('model_version')))
+        all_tags = arrayfile.decode_strings(arrays['tag_data'], arrays['tag_offsets'])
+        model = cls(arrays['emission_probs'], arrays['tag_transition_probs'],
+                    arrayfile.decode_strings(arrays['vocab_data'], arrays['vocab_offsets']),
+                    {tag: ix for ix, tag in enumerate(all_tags)},
+                    smoothing=meta.pop('smoothing'), meta=meta,
+                    trigram_transition_probs=arrays.get('trigram_transition_probs'),
+                    allowed_tags=arrays.get('allowed_tags'))
+        model.meta.pop('kind')
+        model.meta.pop('model_version')
+        model.filename = filename
+        return model
+
+    def __getstate__(self):
+        # a loaded model is sent to worker processes by name, so that they memory-map the same file
+        if self.filename is not None:
+            return {'filename': self.filename, 'beam_size': self.beam_size, 'threshold': self.threshold,
+                    'backend': self.backend}
+        state = self.__dict__.copy()
+        state['_variables'] = None
+        state['_allowed_ixs'] = {}
+        return state
+
+    def __setstate__(self, state):
+        if 'emission_probs' not in state:
+            state = dict(HMMModel.load(state['filename']).__dict__, beam_size=state['beam_size'],
+                         threshold=state['threshold'], backend=state['backend'])
+        self.__dict__.update(state)
+
+
+def load_or_train(model_file, trainfile, smoothing, max_vocab=100000, order=1, tag_dict_min_count=None):
+    """
+    load the HMM saved in model_file, if it was trained on the current version of trainfile with the
+    same smoothing, order and tag dictionary; otherwise estimate it from trainfile and save it to model_file
+
+    :returns: HMMModel
+    """
+    if os.path.exists(model_file):
+        try:
+            model = HMMModel.load(model_file)
+        except ValueError:
+            model = None
+        if (model is not None and model.smoothing == smoothing and model.meta.get('max_vocab') == max_vocab
+                and model.meta.get('order', 1) == order
+                and model.meta.get('tag_dict_min_count') == tag_dict_min_count
+                and model.meta.get('source') == arrayfile.source_signature(trainfile)):
+            return model
+    model = HMMModel.from_file(trainfile, smoothing, max_vocab, order, tag_dict_min_count)
+    model.save(model_file)
+    return HMMModel.load(model_file)
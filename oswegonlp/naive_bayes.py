@@ -1,7 +1,9 @@
 from oswegonlp.constants import OFFSET
-from oswegonlp import classifier_base, evaluation, preprocessing
+from oswegonlp import classifier_base, evaluation, preprocessing, corpus_stats
+from oswegonlp.weight_table import WeightTable
 
 import numpy as np
+import scipy.sparse as sp
 import itertools
 import functools
 from collections import defaultdict
@@ -12,7 +14,8 @@ def get_nb_weights(trainfile, smoothing):
     estimate_nb function assumes that the labels are one for each document, where as in POS tagging: we have labels for 
     each particular token. So, in order to calculate the emission score weights: P(w|y) for a particular word and a 
     token, we slightly modify the input such that we consider each token and its tag to be a document and a label. 
-    The following helper code converts the dataset to token level bag-of-words feature vector and labels. 
+    The label-conditional word counts of these token level documents are exactly the tag-word counts of the
+    corpus, so the weights are estimated from those counts without building the documents.
     The weights obtained from here will be used later as emission scores for the viterbi tagger.
     
     inputs: train_file: input file to obtain the nb_weights from
@@ -20,14 +23,7 @@ def get_nb_weights(trainfile, smoothing):
     
     :returns: nb_weights: naive bayes weights
     """
-    token_level_docs=[]
-    token_level_tags=[]
-    for words,tags in preprocessing.conll_seq_generator(trainfile):
-        token_level_docs += [{word:1} for word in words]
-        token_level_tags +=tags
-    nb_weights = estimate_nb(token_level_docs, token_level_tags, smoothing)
-    
-    return nb_weights
+    return corpus_stats.get_corpus_stats(trainfile).nb_weights(smoothing)
 
 
 def corpus_counts(x,y,label):
@@ -82,68 +78,125 @@ def estimate_pxy(x,y,label,alpha,vocab):
     
 
 
-def estimate_nb(x,y,alpha):
+def estimate_nb(x,y,alpha,return_matrix=False):
     """
     estimate a naive bayes model
 
     :param x: list of dictionaries of base feature counts
     :param y: list of labels
     :param smoothing: smoothing constant
-    :returns: weights
-    :rtype: defaultdict 
+    :param return_matrix: if True, return the dense log-probabilities instead of the weights
+    :returns: weights, or if return_matrix: log_pxy, log_py, labels, vocab
+              log_pxy is a len(labels) x len(vocab) matrix of log P(word | label), log_py the log P(label)
+    :rtype: WeightTable
 
     """
-    labels = set(y)
-    labelCounts = Counter(y)
-    documentCount = len(y)
-    vocab = set(itertools.chain.from_iterable([x_i.keys() for x_i in x]))
-    weights = defaultdict(float)
-
-    for l in labels:
-        pxy = estimate_pxy(x,y,l,alpha,vocab)
-        for word, prob in pxy.items():
-            weights[(l,word)] = prob
-        weights[(l,OFFSET)] = np.log(labelCounts[l]/documentCount)
-
-    return weights
-    #raise NotImplementedError
+    X, vocab_to_ix = classifier_base.make_design_matrix(x)
+    labels, y_ix, label_counts = label_indices(y)
+    counts = label_feature_counts(X, y_ix, len(labels))
+    log_pxy = estimate_log_pxy(counts, alpha)
+    log_py = np.log(label_counts / len(y))
+    vocab = list(vocab_to_ix)
 
-    
+    if return_matrix:
+        return log_pxy, log_py, labels, vocab
+
+    return WeightTable.from_matrix(np.column_stack([log_pxy, log_py]), labels, vocab + [OFFSET])
+
+
+def label_indices(y):
+    """
+    :param y: list of labels
+    :returns: labels in order of first appearance, array of label indices, array of counts per label
+    """
+    label_to_ix = {}
+    y_ix = np.array([label_to_ix.setdefault(y_i, len(label_to_ix)) for y_i in y], dtype=np.int64)
+    return list(label_to_ix), y_ix, np.bincount(y_ix, minlength=len(label_to_ix))
+
+
+def label_feature_counts(X, y_ix, num_labels):
+    """
+    counts of all features for all labels, as one sparse product
 
+    :param X: csr matrix of base feature counts, one row per instance
+    :param y_ix: array of label indices, one per instance
+    :param num_labels: number of labels
+    :returns: dense matrix of size num_labels x num_features
+    """
+    Y = sp.csr_matrix((np.ones(len(y_ix)), (y_ix, np.arange(len(y_ix)))), shape=(num_labels, len(y_ix)))
+    return (Y @ X).toarray()
+
+
+def estimate_log_pxy(counts, alpha):
+    """
+    smoothed log P(word | label) for all labels at once, as estimate_pxy
+
+    :param counts: matrix of size num_labels x vocab_size of corpus counts
+    :param alpha: additive smoothing amount
+    :returns: matrix of log probabilities, same size as counts
+    """
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.log((alpha + counts) / (counts.shape[1] * alpha + totals))
+
+
+# largest number of elements of the log-probability tensor in find_best_smoother
+SWEEP_MAX_ELEMENTS = 2 ** 24
 
 def find_best_smoother(x_tr,y_tr,x_dv,y_dv,alphas):
     '''
     find the smoothing value that gives the best accuracy on the dev data
 
+    The training counts are computed once. The smoothed log-probabilities for all
+    values are one (alphas x labels x vocab) tensor, and the dev instances are scored
+    for all values with one matrix product, with ties between labels broken as in
+    classifier_base.predict.
+
     :param x_tr: training instances
     :param y_tr: training labels
     :param x_dv: dev instances
     :param y_dv: dev labels
     :param smoothers: list of smoothing values
-    :returns: best smoothing value
-    :rtype: float
+    :returns: best smoothing value, dict of dev accuracy per smoothing value
+    :rtype: float, dict
 
     '''
+    X_tr, vocab_to_ix = classifier_base.make_design_matrix(x_tr)
+    labels, y_ix, label_counts = label_indices(y_tr)
+    counts = label_feature_counts(X_tr, y_ix, len(labels))
+    log_py = np.log(label_counts / len(y_tr))
+    X_dv, _ = classifier_base.make_design_matrix(x_dv, vocab_to_ix)
+
+    # candidate labels are the dev labels, sorted as classifier_base.argmax sorts them;
+    # a label without training data has no weights and scores 0
+    candidates = sorted(set(y_dv))
+    label_to_ix = {label: l for l, label in enumerate(labels)}
+    trained = np.array([label in label_to_ix for label in candidates])
+    cand_ix = np.array([label_to_ix.get(label, 0) for label in candidates], dtype=np.int64)
+    y_dv_ix = np.array([candidates.index(y) for y in y_dv])
+
+    alpha_values = np.asarray(alphas, dtype=np.float64)
+    num_labels, vocab_size = counts.shape
+    totals = counts.sum(axis=1)
+    # bound the size of the log-probability tensor by sweeping the values in chunks
+    chunk = max(1, SWEEP_MAX_ELEMENTS // max(num_labels * vocab_size, 1))
+    accuracies = []
+    for start in range(0, len(alpha_values), chunk):
+        a = alpha_values[start:start + chunk, None, None]
+        log_pxy = np.log((a + counts[None]) / (vocab_size * a + totals[None, :, None]))
+        # (dev x vocab) times (vocab x alphas*labels)
+        scores = X_dv @ log_pxy[:, cand_ix].transpose(2, 0, 1).reshape(vocab_size, -1)
+        scores = scores.reshape(len(y_dv), -1, len(candidates)) + log_py[cand_ix]
+        scores[:, :, ~trained] = 0
+        accuracies.extend((scores.argmax(axis=2) == y_dv_ix[:, None]).mean(axis=0).tolist())
+
     best_smoother = alphas[0]
     best_score = 0
     scores = {}
-
-    for alpha in alphas:
-        theta_nb = estimate_nb(x_tr, y_tr, alpha)
-        results_nb = classifier_base.predict_all(x_dv, theta_nb, set(y_dv))
-        score = evaluation.acc(results_nb, y_dv)
+    for alpha, score in zip(alphas, accuracies):
         if score > best_score:
             best_score = score
             best_smoother = alpha
         scores[alpha] = score
 
     return best_smoother, scores
-    #raise NotImplementedError
-    
-
-
-
-
-
-
 
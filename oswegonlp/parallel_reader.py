@@ -0,0 +1,123 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from oswegonlp import preprocessing, corpus_stats
+
+def find_shards(input_file, num_shards):
+    """
+    split a conll file into byte ranges that start and end at sentence boundaries
+
+    :param input_file: name of the conll file
+    :param num_shards: desired number of shards; fewer are returned for small files
+    :returns: list of (start, end) byte offsets, covering the whole file in order
+    """
+    size = os.path.getsize(input_file)
+    boundaries = [0]
+    with open(input_file, 'rb') as fin:
+        for i in range(1, num_shards):
+            target = size * i // num_shards
+            if target <= boundaries[-1]:
+                continue
+            # finish the line containing target-1, then stop after the next blank line
+            fin.seek(target - 1)
+            fin.readline()
+            for line in iter(fin.readline, b''):
+                if len(line.rstrip()) == 0:
+                    break
+            boundary = fin.tell()
+            if boundaries[-1] < boundary < size:
+                boundaries.append(boundary)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def read_shard(input_file, start, end):
+    """
+    :returns: list of (words, tags) pairs in the byte range [start, end) of a conll file
+    """
+    with open(input_file, 'rb') as fin:
+        fin.seek(start)
+        text = fin.read(end - start).decode('utf-8')
+    return list(preprocessing.parse_conll_lines(text.splitlines(True)))
+
+def _read_shard(args):
+    return read_shard(*args)
+
+def _count_shard(args):
+    return corpus_stats.CorpusStats.from_sentences(read_shard(*args))
+
+def _make_executor(num_workers, initializer=None, initargs=()):
+    # fork lets the workers inherit unpicklable state such as tagger closures
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                               initializer=initializer, initargs=initargs)
+
+def _shard_args(input_file, num_workers, shards_per_worker):
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    shards = find_shards(input_file, num_workers * shards_per_worker)
+    return num_workers, [(input_file, start, end) for start, end in shards]
+
+def parallel_seq_generator(input_file, num_workers=None, max_insts=1000000, shards_per_worker=4):
+    """
+    Create a generator of (words, tags) pairs over the conll input file, like
+    preprocessing.conll_seq_generator, parsing shards of the file in a process pool.
+    Sentences are yielded in file order.
+
+    :param input_file: name of the conll file
+    :param num_workers: (optional) number of processes, defaults to the number of cpus
+    :param max_insts: (optional) maximum number of sentences to yield
+    :param shards_per_worker: (optional) number of shards per process, for load balancing
+    """
+    num_workers, shard_args = _shard_args(input_file, num_workers, shards_per_worker)
+    num_insts = 0
+    with _make_executor(num_workers) as executor:
+        for sentences in executor.map(_read_shard, shard_args):
+            for sentence in sentences:
+                if num_insts >= max_insts:
+                    return
+                num_insts += 1
+                yield sentence
+
+def parallel_corpus_stats(input_file, num_workers=None, shards_per_worker=1):
+    """
+    compute corpus_stats.CorpusStats for a conll file by counting shards in a
+    process pool and merging the per-shard counts in file order. The result
+    is the same as CorpusStats.from_file.
+    """
+    num_workers, shard_args = _shard_args(input_file, num_workers, shards_per_worker)
+    stats = corpus_stats.CorpusStats()
+    with _make_executor(num_workers) as executor:
+        for shard_stats in executor.map(_count_shard, shard_args):
+            stats.merge(shard_stats)
+    return stats
+
+
+_tagger = None
+_all_tags = None
+
+def _init_tagger(tagger, all_tags):
+    global _tagger, _all_tags
+    _tagger = tagger
+    _all_tags = all_tags
+
+def _tag_shard(args):
+    if hasattr(_tagger, 'tag_batch'):
+        return _tagger.tag_batch([words for words, _ in read_shard(*args)])
+    return [_tagger(words, _all_tags) for words, _ in read_shard(*args)]
+
+def parallel_tag(tagger, all_tags, testfile, num_workers=None, shards_per_worker=4):
+    """
+    apply a tagger to every sentence of a conll file in a process pool
+
+    :param tagger: function mapping (words, all_tags) to a list of tags, as used by tagger_base.apply_tagger;
+                   taggers with a tag_batch method tag each shard in one call
+    :param all_tags: all possible tags
+    :param testfile: name of the conll file
+    :returns: generator of lists of predicted tags, one per sentence, in file order
+    """
+    num_workers, shard_args = _shard_args(testfile, num_workers, shards_per_worker)
+    with _make_executor(num_workers, _init_tagger, (tagger, all_tags)) as executor:
+        for shard_tags in executor.map(_tag_shard, shard_args):
+            for pred_tags in shard_tags:
+                yield pred_tags
@@ -1,5 +1,7 @@
 import codecs
-from oswegonlp.constants import UNK
+import numpy as np
+from oswegonlp.constants import UNK, CONLL_COLUMNS
+from oswegonlp import corpus_cache, corpus_stats
 #from oswegonlp.bilstm import prepare_sequence
 
 def load_data(input_file):
@@ -22,14 +24,10 @@ def get_all_tags(input_file):
     input_file -- the name of the input file
     returns -- a set of all the unique tags occuring in the file
     """
-    all_tags = set([])
-    for _, tags in conll_seq_generator(input_file):
-        for tag in tags:
-            all_tags.add(tag)
-    return all_tags
+    return corpus_stats.get_corpus_stats(input_file).all_tags()
 
 
-def conll_seq_generator(input_file,max_insts=1000000):
+def conll_seq_generator(input_file,max_insts=1000000,use_cache=True):
     """
     Create a generator of (words, tags) pairs over the conll input file
     
@@ -38,37 +36,151 @@ def conll_seq_generator(input_file,max_insts=1000000):
     max_insts -- (optional) The maximum number of instances (words, tags)
                  instances to load
                  default value: 1000000 : is sufficient for our dataset
+    use_cache -- (optional) read from the compiled corpus made by
+                 corpus_cache.compile_corpus, if it is fresh
+    returns -- generator of (words, tags) pairs
+    """
+    if use_cache:
+        corpus = corpus_cache.load_corpus(input_file)
+        if corpus is not None:
+            yield from corpus.seq_generator(max_insts)
+            return
+
+    with codecs.open(input_file, encoding='utf-8') as instances:
+        yield from parse_conll_lines(instances, max_insts)
+
+
+def parse_conll_lines(lines,max_insts=1000000):
+    """
+    Create a generator of (words, tags) pairs over an iterable of conll lines
+    
+    Parameters:
+    lines -- iterable of lines (str) in conll format
+    max_insts -- (optional) The maximum number of instances to yield
     returns -- generator of (words, tags) pairs
     """
     
     cur_words = []
     cur_tags = []
     num_insts = 0
-    with codecs.open(input_file, encoding='utf-8') as instances:
-        for line in instances:
-            if num_insts >= max_insts:
-                return
-
-            if len(line.rstrip()) == 0:
-                if len(cur_words) > 0:
-                    num_insts += 1
-                    yield cur_words,cur_tags
-                    cur_words = []
-                    cur_tags = []
-            elif not line.startswith("# "):
-                parts = line.rstrip().split()
-                cur_words.append(parts[1])
-                if len(parts)>3:
-                    cur_tags.append(parts[3])
-                else: 
-                    cur_tags.append(UNK)
-        
-        #checking at the end of file
+    for line in lines:
+        if num_insts >= max_insts:
+            return
+
+        if len(line.rstrip()) == 0:
+            if len(cur_words) > 0:
+                num_insts += 1
+                yield cur_words,cur_tags
+                cur_words = []
+                cur_tags = []
+        elif not line.startswith("# "):
+            parts = line.rstrip().split()
+            cur_words.append(parts[1])
+            if len(parts)>3:
+                cur_tags.append(parts[3])
+            else: 
+                cur_tags.append(UNK)
+    
+    #checking at the end of file
+    if num_insts >= max_insts:
+        return
+
+    if len(cur_words)>0:
+        num_insts += 1
+        yield cur_words,cur_tags
+
+
+def _column_indices(columns):
+    if isinstance(columns, str):
+        columns = (columns,)
+    return [CONLL_COLUMNS.index(column) for column in columns]
+
+def _conll_token_lines(data):
+    """
+    split the raw bytes of a conll file into sentences, without decoding them
+
+    returns -- generator of lists of token lines (bytes), one list per sentence
+    """
+    cur_lines = []
+    for line in data.split(b'\n'):
+        if len(line.rstrip()) == 0:
+            if len(cur_lines) > 0:
+                yield cur_lines
+                cur_lines = []
+        elif not line.startswith(b"# "):
+            cur_lines.append(line)
+    if len(cur_lines) > 0:
+        yield cur_lines
+
+def conll_column_generator(input_file, columns=('FORM', 'UPOS'), max_insts=1000000):
+    """
+    Create a generator over the conll input file that only decodes the requested columns
+    
+    Parameters:
+    input_file -- The name of the input file
+    columns -- (optional) names of the columns to read, from constants.CONLL_COLUMNS,
+               e.g. ('FORM',) for unlabeled files or ('FORM', 'UPOS') for training files
+    max_insts -- (optional) The maximum number of instances to yield
+    returns -- generator of tuples with one list of strings per requested column;
+               missing columns are read as UNK, like the tags in conll_seq_generator
+    """
+    col_ixs = _column_indices(columns)
+    maxsplit = max(col_ixs) + 1
+    # every distinct field is decoded only once
+    decoded = [{} for _ in col_ixs]
+
+    with open(input_file, 'rb') as fin:
+        data = fin.read()
+    for num_insts, token_lines in enumerate(_conll_token_lines(data)):
         if num_insts >= max_insts:
             return
+        sent_columns = tuple([] for _ in col_ixs)
+        for line in token_lines:
+            parts = line.split(None, maxsplit)
+            for col_ix, strings, values in zip(col_ixs, decoded, sent_columns):
+                field = parts[col_ix] if col_ix < len(parts) else None
+                string = strings.get(field)
+                if string is None:
+                    string = strings[field] = field.decode('utf-8') if field is not None else UNK
+                values.append(string)
+        yield sent_columns
 
-        if len(cur_words)>0:
-            num_insts += 1
-            yield cur_words,cur_tags
+def load_columns(input_file, columns=('FORM', 'UPOS')):
+    """
+    Read the requested columns of a whole conll file into arrays
     
+    Parameters:
+    input_file -- The name of the input file
+    columns -- (optional) names of the columns to read, from constants.CONLL_COLUMNS
+    returns -- offsets, column_data
+               offsets: int64 array of len(sentences)+1 token offsets
+               column_data: dict mapping each column name to (ids, strings), where ids is an
+               int32 array with one id per token and strings is the list of distinct values,
+               in order of first appearance
+    """
+    if isinstance(columns, str):
+        columns = (columns,)
+    col_ixs = _column_indices(columns)
+    maxsplit = max(col_ixs) + 1
+    field_to_id = [{} for _ in col_ixs]
+    ids = [[] for _ in col_ixs]
+    offsets = [0]
+
+    with open(input_file, 'rb') as fin:
+        data = fin.read()
+    for token_lines in _conll_token_lines(data):
+        for line in token_lines:
+            parts = line.split(None, maxsplit)
+            for col_ix, to_id, col_ids in zip(col_ixs, field_to_id, ids):
+                field = parts[col_ix] if col_ix < len(parts) else None
+                col_ids.append(to_id.setdefault(field, len(to_id)))
+        offsets.append(len(ids[0]))
 
+    column_data = {}
+    for column, to_id, col_ids in zip(columns, field_to_id, ids):
+        # a missing field and a literal UNK field decode to the same string
+        string_to_id = {}
+        id_map = np.array([string_to_id.setdefault(field.decode('utf-8') if field is not None else UNK,
+                                                   len(string_to_id)) for field in to_id], dtype=np.int32)
+        column_data[column] = (id_map[np.array(col_ids, dtype=np.int64)], list(string_to_id))
+    return np.array(offsets, dtype=np.int64), column_data
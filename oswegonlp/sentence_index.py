@@ -0,0 +1,138 @@
+import mmap
+import os
+import numpy as np
+from oswegonlp import arrayfile, preprocessing
+
+# A sentence index stores the byte offset and length of every sentence of a
+# conll file, so that sentences can be read in any order without streaming
+# the file from the top. It is written next to the conll file and rebuilt when
+# the size or modification time of the conll file changes.
+
+INDEX_SUFFIX = '.idx'
+
+def index_filename(input_file):
+    return input_file + INDEX_SUFFIX
+
+def build_index(input_file, index_file=None):
+    """
+    scan a conll file once and write its sentence index
+
+    :param input_file: name of the conll file
+    :param index_file: (optional) name of the index file, defaults to input_file + INDEX_SUFFIX
+    :returns: offsets, lengths -- int64 arrays with the byte span of each sentence
+    """
+    if index_file is None:
+        index_file = index_filename(input_file)
+    signature = arrayfile.source_signature(input_file)
+
+    offsets = []
+    lengths = []
+    start = None
+    has_tokens = False
+    pos = 0
+    with open(input_file, 'rb') as fin:
+        for line in fin:
+            if len(line.rstrip()) == 0:
+                if has_tokens:
+                    offsets.append(start)
+                    lengths.append(pos - start)
+                start = None
+                has_tokens = False
+            else:
+                if start is None:
+                    start = pos
+                if not line.startswith(b"# "):
+                    has_tokens = True
+            pos += len(line)
+    if has_tokens:
+        offsets.append(start)
+        lengths.append(pos - start)
+
+    offsets = np.array(offsets, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.int64)
+    arrayfile.save(index_file, {'offsets': offsets, 'lengths': lengths},
+                   meta={'kind': 'sentence_index', 'source': signature})
+    return offsets, lengths
+
+def is_fresh(input_file, index_file=None):
+    if index_file is None:
+        index_file = index_filename(input_file)
+    if not os.path.exists(index_file):
+        return False
+    try:
+        meta = arrayfile.read_meta(index_file)['meta']
+    except ValueError:
+        return False
+    return meta.get('kind') == 'sentence_index' and meta.get('source') == arrayfile.source_signature(input_file)
+
+
+class SentenceIndex(object):
+    """
+    random access to the sentences of a conll file, by sentence id (its position in the file)
+
+    the index is loaded from index_file if it is fresh, and built and saved otherwise
+    """
+
+    def __init__(self, input_file, index_file=None):
+        self.input_file = input_file
+        self.index_file = index_file if index_file is not None else index_filename(input_file)
+        if is_fresh(input_file, self.index_file):
+            arrays, _ = arrayfile.load(self.index_file)
+            self.offsets, self.lengths = arrays['offsets'], arrays['lengths']
+        else:
+            self.offsets, self.lengths = build_index(input_file, self.index_file)
+        self._data = None
+
+    @property
+    def data(self):
+        # the conll file is memory-mapped lazily, so that an index can be pickled to worker processes
+        if self._data is None:
+            with open(self.input_file, 'rb') as fin:
+                self._data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return self.get_many(range(start, stop, step))
+            return self.get_range(start, stop)
+        return self.get(i)
+
+    def _parse(self, start, end):
+        text = self.data[start:end].decode('utf-8')
+        return list(preprocessing.parse_conll_lines(text.splitlines(True)))
+
+    def get(self, i):
+        """
+        :returns: words, tags of sentence i
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("sentence index out of range")
+        start = int(self.offsets[i])
+        return self._parse(start, start + int(self.lengths[i]))[0]
+
+    def get_range(self, start, stop):
+        """
+        :returns: list of (words, tags) pairs for sentences start to stop-1, read in a single pass
+        """
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        return self._parse(int(self.offsets[start]), int(self.offsets[stop - 1] + self.lengths[stop - 1]))
+
+    def get_many(self, ids):
+        """
+        :returns: list of (words, tags) pairs for the given sentence ids, in the given order
+        """
+        return [self.get(i) for i in ids]
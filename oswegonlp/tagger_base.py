@@ -2,6 +2,8 @@ from oswegonlp import scorer
 from oswegonlp import preprocessing
 from oswegonlp import classifier_base
 from oswegonlp import bilstm
+from oswegonlp import parallel_reader
+from oswegonlp.weight_table import WeightTable
 from oswegonlp.constants import DEV_FILE, OFFSET, TRAIN_FILE, UNK
 import operator
 from collections import defaultdict
@@ -10,23 +12,31 @@ argmax = lambda x : max(x.items(),key=lambda y : y[1])[0]
 
 def make_classifier_tagger(weights):
     """
-    :param weights: a defaultdict of classifier weights
+    :param weights: a WeightTable or defaultdict of classifier weights
     :returns: a function that takes a list of words, and a list of candidate tags, and returns tags for all words
     :rtype: function
     """
-    tags_set = set()
-    vocabs_set = set()
-    for weight in weights:
-        tags_set.add(weight[0])
-        vocabs_set.add(weight[1])
-    tags = list(tags_set)
-    vocabs = list(vocabs_set)
-
-    repeat_tag = argmax({tag: weights[(tag, OFFSET)] for tag in tags})
-    classifier_map = defaultdict(lambda : repeat_tag)
-
-    for word in vocabs:
-        classifier_map[word] = argmax({tag: weights[(tag, word)] for tag in tags})
+    if isinstance(weights, WeightTable):
+        # the best tag of every feature at once, from the columns of the weight matrix
+        tags = weights.labels
+        best_tags = [tags[i] for i in weights.weights.argmax(axis=0).tolist()]
+        classifier_map = dict(zip(weights.features, best_tags))
+        repeat_tag = classifier_map.get(OFFSET, tags[0] if tags else None)
+        classifier_map = defaultdict(lambda : repeat_tag, classifier_map)
+    else:
+        tags_set = set()
+        vocabs_set = set()
+        for weight in weights:
+            tags_set.add(weight[0])
+            vocabs_set.add(weight[1])
+        tags = list(tags_set)
+        vocabs = list(vocabs_set)
+
+        repeat_tag = argmax({tag: weights[(tag, OFFSET)] for tag in tags})
+        classifier_map = defaultdict(lambda : repeat_tag)
+
+        for word in vocabs:
+            classifier_map[word] = argmax({tag: weights[(tag, word)] for tag in tags})
 
     def classify(words, all_tags):
         """This nested function should return a list of tags, computed using a classifier with the weights passed as arguments to make_classifier_tagger and using basefeatures for each token (just the token and the offset)
@@ -46,34 +56,62 @@ def most_unique_tag(weights, alltags):
     return argmax(tag_uniq_counts)
 
 
-def apply_tagger(tagger, outfilename, all_tags=None, trainfile=TRAIN_FILE, testfile=DEV_FILE):
+def batch_tag_generator(tagger, sentences, batch_size=1024):
+    """
+    tag sentences in batches with tagger.tag_batch, as for hmm.HMMModel
+
+    :param tagger: object with a tag_batch method, mapping a list of sentences to a list of tag sequences
+    :param sentences: iterable of lists of words
+    :param batch_size: number of sentences tagged at once
+    :returns: generator of the tags of each sentence, in order
+    """
+    batch = []
+    for words in sentences:
+        batch.append(words)
+        if len(batch) == batch_size:
+            for pred_tags in tagger.tag_batch(batch):
+                yield pred_tags
+            batch = []
+    if batch:
+        for pred_tags in tagger.tag_batch(batch):
+            yield pred_tags
+
+
+def apply_tagger(tagger, outfilename, all_tags=None, trainfile=TRAIN_FILE, testfile=DEV_FILE, num_workers=None):
+    """
+    applies the tagger on the data and writes the tags to the outfile
+    if num_workers is given, the sentences are tagged in that many processes
+    taggers with a tag_batch method, such as hmm.HMMModel, tag batches of sentences at once
+    """
     if all_tags is None:
-        all_tags = set()
+        all_tags = preprocessing.get_all_tags(trainfile)
 
-        # this is slow
-        for i, (words, tags) in enumerate(preprocessing.conll_seq_generator(trainfile)):
-            for tag in tags:
-                all_tags.add(tag)
+    if num_workers is None and hasattr(tagger, 'tag_batch'):
+        all_pred_tags = batch_tag_generator(tagger, (words for words, _ in preprocessing.conll_seq_generator(testfile)))
+    elif num_workers is None:
+        all_pred_tags = (tagger(words, all_tags) for words, _ in preprocessing.conll_seq_generator(testfile))
+    else:
+        all_pred_tags = parallel_reader.parallel_tag(tagger, all_tags, testfile, num_workers)
 
     with open(outfilename, 'w') as outfile:
-        for words, _ in preprocessing.conll_seq_generator(testfile):
-            pred_tags = tagger(words, all_tags)
+        for pred_tags in all_pred_tags:
             for i, tag in enumerate(pred_tags):
                 outfile.write(tag + '\n')
             outfile.write('\n')
 
 
-def eval_tagger(tagger, outfilename, all_tags=None, trainfile=TRAIN_FILE, testfile=DEV_FILE):
+def eval_tagger(tagger, outfilename, all_tags=None, trainfile=TRAIN_FILE, testfile=DEV_FILE, num_workers=None):
     """Calculate confusion_matrix for a given tagger
     Parameters:
     tagger -- Function mapping (words, possible_tags) to an optimal
               sequence of tags for the words
     outfilename -- Filename to write tagger predictions to
     testfile -- (optional) Filename containing true labels
+    num_workers -- (optional) number of processes to tag with
     Returns:
     confusion_matrix -- dict of occurences of (true_label, pred_label)
     """
-    apply_tagger(tagger, outfilename, all_tags, trainfile, testfile)
+    apply_tagger(tagger, outfilename, all_tags, trainfile, testfile, num_workers)
     return scorer.get_confusion(testfile, outfilename)  # run the scorer on the prediction file
 
 
@@ -82,12 +120,15 @@ def apply_model(model, outfilename, word_to_ix, all_tags=None, trainfile=TRAIN_F
     applies the model on the data and writes the best sequence of tags to the outfile
     """
     if all_tags is None:
-        all_tags = set()
-
-        # this is slow
-        for i, (words, tags) in enumerate(preprocessing.conll_seq_generator(trainfile)):
-            for tag in tags:
-                all_tags.add(tag)
+        all_tags = preprocessing.get_all_tags(trainfile)
+
+    if hasattr(model, 'predict_all'):
+        # tag the whole file in batches, and write it at once
+        X = [words for words, _ in preprocessing.conll_seq_generator(testfile)]
+        with open(outfilename, 'w') as outfile:
+            outfile.write(''.join(''.join(tag + '\n' for tag in pred_tags) + '\n'
+                                  for pred_tags in model.predict_all(X, word_to_ix)))
+        return
 
     with open(outfilename, 'w') as outfile:
         for words, _ in preprocessing.conll_seq_generator(testfile):
@@ -2,13 +2,14 @@ import operator
 from collections import defaultdict, Counter
 from oswegonlp.constants import START_TAG,END_TAG, UNK
 import numpy as np
-import torch
-import torch.nn
-from torch import autograd
-from torch.autograd import Variable
+from oswegonlp import backend as backends
+
+# torch is imported only by the functions that need it: the decoders run on
+# the numpy backend without it, see backend.py
 
 def get_torch_variable(arr):
     # returns a pytorch variable of the array
+    import torch
     torch_var = torch.autograd.Variable(torch.from_numpy(np.array(arr).astype(np.float32)))
     return torch_var.view(1,-1)
 
@@ -18,11 +19,12 @@ def to_scalar(var):
 
 def argmax(vec):
     # return the argmax as a python int
+    import torch
     _, idx = torch.max(vec, 1)
     return to_scalar(idx)
 
 
-def viterbi_step(all_tags, tag_to_ix, cur_tag_scores, transition_scores, prev_scores):
+def viterbi_step(all_tags, tag_to_ix, cur_tag_scores, transition_scores, prev_scores, backend=None):
     """
     Calculates the best path score and corresponding back pointer for each tag for a word in the sentence in pytorch, which you will call from the main viterbi routine.
     
@@ -35,28 +37,29 @@ def viterbi_step(all_tags, tag_to_ix, cur_tag_scores, transition_scores, prev_sc
                         it's size is : [ len(all_tags) x len(all_tags) ] 
     - prev_scores: pytorch Variable that contains the scores for each tag for the previous token in the sentence: 
                     it's size is : [ 1 x len(all_tags) ] 
+    - backend: (optional) 'numpy' or 'torch', see backend.py
     
     :returns:
     - viterbivars: a list of pytorch Variables such that each element contains the score for each tag in all_tags for the current token in the sentence
     - bptrs: a list of idx that contains the best_previous_tag for each tag in all_tags for the current token in the sentence
     """
 
-    bptrs = []
-    viterbivars = []
-
-    # make sure end_tag exists in all_tags
-    for next_tag in list(all_tags):
-        next_tag_ix = tag_to_ix[next_tag]
-        vec = prev_scores + transition_scores[next_tag_ix, :] + cur_tag_scores[next_tag_ix]
-        best_prev_tag_ix = argmax(vec)
-        viterbivars.append(prev_scores[0, best_prev_tag_ix] + transition_scores[next_tag_ix, best_prev_tag_ix] +
-                           cur_tag_scores[next_tag_ix])
-
-        bptrs.append(best_prev_tag_ix)
+    xp = backends.get_backend(backend, like=transition_scores)
+    order = [tag_to_ix[next_tag] for next_tag in all_tags]
+    scores, best_prev_tag_ixs = _step(xp, xp.array(prev_scores).reshape(-1), xp.array(transition_scores)[order],
+                                      xp.array(cur_tag_scores).reshape(-1)[order])
+    viterbivars = list(scores)
+    bptrs = best_prev_tag_ixs.tolist()
 
     return viterbivars, bptrs
 
-def build_trellis(all_tags, tag_to_ix, cur_tag_scores, transition_scores):
+def _step(xp, prev_scores, transition_scores, cur_tag_scores):
+    # one step for all next tags at once: the best previous tag of each next tag, from a
+    # [next_tag x prev_tag] broadcast. max returns the first maximum, as argmax does
+    vecs = prev_scores.reshape(1, -1) + transition_scores + cur_tag_scores.reshape(-1, 1)
+    return xp.max(vecs, 1)
+
+def build_trellis(all_tags, tag_to_ix, cur_tag_scores, transition_scores, backend=None):
     """
     This function should compute the best_path and the path_score. 
     Use viterbi_step to implement build_trellis in viterbi.py in Pytorch.
@@ -68,32 +71,357 @@ def build_trellis(all_tags, tag_to_ix, cur_tag_scores, transition_scores):
                         it's size is : [ len(words in sequence) x len(all_tags) ] 
     - transition_scores: pytorch Variable (a matrix) that contains the tag_transition_scores
                         it's size is : [ len(all_tags) x len(all_tags) ] 
+    - backend: (optional) 'numpy' or 'torch', see backend.py
     
     :returns:
     - path_score: the score for the best_path
     - best_path: the actual best_path, which is the list of tags for each token: exclude the START_TAG and END_TAG here.
     """
     
+    xp = backends.get_backend(backend, like=transition_scores)
     ix_to_tag = {v:k for k, v in tag_to_ix.items()}
     initial_vec = np.full((1, len(all_tags)), -np.inf)
     initial_vec[0][tag_to_ix[START_TAG]] = 0
-    prev_scores = torch.autograd.Variable(torch.from_numpy(initial_vec.astype(np.float32))).view(1, -1)
-    whole_bptrs = []
+    prev_scores = xp.array(initial_vec.astype(np.float32)).reshape(-1)
 
-    for cur_tag_score in cur_tag_scores:
-        prev_scores, bptrs = viterbi_step(all_tags, tag_to_ix, cur_tag_score, transition_scores, prev_scores)
-        prev_scores = torch.autograd.Variable(torch.from_numpy(np.array(prev_scores, dtype=np.float32))).view(1, -1)
-        whole_bptrs.append(bptrs)
+    # scores and backpointers are indexed by position in all_tags, as in viterbi_step
+    order = [tag_to_ix[next_tag] for next_tag in all_tags]
+    transition_scores = xp.array(transition_scores)
+    ordered_transitions = transition_scores[order]
+    emissions = xp.stack(cur_tag_scores, len(tag_to_ix))[:, order]
+    whole_bptrs = xp.empty_index((len(emissions), len(order)))
+
+    for i in range(len(emissions)):
+        prev_scores, whole_bptrs[i] = _step(xp, prev_scores, ordered_transitions, emissions[i])
+
+    best_last_index = int(xp.argmax(prev_scores))
+    path_score = prev_scores[best_last_index] + transition_scores[tag_to_ix[END_TAG], best_last_index]
 
     best_path = []
-    best_last_index = argmax(prev_scores)
-    path_score = prev_scores[0, best_last_index] + transition_scores[tag_to_ix[END_TAG], best_last_index]
+    for bptrs in reversed(whole_bptrs.tolist()):
+        best_path.append(ix_to_tag[best_last_index])
+        best_last_index = bptrs[best_last_index]
+
+    return path_score, list(reversed(best_path))
+
+
+def build_constrained_trellis(all_tags, tag_to_ix, cur_tag_scores, transition_scores, allowed_tags=None,
+                              beam_size=None, threshold=None, backend=None):
+    """
+    build_trellis, expanding at each token only the tags that token allows, from only the states kept
+    after the previous token: at most beam_size of them, and only those that score within threshold of
+    the best state. Without allowed_tags, beam_size or threshold, the results are those of build_trellis.
+
+    parameters:
+    - all_tags, tag_to_ix, cur_tag_scores, transition_scores: as for build_trellis
+    - allowed_tags: (optional) for each token, an array of the indices (from tag_to_ix) of the tags it can take,
+                    or None to allow every tag; see hmm.compute_allowed_tags
+    - beam_size: (optional) maximum number of states kept at each token
+    - threshold: (optional) states that score more than threshold below the best state are dropped
+    - backend: (optional) 'numpy' or 'torch', see backend.py
+
+    :returns:
+    - path_score: the score for the best_path
+    - best_path: the actual best_path, which is the list of tags for each token: exclude the START_TAG and END_TAG here.
+    """
+    xp = backends.get_backend(backend, like=transition_scores)
+    ix_to_tag = {v:k for k, v in tag_to_ix.items()}
+    num_tags = len(all_tags)
+    # scores and backpointers are indexed by position in all_tags, as in build_trellis
+    order = [tag_to_ix[next_tag] for next_tag in all_tags]
+    position = np.empty(num_tags, dtype=np.int64)
+    position[order] = np.arange(num_tags)
+    transition_scores = xp.array(transition_scores)
+    ordered_transitions = transition_scores[order]
+    emissions = xp.stack(cur_tag_scores, len(tag_to_ix))[:, order]
+    all_positions = xp.arange(num_tags)
+    identity = order == list(range(num_tags))
 
-    whole_bptrs.reverse()
-    for bptrs in whole_bptrs:
+    # the active states, as their positions in increasing order, so that ties go to the first tag as in
+    # build_trellis, and their scores
+    active = xp.index_array([tag_to_ix[START_TAG]])
+    active_scores = xp.full((1,), 0)
+    whole_bptrs = xp.full_index((len(emissions), num_tags), 0)
+
+    for i in range(len(emissions)):
+        if allowed_tags is None or allowed_tags[i] is None:
+            next_tags = all_positions
+        elif identity:
+            next_tags = xp.index_array(allowed_tags[i])
+        else:
+            next_tags = xp.index_array(np.sort(position[allowed_tags[i]]))
+        # the [next_tag x prev_tag] scores of the allowed next tags from the active previous tags only
+        vecs = (active_scores.reshape(1, -1) + ordered_transitions[next_tags.reshape(-1, 1), active.reshape(1, -1)]
+                + emissions[i][next_tags].reshape(-1, 1))
+        active_scores, best_prev = xp.max(vecs, 1)
+        whole_bptrs[i, next_tags] = active[best_prev]
+        active = next_tags
+
+        if beam_size is not None or threshold is not None:
+            kept = xp.nonzero(active_scores > -np.inf)
+            if len(kept) == 0:
+                # nothing is reachable: keep every allowed state, as build_trellis does
+                continue
+            if threshold is not None:
+                kept = kept[active_scores[kept] >= active_scores[kept].max() - threshold]
+            if beam_size is not None and len(kept) > beam_size:
+                top = xp.sort_descending(active_scores[kept])[1]
+                kept = xp.sort(kept[top[:beam_size]])
+            active, active_scores = active[kept], active_scores[kept]
+
+    best = int(xp.argmax(active_scores))
+    best_last_index = int(active[best])
+    path_score = active_scores[best] + transition_scores[tag_to_ix[END_TAG], best_last_index]
+
+    best_path = []
+    for bptrs in reversed(whole_bptrs.tolist()):
         best_path.append(ix_to_tag[best_last_index])
         best_last_index = bptrs[best_last_index]
 
     return path_score, list(reversed(best_path))
 
-    
+
+def build_trellis_batch(all_tags, tag_to_ix, cur_tag_scores, lengths, transition_scores, backend=None):
+    """
+    build_trellis for a batch of sentences at once. Each step runs for the whole batch; sentences
+    that have ended carry their scores forward unchanged, so the results are those of build_trellis
+    on each sentence.
+
+    parameters:
+    - all_tags: a list of all tags: includes START_TAG and END_TAG
+    - tag_to_ix: a dictionary that maps each tag to a unique id.
+    - cur_tag_scores: pytorch tensor of emission scores, of size [ batch_size x max(lengths) x len(all_tags) ];
+                      the scores after the end of each sentence are ignored
+    - lengths: the number of tokens of each sentence
+    - transition_scores: pytorch Variable (a matrix) that contains the tag_transition_scores
+                        it's size is : [ len(all_tags) x len(all_tags) ]
+    - backend: (optional) 'numpy' or 'torch', see backend.py
+
+    :returns:
+    - path_scores: tensor of the score of the best path of each sentence
+    - best_paths: list of the best path of each sentence, as lists of tags
+    """
+    xp = backends.get_backend(backend, like=transition_scores)
+    ix_to_tag = {v:k for k, v in tag_to_ix.items()}
+    cur_tag_scores = xp.array(cur_tag_scores)
+    batch_size, max_len = cur_tag_scores.shape[0], cur_tag_scores.shape[1]
+    lengths = xp.index_array(lengths)
+    num_tags = len(all_tags)
+
+    # scores and backpointers are indexed by position in all_tags, as in build_trellis
+    order = [tag_to_ix[next_tag] for next_tag in all_tags]
+    transition_scores = xp.array(transition_scores)
+    ordered_transitions = transition_scores[order]
+    emissions = cur_tag_scores[:, :, order]
+
+    prev_scores = xp.full((batch_size, num_tags), -np.inf)
+    prev_scores[:, tag_to_ix[START_TAG]] = 0
+    whole_bptrs = xp.empty_index((max_len, batch_size, num_tags))
+    same_tag = xp.arange(num_tags).reshape(1, -1)
+
+    for i in range(max_len):
+        vecs = prev_scores.reshape(batch_size, 1, -1) + ordered_transitions + emissions[:, i].reshape(batch_size, -1, 1)
+        scores, bptrs = xp.max(vecs, 2)
+        # ended sentences keep their scores, and point back to the same tag
+        active = (lengths > i).reshape(-1, 1)
+        prev_scores = xp.where(active, scores, prev_scores)
+        whole_bptrs[i] = xp.where(active, bptrs, same_tag)
+
+    best_last_indices = xp.argmax(prev_scores, 1)
+    batch_ixs = xp.arange(batch_size)
+    path_scores = (prev_scores[batch_ixs, best_last_indices]
+                   + transition_scores[tag_to_ix[END_TAG]][best_last_indices])
+
+    path_ixs = xp.empty_index((batch_size, max_len))
+    ixs = best_last_indices
+    for i in reversed(range(max_len)):
+        path_ixs[:, i] = ixs
+        ixs = whole_bptrs[i, batch_ixs, ixs]
+
+    best_paths = [[ix_to_tag[ix] for ix in path[:length]]
+                  for path, length in zip(path_ixs.tolist(), lengths.tolist())]
+    return path_scores, best_paths
+
+
+def forward_backward_batch(all_tags, tag_to_ix, cur_tag_scores, lengths, transition_scores, backend=None):
+    """
+    The posterior probability of each tag at each token, by the forward-backward algorithm in log space,
+    for a batch of sentences at once. The scores are those of build_trellis: a path scores the sum of its
+    emission scores and its transition scores, from START_TAG and into END_TAG.
+
+    parameters:
+    - all_tags, tag_to_ix, cur_tag_scores, lengths, transition_scores: as for build_trellis_batch
+    - backend: (optional) 'numpy' or 'torch', see backend.py
+
+    :returns:
+    - log_partitions: array of the log of the summed exp scores of all the paths of each sentence
+    - posteriors: array of size [ batch_size x max(lengths) x len(all_tags) ] of the posterior probability
+                  of each tag (indexed as in tag_to_ix) at each token, 0 after the end of each sentence
+    """
+    xp = backends.get_backend(backend, like=transition_scores)
+    cur_tag_scores = xp.array(cur_tag_scores)
+    batch_size, max_len = cur_tag_scores.shape[0], cur_tag_scores.shape[1]
+    lengths = xp.index_array(lengths)
+    num_tags = len(tag_to_ix)
+    transition_scores = xp.array(transition_scores)
+    end_scores = transition_scores[tag_to_ix[END_TAG]].reshape(1, -1)
+
+    # forward: alphas[i, b, tag] is the log score of all the paths of the first i+1 tokens that end in tag
+    alpha = xp.full((batch_size, num_tags), -np.inf)
+    alpha[:, tag_to_ix[START_TAG]] = 0
+    alphas = []
+    for i in range(max_len):
+        scores = xp.logsumexp(alpha.reshape(batch_size, 1, -1) + transition_scores, 2) + cur_tag_scores[:, i]
+        # ended sentences carry their scores forward unchanged, as in build_trellis_batch
+        alpha = xp.where((lengths > i).reshape(-1, 1), scores, alpha)
+        alphas.append(alpha)
+    log_partitions = xp.logsumexp(alpha + end_scores, 1)
+
+    # backward: betas[i, b, tag] is the log score of all the paths from tag at token i to END_TAG
+    beta = end_scores + xp.full((batch_size, num_tags), 0)
+    betas = [beta] * max_len
+    for i in reversed(range(max_len - 1)):
+        next_scores = (cur_tag_scores[:, i + 1] + beta).reshape(batch_size, -1, 1)
+        scores = xp.logsumexp(transition_scores + next_scores, 1)
+        beta = xp.where((lengths - 1 > i).reshape(-1, 1), scores, beta)
+        betas[i] = beta
+
+    posteriors = xp.full((batch_size, max_len, num_tags), 0)
+    for i in range(max_len):
+        token_posteriors = xp.exp(alphas[i] + betas[i] - log_partitions.reshape(-1, 1))
+        posteriors[:, i] = xp.where((lengths > i).reshape(-1, 1), token_posteriors, 0.)
+    return log_partitions, posteriors
+
+
+def build_kbest_trellis_batch(all_tags, tag_to_ix, cur_tag_scores, lengths, transition_scores, k, backend=None):
+    """
+    The k best paths of each sentence of a batch, by list Viterbi: every tag at every token keeps its
+    k best partial paths, with back pointers to a tag and rank at the previous token.
+    Paths are ranked by their full score, including the transition into END_TAG.
+
+    parameters:
+    - all_tags, tag_to_ix, cur_tag_scores, lengths, transition_scores: as for build_trellis_batch
+    - k: number of paths
+    - backend: (optional) 'numpy' or 'torch', see backend.py
+
+    :returns:
+    - path_scores: array of size [ batch_size x k ] of the scores of the paths, in decreasing order;
+                   -inf when a sentence has fewer than k paths
+    - kbest_paths: for each sentence, the list of its (up to) k best paths, as lists of tags
+    """
+    xp = backends.get_backend(backend, like=transition_scores)
+    ix_to_tag = {ix: tag for tag, ix in tag_to_ix.items()}
+    cur_tag_scores = xp.array(cur_tag_scores)
+    batch_size, max_len = cur_tag_scores.shape[0], cur_tag_scores.shape[1]
+    lengths = xp.index_array(lengths)
+    num_tags = len(tag_to_ix)
+    transition_scores = xp.array(transition_scores)
+
+    # states are tag * k + rank, and scores[b, tag, rank] of the rank-th best partial path ending in tag
+    scores = xp.full((batch_size, num_tags, k), -np.inf)
+    scores[:, tag_to_ix[START_TAG], 0] = 0
+    whole_bptrs = xp.empty_index((max_len, batch_size, num_tags * k))
+    same_state = xp.arange(num_tags * k).reshape(1, -1)
+
+    for i in range(max_len):
+        # candidates [b, next_tag, prev_tag * k + rank]; topk takes the first of equal candidates
+        candidates = (scores.reshape(batch_size, 1, num_tags, k) + transition_scores.reshape(1, num_tags, num_tags, 1)
+                      + cur_tag_scores[:, i].reshape(batch_size, num_tags, 1, 1)).reshape(batch_size, num_tags, -1)
+        best_scores, bptrs = xp.topk(candidates, k, 2)
+        active = (lengths > i).reshape(-1, 1)
+        scores = xp.where(active.reshape(-1, 1, 1), best_scores, scores)
+        whole_bptrs[i] = xp.where(active, bptrs.reshape(batch_size, -1), same_state)
+
+    final_scores = (scores + transition_scores[tag_to_ix[END_TAG]].reshape(1, -1, 1)).reshape(batch_size, -1)
+    path_scores, states = xp.topk(final_scores, k, 1)
+
+    path_tags = xp.empty_index((batch_size, k, max_len))
+    batch_ixs = xp.arange(batch_size).reshape(-1, 1)
+    for i in reversed(range(max_len)):
+        path_tags[:, :, i] = states // k
+        states = whole_bptrs[i][batch_ixs, states]
+
+    kbest_paths = []
+    for paths, scores, length in zip(path_tags.tolist(), (path_scores > -np.inf).tolist(), lengths.tolist()):
+        kbest_paths.append([[ix_to_tag[ix] for ix in path[:length]] for path, found in zip(paths, scores) if found])
+    return path_scores, kbest_paths
+
+
+def build_trigram_trellis(all_tags, tag_to_ix, cur_tag_scores, trigram_transition_scores, beam_size=None, threshold=None,
+                          backend=None):
+    """
+    Viterbi decoding for a second-order (trigram) HMM, over states that are pairs of (previous tag, current tag).
+    At each token only the best states are kept: at most beam_size of them, and only those that
+    score within threshold of the best state. With neither, the search is exact.
+
+    parameters:
+    - all_tags: a list of all tags: includes START_TAG and END_TAG
+    - tag_to_ix: a dictionary that maps each tag to a unique id.
+    - cur_tag_scores: a list of pytorch Variables where each contains the local emission score for each tag
+                      for that particular token in the sentence, as for build_trellis
+    - trigram_transition_scores: pytorch Variable of size [ len(all_tags) x len(all_tags) x len(all_tags) ],
+                                 the score of [prev2_tag, prev_tag, next_tag], as from hmm.compute_trigram_transition_weights
+    - beam_size: (optional) maximum number of states kept at each token
+    - threshold: (optional) states that score more than threshold below the best state are dropped
+    - backend: (optional) 'numpy' or 'torch', see backend.py
+
+    :returns:
+    - path_score: the score for the best_path
+    - best_path: the actual best_path, which is the list of tags for each token: exclude the START_TAG and END_TAG here.
+    """
+    xp = backends.get_backend(backend, like=trigram_transition_scores)
+    ix_to_tag = {v:k for k, v in tag_to_ix.items()}
+    num_tags = len(tag_to_ix)
+    num_states = num_tags * num_tags
+    start_ix = tag_to_ix[START_TAG]
+    end_ix = tag_to_ix[END_TAG]
+    transition_scores = xp.array(trigram_transition_scores)
+    next_tags = xp.arange(num_tags).reshape(1, -1)
+
+    # the active states, as parallel arrays of previous tag, current tag and score
+    state_prev = xp.index_array([start_ix])
+    state_cur = xp.index_array([start_ix])
+    state_scores = xp.full((1,), 0)
+    whole_bptrs = []
+
+    for cur_tag_score in cur_tag_scores:
+        cur_tag_score = xp.array(cur_tag_score).reshape(-1)
+        # candidates [state, next_tag] move from state (prev, cur) to state (cur, next_tag)
+        candidates = state_scores.reshape(-1, 1) + transition_scores[state_prev, state_cur] + cur_tag_score.reshape(1, -1)
+        targets = (state_cur.reshape(-1, 1) * num_tags + next_tags).reshape(-1)
+        candidates = candidates.reshape(-1)
+        scores = xp.scatter_max(num_states, targets, candidates, -np.inf)
+        # backpointer: the first previous tag of the states that reach the best score
+        is_best = (candidates == scores[targets]) & (candidates > -np.inf)
+        prevs = xp.where(is_best, (state_prev.reshape(-1, 1) + 0 * next_tags).reshape(-1), num_tags)
+        bptrs = xp.scatter_min(num_states, targets, prevs, num_tags)
+        bptrs[bptrs == num_tags] = start_ix
+        whole_bptrs.append(bptrs)
+
+        # pruning
+        active = xp.nonzero(scores > -np.inf)
+        if len(active) == 0:
+            # nothing is reachable: keep every state, as build_trellis does
+            active = xp.arange(num_states)
+        active_scores = scores[active]
+        if threshold is not None:
+            keep = active_scores >= active_scores.max() - threshold
+            active, active_scores = active[keep], active_scores[keep]
+        if beam_size is not None and len(active) > beam_size:
+            active_scores, top = xp.sort_descending(active_scores)
+            active_scores, active = active_scores[:beam_size], active[top[:beam_size]]
+        state_prev = active // num_tags
+        state_cur = active % num_tags
+        state_scores = active_scores
+
+    final_scores = state_scores + transition_scores[state_prev, state_cur, end_ix]
+    best = int(xp.argmax(final_scores))
+    path_score = final_scores[best]
+    prev_ix, cur_ix = int(state_prev[best]), int(state_cur[best])
+
+    best_path = []
+    for bptrs in reversed(whole_bptrs):
+        best_path.append(ix_to_tag[cur_ix])
+        prev_ix, cur_ix = int(bptrs[prev_ix * num_tags + cur_ix]), prev_ix
+
+    return path_score, list(reversed(best_path))
@@ -0,0 +1,245 @@
+from array import array
+from collections import defaultdict
+from collections.abc import MutableMapping
+import numpy as np
+
+class WeightTable(MutableMapping):
+    """
+    Weights of a linear model, keyed by (label, feature) tuples like the defaultdict(float)
+    weights used throughout, but stored as a dense labels x features float32 array with
+    interned label and feature indices.
+
+    - weights that were never set read as default (0.0), without being inserted
+    - iteration follows insertion order, like a dict
+    - score and score_matrix compute the scores of all labels at once
+    """
+
+    def __init__(self, dtype=np.float32, default=0.):
+        self.dtype = np.dtype(dtype)
+        self.default = default
+        self.labels = []
+        self.label_to_ix = {}
+        self.features = []
+        self.feature_to_ix = {}
+        self._values = np.zeros((0, 0), dtype=self.dtype)
+        self._present = np.zeros((0, 0), dtype=bool)
+        # insertion order of the cells that are set
+        self._order_labels = array('l')
+        self._order_features = array('l')
+
+    @classmethod
+    def from_dict(cls, weights, dtype=np.float32):
+        """
+        :param weights: dict of weights keyed by (label, feature)
+        """
+        table = cls(dtype=dtype)
+        keys = list(weights.keys())
+        table.set_cells([k[0] for k in keys], [k[1] for k in keys], [weights[k] for k in keys])
+        return table
+
+    @classmethod
+    def from_matrix(cls, values, labels, features, present=None, dtype=np.float32):
+        """
+        :param values: matrix of size len(labels) x len(features)
+        :param labels: list of labels, one per row
+        :param features: list of features, one per column
+        :param present: (optional) boolean matrix of the cells to set, all cells by default
+        """
+        table = cls(dtype=dtype)
+        label_ixs = table._intern_labels(labels)
+        feature_ixs = table._intern_features(features)
+        table._reserve()
+        if present is None:
+            present = np.ones(np.shape(values), dtype=bool)
+        rows, cols = np.nonzero(present)
+        table._set_ixs(label_ixs[rows], feature_ixs[cols], np.asarray(values)[rows, cols])
+        return table
+
+    def _intern(self, items, item_to_ix, strings):
+        ixs = np.empty(len(items), dtype=np.int_)
+        for i, item in enumerate(items):
+            ix = item_to_ix.get(item)
+            if ix is None:
+                ix = item_to_ix[item] = len(strings)
+                strings.append(item)
+            ixs[i] = ix
+        return ixs
+
+    def _intern_labels(self, labels):
+        return self._intern(labels, self.label_to_ix, self.labels)
+
+    def _intern_features(self, features):
+        return self._intern(features, self.feature_to_ix, self.features)
+
+    def _reserve(self):
+        # grow the arrays geometrically, so that adding weights one at a time is amortized O(1)
+        num_labels, num_features = len(self.labels), len(self.features)
+        cap_labels, cap_features = self._values.shape
+        if num_labels > cap_labels or num_features > cap_features:
+            new_shape = (max(num_labels, 2 * cap_labels if num_labels > cap_labels else cap_labels),
+                         max(num_features, 2 * cap_features if num_features > cap_features else cap_features))
+            values = np.zeros(new_shape, dtype=self.dtype)
+            values[:cap_labels, :cap_features] = self._values
+            present = np.zeros(new_shape, dtype=bool)
+            present[:cap_labels, :cap_features] = self._present
+            self._values, self._present = values, present
+
+    def _set_ixs(self, label_ixs, feature_ixs, values):
+        new = ~self._present[label_ixs, feature_ixs]
+        if new.any():
+            # a cell that is set twice in one call is only recorded once
+            new_cells = label_ixs[new] * self._values.shape[1] + feature_ixs[new]
+            _, first = np.unique(new_cells, return_index=True)
+            first.sort()
+            self._order_labels.extend(label_ixs[new][first].tolist())
+            self._order_features.extend(feature_ixs[new][first].tolist())
+        self._values[label_ixs, feature_ixs] = values
+        self._present[label_ixs, feature_ixs] = True
+
+    def set_cells(self, labels, features, values):
+        """
+        set many weights at once
+
+        :param labels: list of labels
+        :param features: list of features, same length
+        :param values: list or array of weights, same length
+        """
+        label_ixs = self._intern_labels(labels)
+        feature_ixs = self._intern_features(features)
+        self._reserve()
+        self._set_ixs(label_ixs, feature_ixs, np.asarray(values, dtype=self.dtype))
+
+    @property
+    def weights(self):
+        """
+        :returns: the len(labels) x len(features) weight matrix, with 0 for weights that are not set
+        """
+        return self._values[:len(self.labels), :len(self.features)]
+
+    @property
+    def present(self):
+        """
+        :returns: boolean len(labels) x len(features) matrix of the weights that are set
+        """
+        return self._present[:len(self.labels), :len(self.features)]
+
+    # dict facade
+
+    def _lookup(self, key):
+        try:
+            label, feature = key
+        except (TypeError, ValueError):
+            raise KeyError(key)
+        label_ix = self.label_to_ix.get(label)
+        feature_ix = self.feature_to_ix.get(feature)
+        if label_ix is None or feature_ix is None:
+            return None
+        return label_ix, feature_ix
+
+    def __getitem__(self, key):
+        ixs = self._lookup(key)
+        if ixs is None or not self._present[ixs]:
+            return self.default
+        return float(self._values[ixs])
+
+    def __contains__(self, key):
+        ixs = self._lookup(key)
+        return ixs is not None and bool(self._present[ixs])
+
+    def __setitem__(self, key, value):
+        label, feature = key
+        self.set_cells([label], [feature], [value])
+
+    def __delitem__(self, key):
+        ixs = self._lookup(key)
+        if ixs is None or not self._present[ixs]:
+            raise KeyError(key)
+        self._present[ixs] = False
+        self._values[ixs] = 0
+        keep = [i for i, cell in enumerate(zip(self._order_labels, self._order_features)) if cell != ixs]
+        self._order_labels = array('l', [self._order_labels[i] for i in keep])
+        self._order_features = array('l', [self._order_features[i] for i in keep])
+
+    def __iter__(self):
+        labels, features = self.labels, self.features
+        for label_ix, feature_ix in zip(self._order_labels, self._order_features):
+            yield labels[label_ix], features[feature_ix]
+
+    def __len__(self):
+        return len(self._order_labels)
+
+    def __repr__(self):
+        return 'WeightTable(%d labels, %d features, %d weights)' % (len(self.labels), len(self.features), len(self))
+
+    def to_dict(self):
+        """
+        :returns: defaultdict(float) with the same weights
+        """
+        weights = defaultdict(float)
+        weights.update(self.items())
+        return weights
+
+    def to_dense(self, label_to_ix, feature_to_ix, default=0., out=None):
+        """
+        scatter the weights into a matrix indexed by other label and feature indices
+
+        :param label_to_ix: dict mapping labels to rows; weights of other labels are left out
+        :param feature_to_ix: dict mapping features to columns; weights of other features are left out
+        :param default: value of the cells without a weight, when out is not given
+        :param out: (optional) matrix to write the weights into; its other cells are left as they are
+        :returns: matrix with out[label_to_ix[label], feature_to_ix[feature]] = self[(label, feature)]
+        """
+        if out is None:
+            out = np.full((len(label_to_ix), len(feature_to_ix)), default, dtype=self.dtype)
+        row_labels = [label for label in label_to_ix if label in self.label_to_ix]
+        col_features = [feature for feature in feature_to_ix if feature in self.feature_to_ix]
+        label_ixs = [self.label_to_ix[label] for label in row_labels]
+        feature_ixs = [self.feature_to_ix[feature] for feature in col_features]
+        cells = np.ix_(label_ixs, feature_ixs)
+        rows, cols = np.nonzero(self._present[cells])
+        out[np.array([label_to_ix[label] for label in row_labels], dtype=np.int_)[rows],
+            np.array([feature_to_ix[feature] for feature in col_features], dtype=np.int_)[cols]] = self._values[cells][rows, cols]
+        return out
+
+    # vectorized scoring
+
+    def _label_ixs(self, labels):
+        if labels is None:
+            return np.arange(len(self.labels)), np.ones(len(self.labels), dtype=bool)
+        label_ixs = np.array([self.label_to_ix.get(label, -1) for label in labels], dtype=np.int_)
+        return np.maximum(label_ixs, 0), label_ixs >= 0
+
+    def score(self, features, labels=None):
+        """
+        score a base feature vector for many labels at once, as classifier_base.compute_score
+        does for one label: features without a weight contribute nothing
+
+        :param features: dict of base features and counts
+        :param labels: (optional) list of labels, all labels by default
+        :returns: array of scores, one per label; 0 for unknown labels
+        """
+        label_ixs, known = self._label_ixs(labels)
+        feature_ixs = []
+        counts = []
+        for feature, count in features.items():
+            ix = self.feature_to_ix.get(feature)
+            if ix is not None:
+                feature_ixs.append(ix)
+                counts.append(count)
+        scores = self._values[np.ix_(label_ixs, feature_ixs)].astype(np.float64) @ np.asarray(counts, dtype=np.float64)
+        scores[~known] = 0
+        return scores
+
+    def score_matrix(self, X, labels=None):
+        """
+        score many base feature vectors for many labels with one matrix product
+
+        :param X: sparse matrix of base feature counts, one row per instance and one
+                  column per entry of feature_to_ix (see classifier_base.make_design_matrix)
+        :param labels: (optional) list of labels, all labels by default
+        :returns: dense matrix of size X.shape[0] x len(labels); 0 for unknown labels
+        """
+        label_ixs, known = self._label_ixs(labels)
+        scores = np.asarray(X @ self.weights[label_ixs].T.astype(np.float64))
+        scores[:, ~known] = 0
+        return scores
@@ -0,0 +1,74 @@
+from nose.tools import ok_, eq_, assert_raises
+import subprocess
+import sys
+import numpy as np
+import torch
+from oswegonlp.constants import DEV_FILE, START_TAG, END_TAG
+from oswegonlp import backend, hmm, viterbi, preprocessing
+
+def random_weights(rng, length, num_tags):
+    emissions = rng.randn(length, num_tags).astype(np.float32)
+    emissions[:, [0, num_tags - 1]] = -np.inf
+    transitions = rng.randn(num_tags, num_tags).astype(np.float32)
+    transitions[0] = -np.inf
+    return emissions, transitions
+
+def test_backends_decode_identically():
+    rng = np.random.RandomState(0)
+    all_tags = [START_TAG, 'A', 'B', 'C', END_TAG]
+    tag_to_ix = {tag: ix for ix, tag in enumerate(all_tags)}
+    for length in [0, 1, 6]:
+        emissions, transitions = random_weights(rng, length, len(all_tags))
+        np_score, np_path = viterbi.build_trellis(all_tags, tag_to_ix, list(emissions), transitions)
+        ok_(isinstance(np_score, np.floating))
+        torch_score, torch_path = viterbi.build_trellis(all_tags, tag_to_ix, [torch.from_numpy(e) for e in emissions],
+                                                        torch.from_numpy(transitions))
+        ok_(isinstance(torch_score, torch.Tensor))
+        eq_(np_path, torch_path)
+        eq_(np_score, torch_score.item())
+
+    lengths = [3, 1, 5]
+    emissions = rng.randn(len(lengths), max(lengths), len(all_tags)).astype(np.float32)
+    np_scores, np_paths = viterbi.build_trellis_batch(all_tags, tag_to_ix, emissions, lengths, transitions)
+    torch_scores, torch_paths = viterbi.build_trellis_batch(all_tags, tag_to_ix, emissions, lengths, transitions,
+                                                            backend='torch')
+    eq_(np_paths, torch_paths)
+    ok_(np.array_equal(np_scores, torch_scores.numpy()))
+
+    trigram_transitions = rng.randn(*(len(all_tags),) * 3).astype(np.float32)
+    for beam_size in [None, 2]:
+        results = [viterbi.build_trigram_trellis(all_tags, tag_to_ix, list(emissions[2]), trigram_transitions,
+                                                 beam_size=beam_size, backend=name) for name in ['numpy', 'torch']]
+        eq_(results[0][1], results[1][1])
+        eq_(results[0][0], results[1][0].item())
+
+def test_select_backend():
+    eq_(backend.get_backend().name, 'numpy')
+    eq_(backend.get_backend(like=torch.zeros(1)).name, 'torch')
+    eq_(backend.get_backend('numpy', like=torch.zeros(1)).name, 'numpy')
+    backend.set_backend('torch')
+    try:
+        eq_(backend.get_backend(like=np.zeros(1)).name, 'torch')
+        eq_(backend.get_backend('numpy').name, 'numpy')
+    finally:
+        backend.set_backend(None)
+    assert_raises(ValueError, backend.get_backend, 'cupy')
+    assert_raises(ValueError, backend.set_backend, 'cupy')
+
+def test_hmm_model_backends():
+    model = hmm.HMMModel.from_file(DEV_FILE, .01)
+    ok_(isinstance(model.emission_probs, np.ndarray))
+    sentences = [words for words, _ in preprocessing.conll_seq_generator(DEV_FILE, max_insts=100)]
+    tagged = model.tag_batch(sentences)
+    model.backend = 'torch'
+    eq_(model.tag_batch(sentences), tagged)
+    eq_([model.tag(words) for words in sentences[:20]], tagged[:20])
+
+def test_numpy_decoding_does_not_import_torch():
+    script = ("import sys\n"
+              "from oswegonlp import hmm\n"
+              "model = hmm.HMMModel.from_file(%r, .01)\n"
+              "model.tag(['they', 'can', 'fish'])\n"
+              "model.tag_batch([['they', 'can'], ['fish']])\n"
+              "print('torch' in sys.modules)\n" % DEV_FILE)
+    eq_(subprocess.check_output([sys.executable, '-c', script]).decode().strip(), 'False')
@@ -0,0 +1,62 @@
+from nose.tools import ok_, eq_, assert_raises
+import numpy as np
+import torch
+from oswegonlp import batching, bilstm
+import toy_corpus
+
+def test_bucket_batch_sampler():
+    lengths = np.random.RandomState(0).randint(0, 30, size=500)
+    sampler = batching.BucketBatchSampler(lengths, 16, seed=3, bucket_size=64)
+    batches = list(sampler)
+    eq_(len(batches), len(sampler))
+    eq_(sorted(i for batch in batches for i in batch), np.flatnonzero(lengths > 0).tolist())
+    ok_(all(len(batch) <= 16 for batch in batches))
+    # sorting by length within buckets cuts down on padding
+    non_empty = np.flatnonzero(lengths > 0)
+    consecutive = [non_empty[i:i + 16] for i in range(0, len(non_empty), 16)]
+    padded = sum(len(batch) * lengths[batch].max() for batch in batches)
+    ok_(padded < .7 * sum(len(batch) * lengths[batch].max() for batch in consecutive))
+
+    eq_(list(sampler), batches)
+    sampler.set_epoch(1)
+    ok_(list(sampler) != batches)
+    sampler.set_epoch(0)
+    eq_(list(sampler), batches)
+    eq_(list(batching.BucketBatchSampler(lengths, 16, seed=3, bucket_size=64)), batches)
+
+    # the shards of the ranks are of the same size, and interleave into the batches, with the first repeated
+    shards = [list(batching.BucketBatchSampler(lengths, 16, seed=3, bucket_size=64, rank=rank, num_replicas=4))
+              for rank in range(4)]
+    eq_([len(shard) for shard in shards], [-(-len(batches) // 4)] * 4)
+    eq_(len(batching.BucketBatchSampler(lengths, 16, seed=3, bucket_size=64, num_replicas=4)), len(shards[0]))
+    eq_([shards[i % 4][i // 4] for i in range(4 * len(shards[0]))], (batches + batches)[:4 * len(shards[0])])
+
+def test_background():
+    eq_(list(batching.background(iter(range(10)), 2)), list(range(10)))
+
+    def failing():
+        yield 1
+        raise KeyError('failed')
+    items = batching.background(failing(), 2)
+    eq_(next(items), 1)
+    assert_raises(KeyError, next, items)
+
+def test_batch_loader():
+    toy_X, toy_Y, small_word_to_ix, small_tag_to_ix = toy_corpus.toy_corpus()
+    # sentences of 0 to 4 copies of a toy sentence
+    X = [toy_X[i % 5] * (i % 5) for i in range(40)]
+    Y = [toy_Y[i % 5] * (i % 5) for i in range(40)]
+    corpus = bilstm.TensorizedCorpus(X, small_word_to_ix, Y, small_tag_to_ix)
+    sampler = batching.BucketBatchSampler(corpus.lengths, 4, seed=1)
+    for num_workers in [0, 2]:
+        loader = batching.BatchLoader(corpus, 4, seed=1, num_workers=num_workers)
+        for epoch in [0, 1]:
+            loader.set_epoch(epoch)
+            sampler.set_epoch(epoch)
+            batches = list(loader)
+            eq_(len(batches), len(sampler))
+            for (words, tags, lengths), indices in zip(batches, sampler):
+                expected = corpus.batch(indices)
+                ok_(torch.equal(words, expected[0]))
+                ok_(torch.equal(tags, expected[1]))
+                ok_(torch.equal(lengths, expected[2]))
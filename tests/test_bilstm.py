@@ -3,6 +3,10 @@ import torch
 from oswegonlp.constants import * 
 from oswegonlp import preprocessing, bilstm, hmm, viterbi, most_common, scorer
 import numpy as np
+import os
+import shutil
+import tempfile
+import toy_corpus
 
 def setup():
     global word_to_ix, tag_to_ix, X_tr, Y_tr, model, embedding_dim
@@ -57,3 +61,73 @@ def test_bilstm_test_accuracy():
     confusion = scorer.get_confusion(DEV_FILE,'bilstm-te-en.preds')
     acc = scorer.accuracy(confusion)
     ok_(acc > .83) 
+
+def test_tensorized_corpus():
+    X, Y, small_word_to_ix, small_tag_to_ix = toy_corpus.toy_corpus()
+    X, Y = X[:2] + [[]], Y[:2] + [[]]
+    corpus = bilstm.TensorizedCorpus(X, small_word_to_ix, Y, small_tag_to_ix)
+    eq_(len(corpus), 3)
+    for (words, tags), x, y in zip(corpus, X, Y):
+        eq_(words.tolist(), bilstm.prepare_sequence(x, small_word_to_ix).tolist())
+        eq_(tags.tolist(), bilstm.prepare_sequence(y, small_tag_to_ix).tolist())
+    # slices share the flat tensor's storage
+    eq_(corpus[1][0].data_ptr(), corpus.words.data_ptr() + 3 * corpus.words.element_size())
+
+def test_batch_forward():
+    X, Y, small_word_to_ix, small_tag_to_ix = toy_corpus.toy_corpus()
+    X, Y = X[:3], Y[:3]
+    corpus = bilstm.TensorizedCorpus(X, small_word_to_ix, Y, small_tag_to_ix)
+    words, tags, lengths = corpus.batch([2, 0, 1])
+    eq_(lengths.tolist(), [4, 3, 1])
+    eq_(words.tolist(), [[3, 2, 1, 0], [0, 1, 2, 0], [2, 0, 0, 0]])
+    eq_(tags.tolist(), [[3, 3, 1, 0], [0, 1, 2, 0], [3, 0, 0, 0]])
+
+    # a batch of one sentence draws the same initial state as the sentence alone
+    small_model = toy_corpus.toy_model()
+    torch.manual_seed(1)
+    single = small_model(corpus[0][0])
+    one_words, _, one_lengths = corpus.batch([0])
+    torch.manual_seed(1)
+    ok_(torch.equal(small_model(one_words, one_lengths)[0], single))
+
+    # from zero initial states, padding does not change the scores of the sentences
+    lstm_feats = small_model._forward_batch(words, lengths, zero_state=True)
+    eq_(tuple(lstm_feats.shape), (3, 4, len(small_tag_to_ix)))
+    for row, i in enumerate([2, 0, 1]):
+        ok_(torch.allclose(lstm_feats[row, :lengths[row]], toy_corpus.zero_state_scores(small_model, corpus[i][0]),
+                           atol=1e-6))
+
+    _, losses, _ = bilstm.train_model(torch.nn.CrossEntropyLoss(), small_model, X + [[]], Y + [[]],
+                                      small_word_to_ix, small_tag_to_ix, num_its=3, status_frequency=0, batch_size=2)
+    eq_(len(losses), 3)
+
+def test_predict_all():
+    X, _, small_word_to_ix, _ = toy_corpus.toy_corpus()
+    X = X[:1] + [[]] + X[1:3]
+    small_model = toy_corpus.toy_model()
+    predicted = small_model.predict_all(X, small_word_to_ix, batch_size=2)
+    eq_([len(tags) for tags in predicted], [len(words) for words in X])
+    eq_(small_model.predict_all(X, small_word_to_ix), predicted)
+
+    # the same as each sentence alone, from zero initial states
+    for words, tags in zip(X, predicted):
+        if words:
+            scores = toy_corpus.zero_state_scores(small_model, bilstm.prepare_sequence(words, small_word_to_ix))
+            eq_([small_model.ix_to_tag[ix] for ix in scores.argmax(dim=1).tolist()], tags)
+
+def test_train_model_dev_accuracy():
+    X, Y, small_word_to_ix, small_tag_to_ix = toy_corpus.toy_corpus()
+    tmp_dir = tempfile.mkdtemp()
+    params = []
+    for X_dv, Y_dv in [(None, None), (X, Y)]:
+        small_model = toy_corpus.toy_model()
+        _, _, accuracies = bilstm.train_model(torch.nn.CrossEntropyLoss(), small_model, X, Y, small_word_to_ix,
+                                              small_tag_to_ix, X_dv, Y_dv, num_its=2, status_frequency=0,
+                                              param_file=os.path.join(tmp_dir, 'best.params'))
+        params.append(small_model.state_dict())
+    shutil.rmtree(tmp_dir)
+    # the dev accuracy is that of predict_all, and evaluating does not change the course of training
+    predicted = small_model.predict_all(X, small_word_to_ix)
+    eq_(accuracies[-1], np.mean([p == y for tags, y_tags in zip(predicted, Y) for p, y in zip(tags, y_tags)]))
+    for name, value in params[0].items():
+        ok_(torch.equal(params[1][name], value))
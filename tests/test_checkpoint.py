@@ -0,0 +1,86 @@
+from nose.tools import ok_, eq_, assert_raises
+import os
+import shutil
+import tempfile
+import torch
+from oswegonlp import bilstm, checkpoint
+import toy_corpus
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+def test_resume():
+    X, Y, small_word_to_ix, small_tag_to_ix = toy_corpus.toy_corpus()
+
+    def train(num_its, run_dir, resume=False, **train_args):
+        # a new model, initialized from the current random state
+        return bilstm.train_model(torch.nn.CrossEntropyLoss(), toy_corpus.toy_model(seed=None), X * 3, Y * 3,
+                                  small_word_to_ix, small_tag_to_ix, X, Y, num_its=num_its, status_frequency=0,
+                                  param_file=os.path.join(run_dir or tmp_dir, 'best.params'),
+                                  optim_args={'lr': .3, 'momentum': .9},
+                                  checkpoint_dir=os.path.join(run_dir, 'checkpoints') if run_dir is not None else None,
+                                  keep_checkpoints=2, resume=resume, **train_args)
+
+    for i, train_args in enumerate([{}, {'batch_size': 3}, {'batch_size': 3, 'num_workers': 2}]):
+        torch.manual_seed(765)
+        model, losses, accuracies = train(5, os.path.join(tmp_dir, str(i), 'full'), **train_args)
+
+        # stop after 2 epochs, and resume, from a different initial model and random state
+        run_dir = os.path.join(tmp_dir, str(i), 'resumed')
+        checkpoint_dir = os.path.join(run_dir, 'checkpoints')
+        torch.manual_seed(765)
+        train(2, run_dir, **train_args)
+        eq_(sorted(os.listdir(checkpoint_dir)), ['best.pt', 'checkpoint-0001.pt', 'checkpoint-0002.pt'])
+        torch.manual_seed(1)
+        resumed, resumed_losses, resumed_accuracies = train(5, run_dir, resume=True, **train_args)
+        eq_(resumed_losses, losses)
+        eq_(resumed_accuracies, accuracies)
+        for name, value in model.state_dict().items():
+            ok_(torch.equal(resumed.state_dict()[name], value))
+
+        # the last checkpoints and the best one are kept
+        eq_(sorted(os.listdir(checkpoint_dir)), ['best.pt', 'checkpoint-0004.pt', 'checkpoint-0005.pt'])
+        best = torch.load(os.path.join(checkpoint_dir, 'best.pt'), weights_only=False)
+        eq_(best['epoch'], accuracies.index(max(accuracies)) + 1)
+        state = torch.load(os.path.join(run_dir, 'best.params'), weights_only=False)
+        eq_(sorted(state), ['accuracy', 'epoch', 'state_dict'])
+        eq_((state['epoch'], state['accuracy']), (best['epoch'], max(accuracies)))
+        for name, value in best['state_dict'].items():
+            ok_(torch.equal(state['state_dict'][name], value))
+
+    assert_raises(ValueError, train, 1, None, resume=True)
+
+    # a checkpoint of a run with two ranks
+    run_dir = os.path.join(tmp_dir, 'ranks')
+    train(1, run_dir)
+    state = checkpoint.CheckpointManager(os.path.join(run_dir, 'checkpoints')).load_latest()
+    state['rng_state'] = state['rng_state'] * 2
+    checkpoint.atomic_save(state, os.path.join(run_dir, 'checkpoints', 'checkpoint-0001.pt'))
+    assert_raises(ValueError, train, 2, run_dir, resume=True)
+
+def test_checkpoint_manager():
+    checkpoint_dir = os.path.join(tmp_dir, 'checkpoints')
+    manager = checkpoint.CheckpointManager(checkpoint_dir, keep_last=2)
+    eq_(manager.latest(), None)
+    eq_(manager.load_latest(), None)
+    weights = torch.zeros(3)
+    for epoch in range(1, 4):
+        manager.save({'epoch': epoch, 'weights': weights})
+        # the snapshot is taken before save returns
+        weights += 1
+    manager.wait()
+    eq_(manager.epochs(), [2, 3])
+    eq_(manager.latest(), os.path.join(checkpoint_dir, 'checkpoint-0003.pt'))
+    eq_(manager.load_latest()['weights'].tolist(), [2, 2, 2])
+    manager.close()
+
+    # with keep_last=0, only the best checkpoint is kept
+    manager = checkpoint.CheckpointManager(checkpoint_dir, keep_last=0)
+    manager.save({'epoch': 4, 'weights': weights}, best=True)
+    manager.close()
+    eq_(manager.epochs(), [])
+    eq_(sorted(os.listdir(checkpoint_dir)), [checkpoint.BEST_CHECKPOINT])
@@ -0,0 +1,31 @@
+from nose.tools import ok_, eq_, assert_almost_equal
+from collections import Counter, defaultdict
+import numpy as np
+from oswegonlp.constants import OFFSET, DEV_FILE
+from oswegonlp import classifier_base, naive_bayes, preprocessing
+
+def test_predict_all_matches_predict():
+    sentences = list(preprocessing.conll_seq_generator(DEV_FILE, max_insts=400))
+    x = [Counter(words) for words, _ in sentences]
+    y = [tags[0] for _, tags in sentences]
+    weights = naive_bayes.estimate_nb(x[:300], y[:300], .1)
+    labels = list(set(y)) + ['UNSEEN']
+    for w in [weights, weights.to_dict()]:
+        y_hat, scores = classifier_base.predict_all(x[300:], w, labels, batch_size=32)
+        eq_(scores.shape, (100, len(labels)))
+        for i, x_i in enumerate(x[300:]):
+            label, label_scores = classifier_base.predict(x_i, w, labels)
+            eq_(y_hat[i], label)
+            for l, label in enumerate(sorted(labels)):
+                assert_almost_equal(scores[i, l], label_scores[label], places=4)
+
+def test_predict_all_ties():
+    weights = defaultdict(float)
+    weights[('b', 'fish')] = 1.
+    weights[('c', 'fish')] = 1.
+    weights[('a', OFFSET)] = 1.
+    weights[('c', OFFSET)] = 1.
+    x = [{'fish': 1}, {}, {'boat': 2}, {'fish': 1, OFFSET: 0}]
+    y_hat, _ = classifier_base.predict_all(x, weights, ['c', 'b', 'a'])
+    eq_(y_hat, [classifier_base.predict(x_i, weights, ['c', 'b', 'a'])[0] for x_i in x])
+    eq_(y_hat, ['c', 'a', 'a', 'b'])
@@ -0,0 +1,43 @@
+from nose.tools import ok_, eq_
+import os
+import shutil
+import tempfile
+from oswegonlp.constants import DEV_FILE, TEST_FILE_UNLABELED
+from oswegonlp import corpus_cache, preprocessing
+
+def copy_to_tmp(filename):
+    tmpdir = tempfile.mkdtemp()
+    tmp_file = os.path.join(tmpdir, os.path.basename(filename))
+    shutil.copy(filename, tmp_file)
+    return tmp_file
+
+def test_compiled_corpus_matches_text():
+    tmp_file = copy_to_tmp(DEV_FILE)
+    ok_(corpus_cache.load_corpus(tmp_file) is None)
+
+    expected = list(preprocessing.conll_seq_generator(tmp_file))
+    corpus = corpus_cache.compile_corpus(tmp_file)
+    ok_(corpus_cache.is_fresh(tmp_file))
+    eq_(len(corpus), len(expected))
+    eq_(list(preprocessing.conll_seq_generator(tmp_file)), expected)
+    eq_(list(preprocessing.conll_seq_generator(tmp_file, max_insts=5)), expected[:5])
+
+    word_ids, tag_ids = next(corpus_cache.id_seq_generator(tmp_file))
+    eq_([corpus.word_strings[w] for w in word_ids], expected[0][0])
+    eq_([corpus.tag_strings[t] for t in tag_ids], expected[0][1])
+
+def test_unlabeled_file_tags():
+    tmp_file = copy_to_tmp(TEST_FILE_UNLABELED)
+    expected = list(preprocessing.conll_seq_generator(tmp_file))
+    corpus_cache.compile_corpus(tmp_file)
+    eq_(list(preprocessing.conll_seq_generator(tmp_file)), expected)
+
+def test_stale_cache_is_ignored():
+    tmp_file = copy_to_tmp(DEV_FILE)
+    corpus_cache.compile_corpus(tmp_file)
+    with open(tmp_file, 'a') as fout:
+        fout.write("1\tappended\tappended\tNOUN\tNN\t_\t0\troot\t_\t_\n\n")
+    ok_(not corpus_cache.is_fresh(tmp_file))
+    words, tags = list(preprocessing.conll_seq_generator(tmp_file))[-1]
+    eq_(words, ['appended'])
+    eq_(tags, ['NOUN'])
@@ -0,0 +1,118 @@
+from nose.tools import ok_, eq_, assert_almost_equal, assert_raises
+from collections import defaultdict, Counter
+import numpy as np
+from oswegonlp.constants import DEV_FILE, START_TAG, END_TAG
+from oswegonlp import corpus_stats, most_common, preprocessing, naive_bayes, hmm
+
+def test_views_match_streaming_counts():
+    tag_word_counts = defaultdict(Counter)
+    trans_counts = defaultdict(Counter)
+    for words, tags in preprocessing.conll_seq_generator(DEV_FILE):
+        for word, tag in zip(words, tags):
+            tag_word_counts[tag][word] += 1
+        for prev_tag, tag in zip([START_TAG] + tags, tags + [END_TAG]):
+            trans_counts[prev_tag][tag] += 1
+
+    stats = corpus_stats.CorpusStats.from_file(DEV_FILE)
+    eq_(dict(stats.tag_word_counts()), dict(tag_word_counts))
+    eq_(stats.tag_word_counts()['NOUN'].most_common(5), tag_word_counts['NOUN'].most_common(5))
+    eq_(stats.tag_trans_counts(), dict(trans_counts))
+    eq_(list(stats.tag_trans_counts()), list(trans_counts))
+    eq_(stats.all_tags(), set(tag_word_counts))
+
+def test_most_common_uses_corpus_stats():
+    vocab, word_to_ix = most_common.get_word_to_ix(DEV_FILE, max_size=100)
+    eq_(len(vocab), 100)
+    eq_(word_to_ix[vocab[0]], 0)
+    tag_to_ix, ix_to_tag = most_common.get_tag_to_ix(DEV_FILE)
+    eq_(sorted(tag_to_ix), sorted(preprocessing.get_all_tags(DEV_FILE)))
+    ok_(corpus_stats.get_corpus_stats(DEV_FILE) is corpus_stats.get_corpus_stats(DEV_FILE))
+
+def test_add_sentences_grows_tagset():
+    stats = corpus_stats.CorpusStats.from_sentences([(['they', 'fish'], ['PRON', 'VERB'])])
+    stats.add_sentences([(['fish'], ['NOUN'])])
+    eq_(stats.tag_trans_counts(), {START_TAG: Counter({'PRON': 1, 'NOUN': 1}),
+                                   'PRON': Counter({'VERB': 1}),
+                                   'VERB': Counter({END_TAG: 1}),
+                                   'NOUN': Counter({END_TAG: 1})})
+    eq_(stats.tag_word_counts()['NOUN'], Counter({'fish': 1}))
+
+def check_weights(stats, sentences, smoothing):
+    docs = [{word: 1} for words, _ in sentences for word in words]
+    labels = [tag for _, tags in sentences for tag in tags]
+    expected = naive_bayes.estimate_nb(docs, labels, smoothing)
+    actual = stats.nb_weights(smoothing)
+    eq_(set(actual), set(expected))
+    for key in expected:
+        assert_almost_equal(actual[key], expected[key], places=10)
+
+    expected = hmm.compute_transition_weights(corpus_stats.CorpusStats.from_sentences(sentences).tag_trans_counts(),
+                                              smoothing)
+    actual = stats.transition_weights(smoothing)
+    eq_(set(actual), set(expected))
+    for key in expected:
+        if expected[key] == -np.inf:
+            eq_(actual[key], -np.inf)
+        else:
+            assert_almost_equal(actual[key], expected[key], places=10)
+
+def test_incremental_weights():
+    sentences = list(preprocessing.conll_seq_generator(DEV_FILE, max_insts=300))
+    stats = corpus_stats.CorpusStats.from_sentences(sentences[:100])
+    check_weights(stats, sentences[:100], .01)
+    stats.add_sentences(sentences[100:200])
+    check_weights(stats, sentences[:200], .01)
+    stats.merge(corpus_stats.CorpusStats.from_sentences(sentences[200:]))
+    check_weights(stats, sentences, .01)
+    stats.subtract(corpus_stats.CorpusStats.from_sentences(sentences[:150]))
+    check_weights(stats, sentences[150:], .01)
+    check_weights(stats, sentences[150:], 1.)
+
+def test_subtract_rejects_unknown_counts():
+    stats = corpus_stats.CorpusStats.from_sentences([(['they', 'fish'], ['PRON', 'VERB'])])
+    assert_raises(ValueError, stats.subtract, corpus_stats.CorpusStats.from_sentences([(['fish'], ['NOUN'])]))
+    assert_raises(ValueError, stats.subtract, corpus_stats.CorpusStats.from_sentences([(['fish', 'fish'], ['VERB', 'VERB'])]))
+
+def test_subtract_forgets_emptied_words_and_tags():
+    sentences = list(preprocessing.conll_seq_generator(DEV_FILE, max_insts=300))
+    a = corpus_stats.CorpusStats.from_sentences(sentences[:100])
+    b = corpus_stats.CorpusStats.from_sentences(sentences[100:] + [(['no-such-word'], ['NO-SUCH-TAG'])])
+    expected = corpus_stats.CorpusStats.from_sentences(sentences[:100])
+    a.merge(b).subtract(b)
+    eq_(a.word_to_ix(), expected.word_to_ix())
+    eq_(a.tag_to_ix(), expected.tag_to_ix())
+    eq_(a.all_tags(), expected.all_tags())
+    eq_(dict(a.tag_word_counts()), dict(expected.tag_word_counts()))
+    eq_(dict(a.most_common_weights()), dict(expected.most_common_weights()))
+
+def test_derived_matrices_do_not_change():
+    stats = corpus_stats.CorpusStats.from_sentences([(['they', 'fish'], ['PRON', 'VERB']), (['fish'], ['NOUN'])])
+    transitions = stats.transition_log_probs(.1)
+    emissions = stats.emission_log_probs(.1)
+    before = transitions.copy(), emissions.copy()
+    # the same words and tags, so the matrices are updated rather than rebuilt
+    stats.add_sentences([(['fish', 'fish'], ['NOUN', 'VERB'])])
+    ok_(not np.array_equal(stats.transition_log_probs(.1), before[0]))
+    ok_(not np.array_equal(stats.emission_log_probs(.1), before[1]))
+    ok_(np.array_equal(transitions, before[0]))
+    ok_(np.array_equal(emissions, before[1]))
+
+def test_add_sentences_skips_empty_sentences():
+    expected = {START_TAG: Counter({'Z': 1}), 'Z': Counter({END_TAG: 1})}
+    eq_(corpus_stats.CorpusStats.from_sentences([([], []), (['z'], ['Z'])]).tag_trans_counts(), expected)
+    stats = corpus_stats.CorpusStats.from_sentences([(['z'], ['Z']), ([], [])])
+    eq_(stats.tag_trans_counts(), expected)
+    eq_(stats.num_sentences, 1)
+
+def test_derived_matrices_follow_swapped_vocabulary():
+    stats = corpus_stats.CorpusStats.from_sentences([(['a', 'b'], ['N', 'V']), (['c'], ['D']), (['z'], ['J'])])
+    stats.subtract(corpus_stats.CorpusStats.from_sentences([(['z'], ['J'])]))
+    stats.emission_log_probs(.1)
+    stats.transition_log_probs(.1)
+    # c and D go, z and J come back: as many words and tags as before, but not the same ones
+    stats.subtract(corpus_stats.CorpusStats.from_sentences([(['c'], ['D'])]))
+    stats.merge(corpus_stats.CorpusStats.from_sentences([(['z'], ['J'])]))
+    emissions = stats.emission_log_probs(.1)
+    ok_(np.isneginf(emissions[stats.word_to_id['c']]).all())
+    ok_(np.isfinite(emissions[stats.word_to_id['z'], stats.tag_to_id['J']]))
+    check_weights(stats, [(['a', 'b'], ['N', 'V']), (['z'], ['J'])], .1)
@@ -0,0 +1,35 @@
+from nose.tools import ok_, eq_
+import os
+import shutil
+import tempfile
+import torch
+from oswegonlp import distributed
+import toy_corpus
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+def test_train_distributed():
+    X, Y, small_word_to_ix, small_tag_to_ix = toy_corpus.toy_corpus()
+    small_model = toy_corpus.toy_model()
+    initial = {name: value.clone() for name, value in small_model.state_dict().items()}
+    param_file = os.path.join(tmp_dir, 'best.params')
+
+    model, losses, accuracies = distributed.train_distributed(
+        2, torch.nn.CrossEntropyLoss(), small_model, X * 4, Y * 4, small_word_to_ix, small_tag_to_ix, X, Y,
+        num_its=5, status_frequency=0, batch_size=2, param_file=param_file, optim_args={'lr': .5, 'momentum': 0})
+    ok_(model is small_model)
+    eq_(len(losses), 5)
+    ok_(losses[-1] < losses[0])
+    eq_(len(accuracies), 5)
+    ok_(any(not torch.equal(value, initial[name]) for name, value in model.state_dict().items()))
+
+    # rank 0 wrote the best parameters
+    state = torch.load(param_file, weights_only=False)
+    eq_(sorted(state), ['accuracy', 'epoch', 'state_dict'])
+    eq_(state['accuracy'], max(accuracies))
+    eq_(state['epoch'], accuracies.index(max(accuracies)) + 1)
@@ -0,0 +1,108 @@
+from nose.tools import ok_, eq_, assert_raises
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from oswegonlp.constants import DEV_FILE, END_TAG, UNK
+from oswegonlp import hmm, arrayfile, corpus_stats, most_common, naive_bayes, preprocessing, tagger_base
+
+def test_save_and_load():
+    model_file = os.path.join(tempfile.mkdtemp(), 'dev.hmm')
+    model = hmm.HMMModel.from_file(DEV_FILE, .01)
+    model.save(model_file)
+    loaded = hmm.HMMModel.load(model_file)
+    ok_(isinstance(loaded.emission_probs, np.memmap))
+    ok_(np.array_equal(loaded.emission_probs, model.emission_probs))
+    ok_(np.array_equal(loaded.tag_transition_probs, model.tag_transition_probs))
+    eq_(loaded.vocab, model.vocab)
+    eq_(loaded.tag_to_ix, model.tag_to_ix)
+    eq_(loaded.smoothing, .01)
+    eq_(loaded.meta, model.meta)
+
+    # the same weights as the step-by-step construction
+    tag_trans_counts = most_common.get_tag_trans_counts(DEV_FILE)
+    all_tags = list(tag_trans_counts.keys()) + [END_TAG]
+    eq_(loaded.all_tags, all_tags)
+    vocab, word_to_ix = most_common.get_word_to_ix(DEV_FILE)
+    emission_probs, tag_transition_probs = hmm.compute_weights_variables(
+        naive_bayes.get_nb_weights(DEV_FILE, .01), hmm.compute_transition_weights(tag_trans_counts, .01),
+        vocab, word_to_ix, {tag: ix for ix, tag in enumerate(all_tags)})
+    ok_(np.array_equal(loaded.emission_probs, emission_probs.numpy()))
+    ok_(np.array_equal(loaded.tag_transition_probs, tag_transition_probs.numpy()))
+
+    words = ['they', 'can', 'can', 'no-such-word', '.']
+    eq_(loaded.tag(words), model.tag(words))
+    eq_(pickle.loads(pickle.dumps(loaded))(words, None), model.tag(words))
+
+    arrayfile.save(model_file, {}, meta={'kind': 'hmm', 'model_version': hmm.MODEL_FORMAT_VERSION + 1})
+    assert_raises(ValueError, hmm.HMMModel.load, model_file)
+
+def test_load_or_train():
+    tmp_dir = tempfile.mkdtemp()
+    train_file = os.path.join(tmp_dir, 'train.conllu')
+    model_file = train_file + hmm.MODEL_SUFFIX
+    with open(train_file, 'w') as fout:
+        fout.write("1\tthey\tthey\tPRON\t_\t_\t0\troot\t_\t_\n2\tfish\tfish\tVERB\t_\t_\t1\tobj\t_\t_\n\n")
+    model = hmm.load_or_train(model_file, train_file, .1)
+    eq_(model.filename, model_file)
+    eq_(model.tag(['they', 'fish']), ['PRON', 'VERB'])
+    mtime = os.path.getmtime(model_file)
+    eq_(hmm.load_or_train(model_file, train_file, .1).vocab, model.vocab)
+    eq_(os.path.getmtime(model_file), mtime)
+
+    with open(train_file, 'a') as fout:
+        fout.write("1\tfish\tfish\tNOUN\t_\t_\t0\troot\t_\t_\n\n")
+    model = hmm.load_or_train(model_file, train_file, .1)
+    ok_('NOUN' in model.tag_to_ix)
+    eq_(hmm.load_or_train(model_file, train_file, 1.).smoothing, 1.)
+
+def test_tag_batch():
+    model = hmm.HMMModel.from_file(DEV_FILE, .01)
+    sentences = [words for words, _ in preprocessing.conll_seq_generator(DEV_FILE, max_insts=300)]
+    eq_(model.tag_batch(sentences), [model.tag(words) for words in sentences])
+    eq_(model.tag_batch([]), [])
+    preds_file = os.path.join(tempfile.mkdtemp(), 'hmm.preds')
+    tagger_base.apply_tagger(model, preds_file, model.all_tags, testfile=DEV_FILE)
+    tagged = [model.tag(words) for words, _ in preprocessing.conll_seq_generator(DEV_FILE, max_insts=5)]
+    eq_(open(preds_file).read().split('\n\n')[:5], ['\n'.join(tags) for tags in tagged])
+
+def test_tag_dictionary():
+    stats = corpus_stats.CorpusStats.from_sentences([(['they', 'can', 'fish'], ['PRON', 'AUX', 'VERB']),
+                                                     (['they', 'fish'], ['PRON', 'VERB']),
+                                                     (['fish', 'can'], ['NOUN', 'AUX'])])
+    eq_(stats.tag_dictionary(), {'they': ['PRON'], 'can': ['AUX'], 'fish': ['VERB', 'NOUN']})
+    eq_(stats.tag_dictionary(3), {'fish': ['VERB', 'NOUN']})
+
+    model = hmm.HMMModel.from_file(DEV_FILE, .01, tag_dict_min_count=2)
+    allowed = model.allowed_tags[model.word_to_ix['the']]
+    ok_(allowed[model.tag_to_ix['DET']])
+    ok_(allowed.sum() < len(model.all_tags) - 2)
+    eq_(model.allowed_tags[model.word_to_ix[UNK]].sum(), len(model.all_tags) - 2)
+    sentences = [words for words, _ in preprocessing.conll_seq_generator(DEV_FILE, max_insts=300)]
+    tagged = [model.tag(words) for words in sentences]
+    eq_(model.tag_batch(sentences), tagged)
+    for words, tags in zip(sentences, tagged):
+        for word, tag in zip(words, tags):
+            ok_(model.allowed_tags[model.word_to_ix.get(word, model.word_to_ix[UNK]), model.tag_to_ix[tag]])
+
+    model_file = os.path.join(tempfile.mkdtemp(), 'dev.hmm')
+    model.save(model_file)
+    loaded = hmm.HMMModel.load(model_file)
+    ok_(np.array_equal(loaded.allowed_tags, model.allowed_tags))
+    eq_(loaded.tag_batch(sentences), tagged)
+    loaded.beam_size = 2
+    eq_([len(tags) for tags in loaded.tag_batch(sentences)], [len(words) for words in sentences])
+
+def test_tag_posteriors_and_kbest():
+    model = hmm.HMMModel.from_file(DEV_FILE, .01)
+    sentences = [words for words, _ in preprocessing.conll_seq_generator(DEV_FILE, max_insts=100)]
+    posteriors = model.tag_posteriors(sentences)
+    kbest = model.tag_kbest(sentences, 3)
+    for words, tag_posteriors, paths in zip(sentences, posteriors, kbest):
+        eq_(tag_posteriors.shape, (len(words), len(model.all_tags)))
+        ok_(np.allclose(tag_posteriors.sum(axis=1), 1, atol=1e-3))
+        eq_(len(paths), 3)
+        eq_(len(set(tuple(path) for path in paths)), 3)
+    model.backend = 'torch'
+    eq_(model.tag_kbest(sentences, 3), kbest)
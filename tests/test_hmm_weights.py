@@ -0,0 +1,33 @@
+from nose.tools import ok_, eq_
+import numpy as np
+from oswegonlp.constants import DEV_FILE, START_TAG, END_TAG, UNK
+from oswegonlp import hmm, most_common, naive_bayes, corpus_stats, preprocessing
+
+def test_weights_from_weight_tables_and_dicts():
+    nb_weights = naive_bayes.get_nb_weights(DEV_FILE, .01)
+    hmm_trans_weights = hmm.compute_transition_weights(most_common.get_tag_trans_counts(DEV_FILE), .01)
+    vocab, word_to_ix = most_common.get_word_to_ix(DEV_FILE)
+    tag_to_ix = {tag: ix for ix, tag in enumerate([START_TAG] + sorted(preprocessing.get_all_tags(DEV_FILE)) + [END_TAG])}
+    emission, transition = hmm.compute_weights_variables(nb_weights, hmm_trans_weights, vocab, word_to_ix, tag_to_ix)
+    emission_d, transition_d = hmm.compute_weights_variables(nb_weights.to_dict(), hmm_trans_weights.to_dict(),
+                                                             vocab, word_to_ix, tag_to_ix)
+    ok_(np.array_equal(emission.numpy(), emission_d.numpy()))
+    ok_(np.array_equal(transition.numpy(), transition_d.numpy()))
+
+    eq_(emission[word_to_ix['the'], tag_to_ix['DET']].item(), np.float32(nb_weights[('DET', 'the')]))
+    eq_(emission[word_to_ix[UNK], tag_to_ix['NOUN']].item(), 0)
+    eq_(emission[word_to_ix['the'], tag_to_ix[END_TAG]].item(), -np.inf)
+    eq_(transition[tag_to_ix['NOUN'], tag_to_ix['DET']].item(), np.float32(hmm_trans_weights[('NOUN', 'DET')]))
+    eq_(transition[tag_to_ix[START_TAG], tag_to_ix['DET']].item(), -np.inf)
+    eq_(transition[tag_to_ix['DET'], tag_to_ix[END_TAG]].item(), -np.inf)
+
+def test_weights_from_stats():
+    stats = corpus_stats.CorpusStats.from_sentences(preprocessing.conll_seq_generator(DEV_FILE, max_insts=500))
+    vocab, word_to_ix = most_common.get_word_to_ix(DEV_FILE)
+    tag_to_ix = {tag: ix for ix, tag in enumerate(sorted(preprocessing.get_all_tags(DEV_FILE)) + [END_TAG, START_TAG])}
+    for smoothing in [.01, 1.]:
+        expected = hmm.compute_weights_variables(stats.nb_weights(smoothing), stats.transition_weights(smoothing),
+                                                 vocab, word_to_ix, tag_to_ix)
+        actual = hmm.compute_weights_variables_from_stats(stats, smoothing, vocab, word_to_ix, tag_to_ix)
+        for e, a in zip(expected, actual):
+            ok_(np.array_equal(e.numpy(), a.numpy()))
@@ -1,5 +1,6 @@
 from nose.tools import with_setup, ok_, eq_, assert_almost_equal, nottest
-from oswegonlp.constants import TRAIN_FILE, DEV_FILE
+from collections import Counter
+from oswegonlp.constants import TRAIN_FILE, DEV_FILE, OFFSET
 from oswegonlp import most_common, classifier_base, preprocessing, scorer, tagger_base
 
 #1.1a (0.5 points)
@@ -9,6 +10,27 @@ def test_get_top_noun_tags():
     actual = tag_word_counts["NOUN"].most_common(3)
     eq_ (expected, actual, msg="UNEQUAL Expected:%s, Actual:%s" %(expected, actual))
 
+def test_most_common_weights_from_count_matrix():
+    tag_word_counts = Counter()
+    tag_counts = Counter()
+    for words, tags in preprocessing.conll_seq_generator(DEV_FILE):
+        tag_word_counts.update(zip(tags, words))
+        tag_counts.update(tags)
+
+    weights = most_common.get_most_common_word_weights(DEV_FILE)
+    eq_({k: v for k, v in weights.items() if k[1] != OFFSET}, dict(tag_word_counts))
+    eq_({k[0]: v for k, v in weights.items() if k[1] == OFFSET}, dict(tag_counts))
+
+    stats = most_common.get_most_common_word_weights(DEV_FILE, as_dict=False)
+    eq_(stats.word_tag_counts.shape, (len(stats.words), len(tag_counts)))
+    eq_(stats.word_tag_counts.sum(), sum(tag_counts.values()))
+
+    # the stats are a copy, so updating them leaves the counts of later calls alone
+    stats.add_sentences([(['fish'], ['NOUN'])])
+    eq_(most_common.get_most_common_word_weights(DEV_FILE), weights)
+    eq_(most_common.get_most_common_word_weights(DEV_FILE, as_dict=False).word_tag_counts.sum(),
+        sum(tag_counts.values()))
+
 #1.1b
 def test_get_top_verb_tags():
     expected = [('have', 749), ('get', 359), ('know', 338)]
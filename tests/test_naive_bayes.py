@@ -0,0 +1,42 @@
+from nose.tools import ok_, eq_, assert_almost_equal
+from collections import Counter
+import numpy as np
+from oswegonlp.constants import OFFSET, DEV_FILE
+from oswegonlp import naive_bayes, preprocessing, classifier_base
+
+def setup_data():
+    x = [Counter(words) for words, _ in preprocessing.conll_seq_generator(DEV_FILE, max_insts=500)]
+    y = [tags[0] for _, tags in preprocessing.conll_seq_generator(DEV_FILE, max_insts=500)]
+    return x, y
+
+def test_estimate_nb_matches_estimate_pxy():
+    x, y = setup_data()
+    vocab = set(word for x_i in x for word in x_i)
+    weights = naive_bayes.estimate_nb(x, y, .1)
+    eq_(len(weights), len(set(y)) * (len(vocab) + 1))
+    for label in ['PRON', 'DET']:
+        pxy = naive_bayes.estimate_pxy(x, y, label, .1, vocab)
+        for word in ['the', 'I', 'fish']:
+            assert_almost_equal(weights[(label, word)], pxy[word], places=5)
+        assert_almost_equal(weights[(label, OFFSET)], np.log(y.count(label) / len(y)), places=5)
+
+def test_estimate_nb_matrix():
+    x, y = setup_data()
+    weights = naive_bayes.estimate_nb(x, y, .1)
+    log_pxy, log_py, labels, vocab = naive_bayes.estimate_nb(x, y, .1, return_matrix=True)
+    eq_(log_pxy.shape, (len(labels), len(vocab)))
+    for l, label in enumerate(labels):
+        assert_almost_equal(np.exp(log_pxy[l]).sum(), 1, places=6)
+        assert_almost_equal(log_py[l], weights[(label, OFFSET)], places=5)
+        assert_almost_equal(log_pxy[l, vocab.index('the')], weights[(label, 'the')], places=5)
+
+def test_find_best_smoother():
+    x, y = setup_data()
+    x_tr, y_tr, x_dv, y_dv = x[:400], y[:400], x[400:], y[400:]
+    alphas = [.01, .1, 1., 10.]
+    best, scores = naive_bayes.find_best_smoother(x_tr, y_tr, x_dv, y_dv, alphas)
+    for alpha in alphas:
+        weights = naive_bayes.estimate_nb(x_tr, y_tr, alpha)
+        preds = [classifier_base.predict(x_i, weights, set(y_dv))[0] for x_i in x_dv]
+        assert_almost_equal(scores[alpha], np.mean(np.array(preds) == np.array(y_dv)))
+    eq_(scores[best], max(scores.values()))
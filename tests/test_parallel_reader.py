@@ -0,0 +1,40 @@
+from nose.tools import ok_, eq_
+import os
+import tempfile
+from oswegonlp.constants import DEV_FILE, NR_DEV_FILE
+from oswegonlp import parallel_reader, preprocessing, corpus_stats, most_common, tagger_base
+
+def test_shards_cover_file_at_sentence_boundaries():
+    shards = parallel_reader.find_shards(DEV_FILE, 7)
+    eq_(shards[0][0], 0)
+    eq_(shards[-1][1], os.path.getsize(DEV_FILE))
+    for (_, end), (start, _) in zip(shards[:-1], shards[1:]):
+        eq_(end, start)
+    expected = list(preprocessing.conll_seq_generator(DEV_FILE))
+    actual = []
+    for start, end in shards:
+        actual += parallel_reader.read_shard(DEV_FILE, start, end)
+    eq_(actual, expected)
+
+def test_parallel_seq_generator():
+    expected = list(preprocessing.conll_seq_generator(NR_DEV_FILE))
+    eq_(list(parallel_reader.parallel_seq_generator(NR_DEV_FILE, num_workers=3)), expected)
+    eq_(list(parallel_reader.parallel_seq_generator(NR_DEV_FILE, num_workers=2, max_insts=10)), expected[:10])
+
+def test_parallel_corpus_stats():
+    expected = corpus_stats.CorpusStats.from_file(DEV_FILE)
+    actual = parallel_reader.parallel_corpus_stats(DEV_FILE, num_workers=3)
+    eq_(actual.words, expected.words)
+    eq_(actual.tags, expected.tags)
+    ok_((actual.word_tag_counts == expected.word_tag_counts).all())
+    eq_(actual.tag_trans_counts(), expected.tag_trans_counts())
+    eq_(list(actual.tag_word_counts()['NOUN']), list(expected.tag_word_counts()['NOUN']))
+
+def test_parallel_apply_tagger():
+    tagger = tagger_base.make_classifier_tagger(most_common.get_noun_weights())
+    all_tags = preprocessing.get_all_tags(DEV_FILE)
+    outdir = tempfile.mkdtemp()
+    serial = tagger_base.eval_tagger(tagger, os.path.join(outdir, 'serial.preds'), all_tags, testfile=DEV_FILE)
+    parallel = tagger_base.eval_tagger(tagger, os.path.join(outdir, 'parallel.preds'), all_tags,
+                                       testfile=DEV_FILE, num_workers=2)
+    eq_(serial, parallel)
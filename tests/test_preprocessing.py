@@ -0,0 +1,24 @@
+from nose.tools import ok_, eq_
+from oswegonlp.constants import DEV_FILE, TEST_FILE_UNLABELED, UNK
+from oswegonlp import preprocessing
+
+def test_column_generator_matches_conll_seq_generator():
+    expected = list(preprocessing.conll_seq_generator(DEV_FILE, use_cache=False))
+    eq_(list(preprocessing.conll_column_generator(DEV_FILE)), expected)
+    eq_([words for (words,) in preprocessing.conll_column_generator(DEV_FILE, ('FORM',), max_insts=20)],
+        [words for words, _ in expected[:20]])
+
+def test_column_generator_extra_columns():
+    lemmas, feats = next(preprocessing.conll_column_generator(DEV_FILE, ('LEMMA', 'FEATS')))
+    eq_(lemmas[:4], ['from', 'the', 'AP', 'come'])
+    eq_(feats[1], 'Definite=Def|PronType=Art')
+
+def test_load_columns():
+    expected = list(preprocessing.conll_seq_generator(TEST_FILE_UNLABELED, use_cache=False))
+    offsets, column_data = preprocessing.load_columns(TEST_FILE_UNLABELED, ('FORM', 'UPOS'))
+    word_ids, word_strings = column_data['FORM']
+    tag_ids, tag_strings = column_data['UPOS']
+    eq_(len(offsets), len(expected) + 1)
+    eq_(tag_strings, [UNK])
+    for i in [0, 17, len(expected) - 1]:
+        eq_([word_strings[w] for w in word_ids[offsets[i]:offsets[i + 1]]], expected[i][0])
@@ -0,0 +1,33 @@
+from nose.tools import ok_, eq_
+import os
+import pickle
+import shutil
+import tempfile
+from oswegonlp.constants import DEV_FILE
+from oswegonlp import sentence_index, preprocessing
+
+def setup_index():
+    tmp_file = os.path.join(tempfile.mkdtemp(), 'dev.conllu')
+    shutil.copy(DEV_FILE, tmp_file)
+    return tmp_file, sentence_index.SentenceIndex(tmp_file)
+
+def test_random_access():
+    tmp_file, index = setup_index()
+    expected = list(preprocessing.conll_seq_generator(tmp_file))
+    eq_(len(index), len(expected))
+    eq_(index[0], expected[0])
+    eq_(index[-1], expected[-1])
+    eq_(index.get(123), expected[123])
+    eq_(index[10:20], expected[10:20])
+    eq_(index.get_many([5, 3, 400]), [expected[5], expected[3], expected[400]])
+    eq_(pickle.loads(pickle.dumps(index)).get(7), expected[7])
+
+def test_index_is_persisted_and_invalidated():
+    tmp_file, index = setup_index()
+    ok_(sentence_index.is_fresh(tmp_file))
+    eq_(len(sentence_index.SentenceIndex(tmp_file)), len(index))
+    with open(tmp_file, 'a') as fout:
+        fout.write("1\tappended\tappended\tNOUN\tNN\t_\t0\troot\t_\t_\n")
+    ok_(not sentence_index.is_fresh(tmp_file))
+    index = sentence_index.SentenceIndex(tmp_file)
+    eq_(index[-1], (['appended'], ['NOUN']))
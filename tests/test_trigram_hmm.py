@@ -0,0 +1,87 @@
+from nose.tools import ok_, eq_, assert_almost_equal
+import itertools
+import os
+import shutil
+import numpy as np
+import torch
+from oswegonlp.constants import DEV_FILE, START_TAG, END_TAG
+from oswegonlp import hmm, viterbi, preprocessing
+
+def copy_dev_file(tmp_path):
+    # counting reads the text file, and must not leave a compiled corpus next to it
+    dev_file = str(tmp_path / os.path.basename(DEV_FILE))
+    shutil.copy(DEV_FILE, dev_file)
+    return dev_file
+
+def test_trigram_counts(tmp_path):
+    tag_ids = np.array([0, 1, 1, 2, 0])
+    offsets = np.array([0, 3, 3, 5])
+    counts = hmm.compute_trigram_counts(tag_ids, offsets, 3)
+    S = E = 3
+    expected = {(S, S, 0): 1, (S, 0, 1): 1, (0, 1, 1): 1, (1, 1, E): 1,
+                (S, S, 2): 1, (S, 2, 0): 1, (2, 0, E): 1}
+    eq_(counts.sum(), sum(expected.values()))
+    for cell, count in expected.items():
+        eq_(counts[cell], count)
+
+    dev_file = copy_dev_file(tmp_path)
+    tags, counts = hmm.get_trigram_counts(dev_file)
+    eq_(os.listdir(str(tmp_path)), [os.path.basename(DEV_FILE)])
+    sentences = list(preprocessing.conll_seq_generator(dev_file))
+    eq_(counts.sum(), sum(len(tags) + 1 for _, tags in sentences))
+    eq_(counts[len(tags), len(tags)].sum(), len(sentences))
+
+def test_trigram_weights(tmp_path):
+    tags, counts = hmm.get_trigram_counts(copy_dev_file(tmp_path))
+    lambdas = hmm.deleted_interpolation(counts)
+    assert_almost_equal(lambdas.sum(), 1)
+    ok_((lambdas > 0).all())
+    all_tags = [START_TAG] + tags + [END_TAG]
+    tag_to_ix = {tag: ix for ix, tag in enumerate(all_tags)}
+    weights = hmm.compute_trigram_transition_weights(counts, tags, tag_to_ix, lambdas).numpy()
+    # a distribution over next tags for every context, with no transitions into START_TAG
+    probs = np.exp(weights[tag_to_ix['DET'], tag_to_ix['NOUN']])
+    assert_almost_equal(probs.sum(), 1, places=5)
+    eq_(probs[tag_to_ix[START_TAG]], 0)
+    ok_(weights[tag_to_ix['DET'], tag_to_ix['NOUN'], tag_to_ix['VERB']] >
+        weights[tag_to_ix['DET'], tag_to_ix['NOUN'], tag_to_ix['DET']])
+
+def brute_force(all_tags, tag_to_ix, emissions, transitions):
+    tags = [tag for tag in all_tags if tag not in (START_TAG, END_TAG)]
+    best = None
+    for path in itertools.product(tags, repeat=len(emissions)):
+        ixs = [tag_to_ix[START_TAG]] * 2 + [tag_to_ix[tag] for tag in path] + [tag_to_ix[END_TAG]]
+        score = sum(emissions[i][ixs[i + 2]] for i in range(len(path)))
+        score += sum(transitions[ixs[i], ixs[i + 1], ixs[i + 2]] for i in range(len(ixs) - 2))
+        if best is None or score > best[0]:
+            best = (score, list(path))
+    return best
+
+def test_trigram_viterbi_is_exact_without_pruning():
+    rng = np.random.RandomState(0)
+    all_tags = [START_TAG, 'A', 'B', 'C', END_TAG]
+    tag_to_ix = {tag: ix for ix, tag in enumerate(all_tags)}
+    for length in [1, 2, 5]:
+        emissions = rng.randn(length, len(all_tags)).astype(np.float32)
+        emissions[:, [0, 4]] = -np.inf
+        transitions = rng.randn(*(len(all_tags),) * 3).astype(np.float32)
+        transitions[:, :, 0] = -np.inf
+        score, path = viterbi.build_trigram_trellis(all_tags, tag_to_ix, [torch.from_numpy(e) for e in emissions],
+                                                    torch.from_numpy(transitions))
+        expected_score, expected_path = brute_force(all_tags, tag_to_ix, emissions, transitions)
+        eq_(path, expected_path)
+        assert_almost_equal(score.item(), expected_score, places=4)
+        eq_(len(viterbi.build_trigram_trellis(all_tags, tag_to_ix, [torch.from_numpy(e) for e in emissions],
+                                              torch.from_numpy(transitions), beam_size=1, threshold=0.)[1]), length)
+
+def test_trigram_model(tmp_path):
+    model = hmm.HMMModel.from_file(copy_dev_file(tmp_path), .01, order=2)
+    eq_(model.trigram_transition_probs.shape, (len(model.all_tags),) * 3)
+    words = ['They', 'can', 'fish', '.']
+    eq_(len(model.tag(words)), len(words))
+    model_file = str(tmp_path / 'dev.hmm')
+    model.save(model_file)
+    loaded = hmm.HMMModel.load(model_file)
+    ok_(np.array_equal(loaded.trigram_transition_probs, model.trigram_transition_probs))
+    eq_(loaded.meta['order'], 2)
+    eq_(loaded.tag(words), model.tag(words))
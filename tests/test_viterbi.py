@@ -145,3 +145,101 @@ def test_build_trellis():
     
     eq_(best_path,['NOUN', 'VERB', 'VERB', 'NOUN', 'VERB', 'NOUN'])
 
+
+def test_build_trellis_matches_brute_force():
+    import itertools
+    rng = np.random.RandomState(0)
+    tags = [START_TAG, 'NOUN', 'VERB', 'ADJ', END_TAG]
+    tag_to_ix = {tag: ix for ix, tag in enumerate(tags)}
+    for length in [0, 1, 4]:
+        emissions = torch.from_numpy(rng.randn(length, len(tags)).astype(np.float32))
+        emissions[:, [0, 4]] = -np.inf
+        transitions = torch.from_numpy(rng.randn(len(tags), len(tags)).astype(np.float32))
+        # build_trellis picks the last tag before adding its transition to END_TAG
+        transitions[4] = -1
+        path_score, best_path = viterbi.build_trellis(tags, tag_to_ix, list(emissions), transitions)
+        best = None
+        for path in itertools.product(['NOUN', 'VERB', 'ADJ'], repeat=length):
+            ixs = [0] + [tag_to_ix[tag] for tag in path] + [4]
+            score = sum(emissions[i, ixs[i + 1]].item() for i in range(length))
+            score += sum(transitions[ixs[i + 1], ixs[i]].item() for i in range(length + 1))
+            if best is None or score > best[0]:
+                best = (score, list(path))
+        assert_almost_equal(path_score.item(), best[0], places=4)
+        eq_(best_path, best[1])
+
+def test_build_trellis_batch():
+    rng = np.random.RandomState(1)
+    tags = [START_TAG, 'NOUN', 'VERB', 'ADJ', END_TAG]
+    tag_to_ix = {tag: ix for ix, tag in enumerate(tags)}
+    transitions = torch.from_numpy(rng.randn(len(tags), len(tags)).astype(np.float32))
+    lengths = [3, 0, 7, 1, 7]
+    emissions = torch.from_numpy(rng.randn(len(lengths), max(lengths), len(tags)).astype(np.float32))
+    emissions[:, :, [0, 4]] = -np.inf
+    path_scores, best_paths = viterbi.build_trellis_batch(tags, tag_to_ix, emissions, lengths, transitions)
+    eq_(len(best_paths), len(lengths))
+    for i, length in enumerate(lengths):
+        path_score, best_path = viterbi.build_trellis(tags, tag_to_ix, list(emissions[i, :length]), transitions)
+        eq_(best_paths[i], best_path)
+        eq_(path_scores[i].item(), path_score.item())
+
+def test_build_constrained_trellis():
+    rng = np.random.RandomState(2)
+    tags = [START_TAG, 'NOUN', 'VERB', 'ADJ', END_TAG]
+    tag_to_ix = {tag: ix for ix, tag in enumerate(tags)}
+    transitions = torch.from_numpy(rng.randn(len(tags), len(tags)).astype(np.float32))
+    emissions = torch.from_numpy(rng.randn(6, len(tags)).astype(np.float32))
+    emissions[:, [0, 4]] = -np.inf
+    path_score, best_path = viterbi.build_trellis(tags, tag_to_ix, list(emissions), transitions)
+    constrained_score, constrained_path = viterbi.build_constrained_trellis(tags, tag_to_ix, list(emissions), transitions)
+    eq_(constrained_path, best_path)
+    eq_(constrained_score.item(), path_score.item())
+
+    # constraining the tags is the same as giving the other tags an emission score of -inf
+    allowed_tags = [[1], None, [2, 3], [1, 3], [2], None]
+    masked = emissions.clone()
+    for i, allowed in enumerate(allowed_tags):
+        if allowed is not None:
+            masked[i, [ix for ix in [1, 2, 3] if ix not in allowed]] = -np.inf
+    path_score, best_path = viterbi.build_trellis(tags, tag_to_ix, list(masked), transitions)
+    constrained_score, constrained_path = viterbi.build_constrained_trellis(tags, tag_to_ix, list(emissions),
+                                                                            transitions, allowed_tags)
+    eq_(constrained_path, best_path)
+    eq_(constrained_score.item(), path_score.item())
+
+    _, greedy_path = viterbi.build_constrained_trellis(tags, tag_to_ix, list(emissions), transitions, beam_size=1)
+    eq_(len(greedy_path), len(emissions))
+    _, pruned_path = viterbi.build_constrained_trellis(tags, tag_to_ix, list(emissions), transitions, threshold=0.)
+    eq_(pruned_path, greedy_path)
+
+def test_forward_backward_and_kbest_match_brute_force():
+    import itertools
+    rng = np.random.RandomState(3)
+    tags = [START_TAG, 'NOUN', 'VERB', 'ADJ', END_TAG]
+    tag_to_ix = {tag: ix for ix, tag in enumerate(tags)}
+    transitions = torch.from_numpy(rng.randn(len(tags), len(tags)).astype(np.float32))
+    lengths = [3, 0, 4, 1]
+    emissions = torch.from_numpy(rng.randn(len(lengths), max(lengths), len(tags)).astype(np.float32))
+    emissions[:, :, [0, 4]] = -np.inf
+    log_partitions, posteriors = viterbi.forward_backward_batch(tags, tag_to_ix, emissions, lengths, transitions)
+    path_scores, kbest_paths = viterbi.build_kbest_trellis_batch(tags, tag_to_ix, emissions, lengths, transitions, 5)
+    for b, length in enumerate(lengths):
+        paths = []
+        for path in itertools.product(['NOUN', 'VERB', 'ADJ'], repeat=length):
+            ixs = [0] + [tag_to_ix[tag] for tag in path] + [4]
+            score = sum(emissions[b, i, ixs[i + 1]].item() for i in range(length))
+            score += sum(transitions[ixs[i + 1], ixs[i]].item() for i in range(length + 1))
+            paths.append((score, list(path)))
+        scores = np.array([score for score, _ in paths])
+        log_partition = np.log(np.exp(scores - scores.max()).sum()) + scores.max()
+        assert_almost_equal(log_partitions[b].item(), log_partition, places=4)
+        expected = np.zeros((max(lengths), len(tags)))
+        for score, path in paths:
+            for i, tag in enumerate(path):
+                expected[i, tag_to_ix[tag]] += np.exp(score - log_partition)
+        ok_(np.allclose(posteriors[b].numpy(), expected, atol=1e-5))
+
+        best = sorted(paths, key=lambda path: -path[0])[:5]
+        eq_(kbest_paths[b], [path for _, path in best])
+        ok_(np.allclose(path_scores[b, :len(best)].numpy(), [score for score, _ in best], atol=1e-4))
+        ok_((path_scores[b, len(best):] == -np.inf).all())
@@ -0,0 +1,58 @@
+from nose.tools import ok_, eq_, assert_almost_equal, assert_raises
+from collections import defaultdict, Counter
+import numpy as np
+from oswegonlp.constants import OFFSET, DEV_FILE
+from oswegonlp.weight_table import WeightTable
+from oswegonlp import classifier_base, most_common, preprocessing, tagger_base
+
+def test_dict_facade():
+    weights = WeightTable()
+    weights[('NOUN', 'fish')] = 2.
+    weights[('VERB', 'fish')] = 3.
+    weights[('NOUN', OFFSET)] = .5
+    eq_(len(weights), 3)
+    eq_(list(weights), [('NOUN', 'fish'), ('VERB', 'fish'), ('NOUN', OFFSET)])
+    eq_(weights[('VERB', 'fish')], 3.)
+    eq_(weights[('VERB', OFFSET)], 0.)
+    eq_(weights[('ADJ', 'red')], 0.)
+    ok_(('VERB', OFFSET) not in weights)
+    ok_(('NOUN', OFFSET) in weights)
+    eq_(len(weights), 3)
+    del weights[('NOUN', 'fish')]
+    eq_(dict(weights), {('VERB', 'fish'): 3., ('NOUN', OFFSET): .5})
+    assert_raises(KeyError, weights.__delitem__, ('NOUN', 'fish'))
+    weights[('NOUN', 'fish')] = 1.
+    eq_(list(weights)[-1], ('NOUN', 'fish'))
+    eq_(weights.weights.shape, (2, 2))
+
+def test_from_dict_round_trip():
+    expected = defaultdict(float)
+    for i in range(50):
+        expected[('tag%d' % (i % 7), 'word%d' % i)] = i / 4.
+    expected[('tag0', OFFSET)] = -np.inf
+    weights = WeightTable.from_dict(expected)
+    eq_(list(weights.items()), list(expected.items()))
+    eq_(weights.to_dict(), expected)
+
+def test_score_matches_compute_score():
+    weights = most_common.get_most_common_word_weights(DEV_FILE)
+    ok_(isinstance(weights, WeightTable))
+    old_weights = weights.to_dict()
+    labels = sorted(weights.labels) + ['UNSEEN']
+    sentences = list(preprocessing.conll_seq_generator(DEV_FILE, max_insts=50))
+    x = [Counter(words) for words, _ in sentences]
+    X, _ = classifier_base.make_design_matrix(x, weights.feature_to_ix)
+    score_matrix = weights.score_matrix(X, labels)
+    for i, x_i in enumerate(x):
+        scores = weights.score(dict(x_i, **{OFFSET: 1}), labels)
+        for l, label in enumerate(labels):
+            expected = classifier_base.compute_score(x_i, label, old_weights)
+            assert_almost_equal(scores[l], expected, places=4)
+            assert_almost_equal(score_matrix[i, l] + weights[(label, OFFSET)], expected, places=4)
+        eq_(classifier_base.predict(x_i, weights, labels), classifier_base.predict(x_i, old_weights, labels))
+
+def test_classifier_tagger():
+    weights = most_common.get_most_common_word_weights(DEV_FILE)
+    tagger = tagger_base.make_classifier_tagger(weights)
+    eq_(tagger(['the', 'no-such-word'], None), ['DET', 'NOUN'])
+    eq_(tagger_base.make_classifier_tagger(most_common.get_noun_weights())(['fish'], None), ['NOUN'])
@@ -0,0 +1,38 @@
+import torch
+from oswegonlp.constants import UNK
+from oswegonlp import bilstm
+
+# a toy tagged corpus and small BiLSTMs over it, for the tests of training,
+# batching and inference that do not need the data files
+
+X = [['they', 'can', 'fish'], ['fish'], ['unseen', 'fish', 'can', 'they'], ['they', 'fish', 'can'],
+     ['can', 'they', 'fish']]
+Y = [['PRON', 'AUX', 'VERB'], ['NOUN'], ['NOUN', 'NOUN', 'AUX', 'PRON'], ['PRON', 'VERB', 'AUX'],
+     ['AUX', 'PRON', 'VERB']]
+WORD_TO_IX = {'they': 0, 'can': 1, 'fish': 2, UNK: 3}
+TAG_TO_IX = {'PRON': 0, 'AUX': 1, 'VERB': 2, 'NOUN': 3}
+SEED = 765
+
+def toy_corpus():
+    """
+    :returns: X, Y, word_to_ix, tag_to_ix of the toy corpus, as fresh copies
+    """
+    return [list(x) for x in X], [list(y) for y in Y], dict(WORD_TO_IX), dict(TAG_TO_IX)
+
+def toy_model(seed=SEED):
+    """
+    :param seed: torch seed set before the model is initialized; None leaves the random state alone
+    :returns: BiLSTM over the toy corpus, with 8-dimensional embeddings and hidden states
+    """
+    if seed is not None:
+        torch.manual_seed(seed)
+    return bilstm.BiLSTM(len(WORD_TO_IX), TAG_TO_IX, 8, 8)
+
+def zero_state_scores(model, word_ids):
+    """
+    :returns: the tag scores of one sentence run through the LSTM alone, from the zero initial states
+              of model.init_hidden(1, zeros=True)
+    """
+    with torch.no_grad():
+        output, _ = model.lstm(model.word_embeds(word_ids).view(len(word_ids), 1, -1), model.init_hidden(1, zeros=True))
+        return model.hidden2tag(output.view(len(word_ids), -1))